@@ -1,39 +1,277 @@
-import mysql.connector
-from mysql.connector import Error
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
+import mysql.connector
+from mysql.connector import Error, errors
+
+from utils.metrics import (
+    DB_CONNECT_DURATION, DB_POOL_CONNECTIONS, DB_POOL_WAIT,
+    DB_QUERY_DURATION, DB_QUERY_ERRORS, DB_QUERY_ROWS, registry
+)
+
+# Paramètres de connexion (surchargeables par variables d'environnement)
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "database": os.getenv("DB_NAME", "trait8"),
+    "charset": os.getenv("DB_CHARSET", "utf8mb4"),
+    "use_unicode": True
+}
+
+# Paramètres du pool de connexions
+POOL_CONFIG = {
+    "size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "checkout_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "ping_interval": float(os.getenv("DB_POOL_PING_INTERVAL", "30")),
+    "recycle": float(os.getenv("DB_POOL_RECYCLE", "3600"))
+}
+
+
+class _PoolEntry:
+    """Connexion physique et ses métadonnées dans le pool"""
+    __slots__ = ("connection", "created_at", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class PooledConnection:
+    """Connexion empruntée au pool: close() la rend au pool au lieu de la fermer"""
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._discard = False
+
+    def __getattr__(self, name):
+        if self._entry is None:
+            raise errors.InterfaceError("Connexion déjà rendue au pool")
+        return getattr(self._entry.connection, name)
+
+    def invalidate(self):
+        """Marque la connexion comme inutilisable: elle sera fermée au retour"""
+        self._discard = True
+
+    def close(self):
+        """Rend la connexion au pool"""
+        if self._entry is None:
+            return
+        entry, self._entry = self._entry, None
+        self._pool.release(entry, discard=self._discard)
+
+
+class ConnectionPool:
+    """Pool de connexions MySQL borné, avec ping, recyclage et statistiques"""
+
+    def __init__(self, factory, size=10, checkout_timeout=30.0, ping_interval=30.0, recycle=3600.0):
+        self._factory = factory
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self.recycle = recycle
+
+        self._idle = deque()
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+        # Statistiques
+        self._created = 0
+        self._recycled = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self, timeout=None):
+        """Emprunte une connexion, en attendant au plus `timeout` secondes"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        entry = None
+        waited = False
+
+        with self._condition:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._in_use < self.size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise errors.PoolError(
+                        f"Aucune connexion disponible après {timeout:.1f}s "
+                        f"(pool de {self.size} connexions)"
+                    )
+                waited = True
+                self._condition.wait(remaining)
+            # La place est réservée avant d'ouvrir la connexion hors du verrou
+            self._in_use += 1
+
+        try:
+            entry = self._prepare(entry)
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        wait = time.monotonic() - start
+        with self._condition:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        DB_POOL_WAIT.observe(wait)
+
+        return PooledConnection(self, entry)
+
+    def _prepare(self, entry):
+        """Vérifie une connexion inactive ou en ouvre une nouvelle"""
+        now = time.monotonic()
+        if entry is not None:
+            if now - entry.created_at > self.recycle:
+                # Connexion trop ancienne: on la remplace
+                self._close_quietly(entry.connection)
+                with self._condition:
+                    self._recycled += 1
+                entry = None
+            elif now - entry.last_used > self.ping_interval:
+                try:
+                    entry.connection.ping(reconnect=False)
+                except Error:
+                    self._close_quietly(entry.connection)
+                    with self._condition:
+                        self._recycled += 1
+                    entry = None
+
+        if entry is None:
+            with DB_CONNECT_DURATION.time():
+                entry = _PoolEntry(self._factory())
+            with self._condition:
+                self._created += 1
+        return entry
+
+    def release(self, entry, discard=False):
+        """Remet une connexion dans le pool"""
+        if not discard:
+            try:
+                # Ne jamais rendre une transaction ouverte au pool
+                if entry.connection.in_transaction:
+                    entry.connection.rollback()
+            except Error:
+                discard = True
+
+        if discard:
+            self._close_quietly(entry.connection)
+        else:
+            entry.last_used = time.monotonic()
+
+        with self._condition:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append(entry)
+            self._condition.notify()
+
+    def close_all(self):
+        """Ferme toutes les connexions inactives"""
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._close_quietly(entry.connection)
+
+    def stats(self):
+        """Statistiques d'utilisation du pool"""
+        with self._condition:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self._created,
+                "recycled": self._recycled,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_time_total": round(self._wait_total, 6),
+                "wait_time_avg": round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+                "wait_time_max": round(self._wait_max, 6)
+            }
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
 class Database:
+    _pool = None
+    _pool_lock = threading.Lock()
+
     @staticmethod
-    def get_connection():
-        """Crée une connexion à la base de données"""
+    def create_connection():
+        """Crée une nouvelle connexion physique à la base de données"""
         try:
-            connection = mysql.connector.connect(
-                host="localhost",
-                user="root",
-                password="",
-                database="trait8",
-                charset='utf8mb4',
-                use_unicode=True
-            )
+            connection = mysql.connector.connect(**DB_CONFIG)
             return connection
         except Error as e:
             print(f"Erreur de connexion à la base de données: {e}")
             raise
 
+    @staticmethod
+    def get_pool():
+        """Retourne le pool de connexions partagé (créé au premier appel)"""
+        if Database._pool is None:
+            with Database._pool_lock:
+                if Database._pool is None:
+                    Database._pool = ConnectionPool(Database.create_connection, **POOL_CONFIG)
+        return Database._pool
+
+    @staticmethod
+    def get_connection():
+        """Emprunte une connexion au pool (close() la rend au pool)"""
+        return Database.get_pool().acquire()
+
+    @staticmethod
+    def pool_stats():
+        """Statistiques du pool de connexions"""
+        return Database.get_pool().stats()
+
     @staticmethod
     @contextmanager
-    def get_cursor(dictionary=True):
-        """Context manager pour gérer automatiquement la connexion et le curseur"""
+    def get_transaction(dictionary=True):
+        """
+        Context manager donnant la connexion et le curseur: validé à la sortie,
+        annulé en cas d'erreur. La connexion permet des validations
+        intermédiaires (connection.commit()) dans les traitements longs.
+        """
         connection = None
         cursor = None
         try:
             connection = Database.get_connection()
             cursor = connection.cursor(dictionary=dictionary)
-            yield cursor
+            yield connection, cursor
             connection.commit()
         except Error as e:
             if connection:
-                connection.rollback()
+                if isinstance(e, (errors.OperationalError, errors.InterfaceError)):
+                    # Connexion probablement cassée: ne pas la remettre dans le pool
+                    connection.invalidate()
+                else:
+                    connection.rollback()
             print(f"Erreur base de données: {e}")
             raise
         finally:
@@ -42,20 +280,83 @@ class Database:
             if connection:
                 connection.close()
 
-def execute_query(query, params=None, fetch=False, fetchone=False):
-    """Exécute une requête SQL"""
-    with Database.get_cursor() as cursor:
-        cursor.execute(query, params or ())
-        
-        if fetchone:
-            return cursor.fetchone()
-        elif fetch:
-            return cursor.fetchall()
-        else:
-            return cursor.lastrowid
+    @staticmethod
+    @contextmanager
+    def get_cursor(dictionary=True):
+        """Context manager pour gérer automatiquement la connexion et le curseur"""
+        with Database.get_transaction(dictionary) as (connection, cursor):
+            yield cursor
+
+def execute_query(query, params=None, fetch=False, fetchone=False, name=None):
+    """
+    Exécute une requête SQL
+
+    `name` identifie la requête dans les métriques (durée, lignes); les
+    requêtes sans nom sont regroupées sous "autre".
+    """
+    name = name or "autre"
+    start = time.perf_counter()
+    try:
+        with Database.get_cursor() as cursor:
+            cursor.execute(query, params or ())
+
+            if fetchone:
+                result = cursor.fetchone()
+                rows = 1 if result else 0
+            elif fetch:
+                result = cursor.fetchall()
+                rows = len(result)
+            else:
+                result = cursor.lastrowid
+                rows = max(cursor.rowcount, 0)
+    except Exception:
+        DB_QUERY_ERRORS.inc(query=name)
+        raise
+    finally:
+        DB_QUERY_DURATION.observe(time.perf_counter() - start, query=name)
 
-def execute_many(query, data):
+    DB_QUERY_ROWS.inc(rows, query=name)
+    return result
+
+def execute_many(query, data, name=None):
     """Exécute plusieurs insertions"""
-    with Database.get_cursor() as cursor:
-        cursor.executemany(query, data)
-        return cursor.rowcount
\ No newline at end of file
+    name = name or "autre"
+    start = time.perf_counter()
+    try:
+        with Database.get_cursor() as cursor:
+            cursor.executemany(query, data)
+            rowcount = cursor.rowcount
+    except Exception:
+        DB_QUERY_ERRORS.inc(query=name)
+        raise
+    finally:
+        DB_QUERY_DURATION.observe(time.perf_counter() - start, query=name)
+
+    DB_QUERY_ROWS.inc(max(rowcount, 0), query=name)
+    return rowcount
+
+def _collect_pool_metrics():
+    """Met à jour les jauges du pool avant chaque lecture des métriques"""
+    stats = Database.pool_stats()
+    DB_POOL_CONNECTIONS.set(stats["in_use"], state="in_use")
+    DB_POOL_CONNECTIONS.set(stats["idle"], state="idle")
+    DB_POOL_CONNECTIONS.set(stats["size"], state="max")
+
+registry.add_collector(_collect_pool_metrics)
+
+# Exécuteur dédié aux accès BD depuis les routes async: autant de threads que de
+# connexions dans le pool, la boucle asyncio n'est jamais bloquée par MySQL
+_db_executor = ThreadPoolExecutor(max_workers=POOL_CONFIG["size"], thread_name_prefix="db")
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """Exécute une fonction bloquante d'accès à la BD hors de la boucle asyncio"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+async def execute_query_async(query, params=None, fetch=False, fetchone=False, name=None):
+    """Version async de execute_query"""
+    return await run_in_db_executor(execute_query, query, params, fetch=fetch, fetchone=fetchone, name=name)
+
+async def execute_many_async(query, data, name=None):
+    """Version async de execute_many"""
+    return await run_in_db_executor(execute_many, query, data, name=name)
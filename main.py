@@ -1,6 +1,12 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from routes import auth, upload, statistics, materiels
+from services.import_delete_service import ImportDeleteService
+from services.import_job_service import ImportJobService
+from utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS, render_metrics, start_metrics_flush
 
 # Créer l'application FastAPI
 app = FastAPI(
@@ -20,12 +26,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Mesure la latence de chaque requête, étiquetée par modèle de route"""
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        # Modèle de route (/materiels/{id_snapshot}) et non le chemin réel,
+        # pour garder un nombre borné de séries
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route is not None else "non_route",
+            status=status_code
+        )
+
 # Inclure les routes
 app.include_router(auth.router)
 app.include_router(upload.router)
 app.include_router(statistics.router)
 app.include_router(materiels.router)
 
+@app.on_event("startup")
+def start_metrics():
+    """Mode multiprocessus des métriques (METRICS_MULTIPROC_DIR): écriture périodique"""
+    try:
+        start_metrics_flush()
+    except Exception as e:
+        print(f"Impossible d'activer les métriques multiprocessus: {e}")
+
+@app.on_event("startup")
+def resume_import_jobs():
+    """Relance les imports restés en file avant l'arrêt du serveur"""
+    try:
+        relances = ImportJobService.resume_pending()
+        if relances:
+            print(f"{relances} import(s) relancé(s)")
+    except Exception as e:
+        print(f"Impossible de relancer les imports en attente: {e}")
+    # Imports d'un worker arrêté pendant que le serveur tourne
+    ImportJobService.start_reaper()
+    try:
+        suppressions = ImportDeleteService.resume_pending()
+        if suppressions:
+            print(f"{suppressions} suppression(s) d'importation reprise(s)")
+    except Exception as e:
+        print(f"Impossible de reprendre les suppressions d'importation: {e}")
+
+@app.on_event("shutdown")
+def stop_import_workers():
+    """Arrête les workers d'import"""
+    ImportJobService.shutdown()
+
 @app.get("/", tags=["Root"])
 async def root():
     """Point d'entrée de l'API"""
@@ -44,19 +103,24 @@ async def root():
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Vérifier l'état de l'API"""
-    from config.database import Database
+    from config.database import Database, execute_query_async
     try:
-        connection = Database.get_connection()
-        connection.close()
+        await execute_query_async("SELECT 1", fetchone=True)
         db_status = "OK"
     except Exception as e:
         db_status = f"ERROR: {str(e)}"
     
     return {
         "status": "running",
-        "database": db_status
+        "database": db_status,
+        "pool": Database.pool_stats()
     }
 
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Métriques au format texte Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,117 @@
+"""
+Commandes d'administration de la base de données
+
+Usage:
+    python manage.py backfill-stats [--force]
+    python manage.py dedup-references
+    python manage.py partition
+    python manage.py backfill-flat [--force]
+    python manage.py rebuild-lifecycle
+    python manage.py compact-snapshots
+"""
+
+import argparse
+
+
+def backfill_stats(args):
+    """Calcule les statistiques précalculées des importations existantes"""
+    from services.aggregate_service import AggregateService
+
+    imports = AggregateService.backfill(force=args.force)
+    if imports:
+        print(f"Statistiques calculées pour {len(imports)} importation(s): {imports}")
+    else:
+        print("Toutes les importations ont déjà leurs statistiques")
+
+
+def dedup_references(args):
+    """Fusionne les doublons des référentiels puis crée leurs clés uniques"""
+    from services.dedup_service import DedupService
+
+    result = DedupService.merge_duplicates()
+    print(f"Codes de localisation corrigés: {result['codes_corriges']}")
+    print(f"Localisations fusionnées: {result['localisations_fusionnees']}")
+    print(f"Matériels physiques fusionnés: {result['materiels_fusionnes']}")
+
+    created = DedupService.ensure_unique_keys()
+    if created:
+        print(f"Clés uniques créées: {', '.join(created)}")
+
+    if result['codes_corriges'] or result['localisations_fusionnees']:
+        print("Recalculer les statistiques: python manage.py backfill-stats --force")
+
+
+def backfill_flat(args):
+    """Remplit le modèle de lecture snapshot_flat pour les importations existantes"""
+    from services.snapshot_flat_service import SnapshotFlatService
+
+    imports = SnapshotFlatService.backfill(force=args.force)
+    if imports:
+        print(f"Snapshots à plat écrits pour {len(imports)} importation(s): {imports}")
+    else:
+        print("Toutes les importations sont déjà dans snapshot_flat")
+
+
+def partition(args):
+    """Partitionne materiel_informatique, incident et snapshot_flat par importation"""
+    from services.partition_service import PartitionService
+
+    tables = PartitionService.partition_tables()
+    if tables:
+        print(f"Tables partitionnées par importation: {', '.join(tables)}")
+    else:
+        print("Les tables sont déjà partitionnées")
+
+
+def rebuild_lifecycle(args):
+    """Reconstruit le cycle de vie des matériels à partir de toutes les importations"""
+    from config.database import Database
+    from services.lifecycle_service import LifecycleService
+
+    with Database.get_cursor() as cursor:
+        LifecycleService.invalidate(cursor)
+    imports = LifecycleService.catch_up()
+    print(f"Cycle de vie reconstruit sur {len(imports)} importation(s)")
+
+
+def compact_snapshots(args):
+    """Passe en delta les importations existantes stockées complètes"""
+    from services.snapshot_delta_service import SnapshotDeltaService
+
+    imports = SnapshotDeltaService.compact_all()
+    if imports:
+        print(f"Importations passées en delta: {', '.join(str(i) for i in imports)}")
+    else:
+        print("Aucune importation à compacter")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Administration de l'API Gestion Matériels")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("backfill-stats", help="Calculer les statistiques des importations existantes")
+    cmd.add_argument("--force", action="store_true", help="Recalculer aussi les importations déjà traitées")
+    cmd.set_defaults(func=backfill_stats)
+
+    cmd = commands.add_parser("dedup-references", help="Fusionner les localisations et matériels en double")
+    cmd.set_defaults(func=dedup_references)
+
+    cmd = commands.add_parser("partition", help="Partitionner les snapshots et incidents par importation")
+    cmd.set_defaults(func=partition)
+
+    cmd = commands.add_parser("backfill-flat", help="Remplir snapshot_flat pour les importations existantes")
+    cmd.add_argument("--force", action="store_true", help="Réécrire aussi les importations déjà présentes")
+    cmd.set_defaults(func=backfill_flat)
+
+    cmd = commands.add_parser("rebuild-lifecycle", help="Reconstruire le cycle de vie des matériels")
+    cmd.set_defaults(func=rebuild_lifecycle)
+
+    cmd = commands.add_parser("compact-snapshots", help="Stocker en delta les importations existantes")
+    cmd.set_defaults(func=compact_snapshots)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
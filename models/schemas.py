@@ -83,6 +83,16 @@ class StatistiquesResponse(BaseModel):
     etat_6_dernieres_importations: List[ImportationEtat]
     resume_global: ResumeGlobal
 
+class StatistiquesPartielles(BaseModel):
+    """Sections demandées de StatistiquesResponse (les autres sont omises)"""
+    nouveau_materiel: Optional[int] = None
+    materiel_perdu: Optional[int] = None
+    top_5_districts_pannes: Optional[List[DistrictPanneStats]] = None
+    pannes_par_type_materiel: Optional[List[TypeMaterielPanne]] = None
+    materiels_par_region: Optional[List[RegionStats]] = None
+    etat_6_dernieres_importations: Optional[List[ImportationEtat]] = None
+    resume_global: Optional[ResumeGlobal] = None
+
 # Schémas pour upload
 class UploadResponse(BaseModel):
     message: str
@@ -91,6 +101,33 @@ class UploadResponse(BaseModel):
     date_import: date
     id_date_import: int
 
+class ImportJobCreated(BaseModel):
+    message: str
+    filename: str
+    id_job: Optional[str] = None
+    statut: str
+    id_date_import: Optional[int] = None
+    file_hash: Optional[str] = None
+
+class ImportJobStatus(BaseModel):
+    id_job: str
+    filename: str
+    statut: str
+    lignes_total: Optional[int]
+    lignes_traitees: int
+    lignes_par_seconde: float
+    id_date_import: Optional[int]
+    taux_cache_dimensions: Optional[float] = None
+    erreur: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+class ImportDeletion(BaseModel):
+    message: str
+    id_date_import: int
+    statut: str
+
 class UploadHistoryItem(BaseModel):
     id_upload: int
     filename: str
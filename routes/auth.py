@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from models.schemas import UserCreate, UserLogin, UserResponse, ChangePassword, ChangeMail
 from services.auth_service import AuthService
 from utils.security import verify_token
+from config.database import execute_query_async, run_in_db_executor
 
 from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
@@ -28,13 +29,13 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(user: UserCreate):
     """Enregistrer un nouvel utilisateur"""
-    result = AuthService.register_user(user.mail, user.mot_de_passe)
+    result = await run_in_db_executor(AuthService.register_user, user.mail, user.mot_de_passe)
     return result
 
 @router.post("/login")
 async def login(credentials: UserLogin):
     """Se connecter et obtenir un token"""
-    result = AuthService.login_user(credentials.mail, credentials.mot_de_passe)
+    result = await run_in_db_executor(AuthService.login_user, credentials.mail, credentials.mot_de_passe)
     return result
 
 @router.post("/change-password")
@@ -43,7 +44,8 @@ async def change_password(
     current_user: dict = Depends(get_current_user)
 ):
     """Changer le mot de passe"""
-    result = AuthService.change_password(
+    result = await run_in_db_executor(
+        AuthService.change_password,
         current_user['user_id'],
         password_data.ancien_mot_de_passe,
         password_data.nouveau_mot_de_passe
@@ -56,7 +58,8 @@ async def change_mail(
     current_user: dict = Depends(get_current_user)
 ):
     """Changer l'email"""
-    result = AuthService.change_mail(
+    result = await run_in_db_executor(
+        AuthService.change_mail,
         current_user['user_id'],
         mail_data.nouveau_mail,
         mail_data.mot_de_passe
@@ -66,10 +69,8 @@ async def change_mail(
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """Récupérer les informations de l'utilisateur courant"""
-    from config.database import execute_query
-    
     query = "SELECT id, mail, created_at FROM users WHERE id = %s"
-    user = execute_query(query, (current_user['user_id'],), fetchone=True)
+    user = await execute_query_async(query, (current_user['user_id'],), fetchone=True)
     
     if not user:
         raise HTTPException(
@@ -1,301 +1,338 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, status
 from routes.auth import get_current_user
-from config.database import execute_query
+from config.database import execute_query_async, run_in_db_executor
+from services.materiel_service import MaterielService, MATERIEL_COLUMNS, MATERIEL_SOURCE, MATERIEL_VISIBLE
+from services.diff_service import DiffService
+from services.lifecycle_service import LifecycleService
+from services.snapshot_delta_service import SnapshotDeltaService
+from utils.cache import cached_response, CACHE_CONTROL_LATEST
+from utils.helpers import decode_cursor
 from typing import Optional
 
 router = APIRouter(prefix="/materiels", tags=["Matériels"])
 
+def _decode_after_id(cursor: Optional[str]) -> Optional[int]:
+    """Extrait le dernier id_snapshot vu d'un curseur de pagination"""
+    if cursor is None:
+        return None
+    try:
+        return int(decode_cursor(cursor)['id'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur de pagination invalide"
+        )
+
 @router.get("/all")
 async def get_all_materiels(
+    request: Request,
     id_date_import: int = Query(..., description="ID de la date d'importation"),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Récupérer tous les matériels pour une date d'importation donnée"""
     
-    # Compter le total
-    query_count = """
-        SELECT COUNT(*) as total
-        FROM materiel_informatique mi
-        WHERE mi.id_date_import = %s
-    """
-    count_result = execute_query(query_count, (id_date_import,), fetchone=True)
-    total = count_result['total'] if count_result else 0
-    
-    # Récupérer les matériels avec pagination
-    query = """
-        SELECT 
-            mi.id_snapshot,
-            mi.id_physique,
-            mi.etat,
-            mp.nom_materiel,
-            mp.type,
-            l.code,
-            l.region,
-            l.district,
-            l.commune,
-            di.date_complet as date_import
-        FROM materiel_informatique mi
-        JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-        JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-        JOIN date_import di ON mi.id_date_import = di.id_date
-        WHERE mi.id_date_import = %s
-        ORDER BY mi.id_snapshot DESC
-        LIMIT %s OFFSET %s
-    """
+    after_id = _decode_after_id(cursor)
     
-    results = execute_query(query, (id_date_import, limit, skip), fetch=True)
+    async def compute():
+        # Importation stockée en delta: snapshot complet lu le long de sa chaîne
+        # tant que sa reconstruction (en arrière-plan) n'est pas prête
+        source = await run_in_db_executor(SnapshotDeltaService.flat_source, id_date_import)
+        
+        total, results = await run_in_db_executor(
+            MaterielService.list_snapshots,
+            "sf.id_date_import = %s",
+            (id_date_import,),
+            skip,
+            limit,
+            after_id=after_id,
+            cache_key=("all", id_date_import),
+            source=source
+        )
+        
+        return {
+            "total": total,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": MaterielService.next_cursor(results, limit),
+            "data": results
+        }
     
-    return {
-        "total": total,
-        "skip": skip,
-        "limit": limit,
-        "data": results
-    }
+    return await cached_response(request, ("materiels/all", id_date_import, skip, limit, cursor), compute)
 
 @router.get("/by-commune")
 async def get_materiels_by_commune(
+    request: Request,
     id_date_import: int = Query(..., description="ID de la date d'importation"),
     commune: str = Query(..., description="Nom de la commune"),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Récupérer les matériels d'une commune pour une date d'importation donnée"""
     
-    # Compter le total
-    query_count = """
-        SELECT COUNT(*) as total
-        FROM materiel_informatique mi
-        JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-        JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-        WHERE mi.id_date_import = %s AND l.commune = %s
-    """
-    count_result = execute_query(query_count, (id_date_import, commune), fetchone=True)
-    total = count_result['total'] if count_result else 0
-    
-    # Récupérer les matériels
-    query = """
-        SELECT 
-            mi.id_snapshot,
-            mi.id_physique,
-            mi.etat,
-            mp.nom_materiel,
-            mp.type,
-            l.code,
-            l.region,
-            l.district,
-            l.commune,
-            di.date_complet as date_import
-        FROM materiel_informatique mi
-        JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-        JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-        JOIN date_import di ON mi.id_date_import = di.id_date
-        WHERE mi.id_date_import = %s AND l.commune = %s
-        ORDER BY mi.id_snapshot DESC
-        LIMIT %s OFFSET %s
-    """
+    after_id = _decode_after_id(cursor)
     
-    results = execute_query(query, (id_date_import, commune, limit, skip), fetch=True)
+    async def compute():
+        source = await run_in_db_executor(SnapshotDeltaService.flat_source, id_date_import)
+        
+        total, results = await run_in_db_executor(
+            MaterielService.list_snapshots,
+            "sf.id_date_import = %s AND sf.commune = %s",
+            (id_date_import, commune),
+            skip,
+            limit,
+            after_id=after_id,
+            cache_key=("by-commune", id_date_import, commune),
+            source=source
+        )
+        
+        return {
+            "total": total,
+            "commune": commune,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": MaterielService.next_cursor(results, limit),
+            "data": results
+        }
     
-    return {
-        "total": total,
-        "commune": commune,
-        "skip": skip,
-        "limit": limit,
-        "data": results
-    }
+    return await cached_response(request, ("materiels/by-commune", id_date_import, commune, skip, limit, cursor), compute)
+
+def _diff_page(categorie: str, date_ancienne: int, date_nouvelle: int, skip: int, limit: int, after_id: Optional[int]):
+    """Page d'une catégorie de différences (ajoutes, perdus, modifies) entre deux importations"""
+    diff = DiffService.diff(date_ancienne, date_nouvelle)
+    ids = diff[categorie]
+    # Les perdus sont des snapshots de l'ancienne importation, les autres de la nouvelle
+    id_date_import = date_ancienne if categorie == "perdus" else date_nouvelle
+    results = MaterielService.page_of_ids(
+        ids, skip, limit, after_id,
+        id_date_import=id_date_import,
+        source=SnapshotDeltaService.flat_source(id_date_import)
+    )
+    if categorie == "modifies":
+        for r in results:
+            r['etat_precedent'] = diff['etats_precedents'].get(r['id_snapshot'])
+    return len(ids), results
+
+def _check_dates_order(date_ancienne: int, date_nouvelle: int):
+    """Vérifie que date_nouvelle > date_ancienne"""
+    if date_nouvelle <= date_ancienne:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La date nouvelle doit être postérieure à la date ancienne"
+        )
 
 @router.get("/nouveaux")
 async def get_nouveaux_materiels(
+    request: Request,
     date_ancienne: int = Query(..., description="ID de la date d'importation ancienne"),
     date_nouvelle: int = Query(..., description="ID de la date d'importation nouvelle"),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Récupérer les nouveaux matériels entre deux dates"""
+    _check_dates_order(date_ancienne, date_nouvelle)
+    after_id = _decode_after_id(cursor)
     
-    # Vérifier que date_nouvelle > date_ancienne
-    if date_nouvelle <= date_ancienne:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La date nouvelle doit être postérieure à la date ancienne"
+    async def compute():
+        # Matériels présents dans la nouvelle date mais pas dans l'ancienne
+        total, results = await run_in_db_executor(
+            _diff_page, "ajoutes", date_ancienne, date_nouvelle, skip, limit, after_id
         )
+        
+        return {
+            "total": total,
+            "date_ancienne": date_ancienne,
+            "date_nouvelle": date_nouvelle,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": MaterielService.next_cursor(results, limit),
+            "data": results
+        }
     
-    # Récupérer les matériels qui sont dans la nouvelle date mais pas dans l'ancienne
-    query_count = """
-        SELECT COUNT(DISTINCT mi_new.id_physique) as total
-        FROM materiel_informatique mi_new
-        WHERE mi_new.id_date_import = %s
-        AND mi_new.id_physique NOT IN (
-            SELECT DISTINCT id_physique
-            FROM materiel_informatique
-            WHERE id_date_import = %s
-        )
-    """
-    count_result = execute_query(query_count, (date_nouvelle, date_ancienne), fetchone=True)
-    total = count_result['total'] if count_result else 0
+    return await cached_response(request, ("materiels/nouveaux", date_ancienne, date_nouvelle, skip, limit, cursor), compute)
+
+@router.get("/perdus")
+async def get_materiels_perdus(
+    request: Request,
+    date_ancienne: int = Query(..., description="ID de la date d'importation ancienne"),
+    date_nouvelle: int = Query(..., description="ID de la date d'importation nouvelle"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Récupérer les matériels disparus entre deux dates (snapshots de la date ancienne)"""
+    _check_dates_order(date_ancienne, date_nouvelle)
+    after_id = _decode_after_id(cursor)
     
-    query = """
-        SELECT 
-            mi.id_snapshot,
-            mi.id_physique,
-            mi.etat,
-            mp.nom_materiel,
-            mp.type,
-            l.code,
-            l.region,
-            l.district,
-            l.commune,
-            di.date_complet as date_import
-        FROM materiel_informatique mi
-        JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-        JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-        JOIN date_import di ON mi.id_date_import = di.id_date
-        WHERE mi.id_date_import = %s
-        AND mi.id_physique NOT IN (
-            SELECT DISTINCT id_physique
-            FROM materiel_informatique
-            WHERE id_date_import = %s
+    async def compute():
+        # Matériels présents dans l'ancienne date mais plus dans la nouvelle
+        total, results = await run_in_db_executor(
+            _diff_page, "perdus", date_ancienne, date_nouvelle, skip, limit, after_id
         )
-        ORDER BY mi.id_snapshot DESC
-        LIMIT %s OFFSET %s
-    """
+        
+        return {
+            "total": total,
+            "date_ancienne": date_ancienne,
+            "date_nouvelle": date_nouvelle,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": MaterielService.next_cursor(results, limit),
+            "data": results
+        }
     
-    results = execute_query(query, (date_nouvelle, date_ancienne, limit, skip), fetch=True)
+    return await cached_response(request, ("materiels/perdus", date_ancienne, date_nouvelle, skip, limit, cursor), compute)
+
+@router.get("/changements-etat")
+async def get_changements_etat(
+    request: Request,
+    date_ancienne: int = Query(..., description="ID de la date d'importation ancienne"),
+    date_nouvelle: int = Query(..., description="ID de la date d'importation nouvelle"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Récupérer les matériels dont l'état a changé entre deux dates (avec l'état précédent)"""
+    _check_dates_order(date_ancienne, date_nouvelle)
+    after_id = _decode_after_id(cursor)
     
-    return {
-        "total": total,
-        "date_ancienne": date_ancienne,
-        "date_nouvelle": date_nouvelle,
-        "skip": skip,
-        "limit": limit,
-        "data": results
-    }
+    async def compute():
+        total, results = await run_in_db_executor(
+            _diff_page, "modifies", date_ancienne, date_nouvelle, skip, limit, after_id
+        )
+        
+        return {
+            "total": total,
+            "date_ancienne": date_ancienne,
+            "date_nouvelle": date_nouvelle,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": MaterielService.next_cursor(results, limit),
+            "data": results
+        }
+    
+    return await cached_response(request, ("materiels/changements-etat", date_ancienne, date_nouvelle, skip, limit, cursor), compute)
 
 @router.get("/{id_snapshot}")
 async def get_materiel_detail(
+    request: Request,
     id_snapshot: int,
     current_user: dict = Depends(get_current_user)
 ):
     """Récupérer les détails d'un matériel spécifique"""
     
-    query = """
-        SELECT 
-            mi.id_snapshot,
-            mi.id_physique,
-            mi.etat,
-            mp.nom_materiel,
-            mp.type,
-            l.code,
-            l.region,
-            l.district,
-            l.commune,
-            di.date_complet as date_import,
-            i.motif,
-            i.achat_consommable,
-            i.compatibilite_consommable
-        FROM materiel_informatique mi
-        JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-        JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-        JOIN date_import di ON mi.id_date_import = di.id_date
-        LEFT JOIN incident i ON mi.id_snapshot = i.id_materiel
-        WHERE mi.id_snapshot = %s
-    """
+    async def compute():
+        query = f"""
+            SELECT 
+                {MATERIEL_COLUMNS},
+                sf.motif,
+                sf.achat_consommable,
+                sf.compatibilite_consommable
+            {MATERIEL_SOURCE}
+            WHERE sf.id_snapshot = %s AND {MATERIEL_VISIBLE}
+        """
+        
+        result = await execute_query_async(query, (id_snapshot,), fetchone=True, name="materiel_detail")
+        
+        if not result:
+            # Importation stockée en delta et pas encore reconstruite
+            result = await run_in_db_executor(SnapshotDeltaService.snapshot_detail, id_snapshot)
+        
+        if not result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Matériel non trouvé"
+            )
+        
+        return result
     
-    result = execute_query(query, (id_snapshot,), fetchone=True)
+    return await cached_response(request, ("materiels/detail", id_snapshot), compute)
+
+@router.get("/{id_physique}/history")
+async def get_materiel_history(
+    request: Request,
+    id_physique: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Cycle de vie d'un matériel physique: première et dernière apparition, état
+    courant, dernier changement d'état, série de pannes en cours et périodes
+    d'état successives
+    """
     
-    if not result:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Matériel non trouvé"
-        )
+    async def compute():
+        result = await run_in_db_executor(LifecycleService.history, id_physique)
+        
+        if not result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Matériel non trouvé"
+            )
+        
+        return result
     
-    return result
+    # L'historique suit les nouvelles importations
+    return await cached_response(request, ("materiels/history", id_physique), compute, cache_control=CACHE_CONTROL_LATEST)
 
 @router.get("/search/by-code")
 async def search_by_code(
+    request: Request,
     code: str = Query(..., description="Code de localisation"),
     id_date_import: Optional[int] = Query(None, description="ID de la date d'importation (optionnel)"),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Rechercher des matériels par code de localisation"""
     
-    if id_date_import:
-        # Recherche pour une date spécifique
-        query_count = """
-            SELECT COUNT(*) as total
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-            WHERE l.code = %s AND mi.id_date_import = %s
-        """
-        count_result = execute_query(query_count, (code, id_date_import), fetchone=True)
+    after_id = _decode_after_id(cursor)
+    
+    async def compute():
+        if id_date_import:
+            # Recherche pour une date spécifique
+            source = await run_in_db_executor(SnapshotDeltaService.flat_source, id_date_import)
+            where = "sf.id_date_import = %s AND sf.code = %s"
+            params = (id_date_import, code)
+            source_params = ()
+        else:
+            # Recherche sur toutes les dates (importations en delta calculées le
+            # long de leur chaîne)
+            if await run_in_db_executor(SnapshotDeltaService.has_delta):
+                source = SnapshotDeltaService.all_imports_source("l.code = %s")
+                source_params = (code,)
+            else:
+                source = MATERIEL_SOURCE
+                source_params = ()
+            where = "sf.code = %s"
+            params = (code,)
         
-        query = """
-            SELECT 
-                mi.id_snapshot,
-                mi.id_physique,
-                mi.etat,
-                mp.nom_materiel,
-                mp.type,
-                l.code,
-                l.region,
-                l.district,
-                l.commune,
-                di.date_complet as date_import
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-            JOIN date_import di ON mi.id_date_import = di.id_date
-            WHERE l.code = %s AND mi.id_date_import = %s
-            ORDER BY mi.id_snapshot DESC
-            LIMIT %s OFFSET %s
-        """
-        results = execute_query(query, (code, id_date_import, limit, skip), fetch=True)
-    else:
-        # Recherche sur toutes les dates
-        query_count = """
-            SELECT COUNT(*) as total
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-            WHERE l.code = %s
-        """
-        count_result = execute_query(query_count, (code,), fetchone=True)
+        total, results = await run_in_db_executor(
+            MaterielService.list_snapshots,
+            where,
+            params,
+            skip,
+            limit,
+            after_id=after_id,
+            cache_key=("by-code", code, id_date_import),
+            source=source,
+            source_params=source_params
+        )
         
-        query = """
-            SELECT 
-                mi.id_snapshot,
-                mi.id_physique,
-                mi.etat,
-                mp.nom_materiel,
-                mp.type,
-                l.code,
-                l.region,
-                l.district,
-                l.commune,
-                di.date_complet as date_import
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-            JOIN date_import di ON mi.id_date_import = di.id_date
-            WHERE l.code = %s
-            ORDER BY mi.id_snapshot DESC
-            LIMIT %s OFFSET %s
-        """
-        results = execute_query(query, (code, limit, skip), fetch=True)
-    
-    total = count_result['total'] if count_result else 0
+        return {
+            "total": total,
+            "code": code,
+            "skip": skip,
+            "limit": limit,
+            "next_cursor": MaterielService.next_cursor(results, limit),
+            "data": results
+        }
     
-    return {
-        "total": total,
-        "code": code,
-        "skip": skip,
-        "limit": limit,
-        "data": results
-    }
\ No newline at end of file
+    return await cached_response(request, ("materiels/search/by-code", code, id_date_import, skip, limit, cursor), compute)
@@ -1,17 +1,45 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, status
 from routes.auth import get_current_user
-from services.statistics_service import StatisticsService
-from models.schemas import StatistiquesResponse
+from services.statistics_service import StatisticsService, DASHBOARD_SECTIONS
+from services.cube_service import CubeService, TREND_POINTS
+from services.aggregate_service import AggregateService
+from services.lifecycle_service import LifecycleService
+from models.schemas import StatistiquesPartielles
+from typing import Optional
+from config.database import execute_query_async, run_in_db_executor
+from utils.cache import cached_response, CACHE_CONTROL_IMPORT, CACHE_CONTROL_LATEST
 
 router = APIRouter(prefix="/statistics", tags=["Statistiques"])
 
-@router.get("/", response_model=StatistiquesResponse)
+async def _run_statistics(*args, **kwargs):
+    """Calcule les statistiques hors de la boucle asyncio (504 au-delà du délai)"""
+    try:
+        return await run_in_db_executor(StatisticsService.get_statistics, *args, **kwargs)
+    except TimeoutError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+
+def _parse_sections(sections: Optional[str], defaut: Optional[str] = None):
+    """Sections demandées (400 si l'une est inconnue)"""
+    try:
+        return StatisticsService.parse_sections(sections if sections is not None else defaut)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/", response_model=StatistiquesPartielles, response_model_exclude_unset=True)
 async def get_statistics(
+    request: Request,
     id_date_import: int = Query(..., description="ID de la date d'importation"),
     skip_type: int = Query(0, ge=0, description="Skip pour pannes par type"),
     limit_type: int = Query(100, ge=1, le=100, description="Limit pour pannes par type"),
     skip_region: int = Query(0, ge=0, description="Skip pour matériels par région"),
     limit_region: int = Query(100, ge=1, le=100, description="Limit pour matériels par région"),
+    sections: Optional[str] = Query(None, description="Sections à calculer, séparées par des virgules (toutes par défaut)"),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -24,57 +52,231 @@ async def get_statistics(
     - Les matériels par région (avec pagination)
     - L'état des 6 dernières importations
     - Le résumé global
+    
+    `sections` limite le calcul et la réponse aux sections demandées
+    (ex: sections=resume_global,materiels_par_region).
     """
     
-    # Vérifier que la date d'importation existe
-    from config.database import execute_query
-    query_check = "SELECT id_date FROM date_import WHERE id_date = %s"
-    date_exists = execute_query(query_check, (id_date_import,), fetchone=True)
+    sections_demandees = _parse_sections(sections)
     
-    if not date_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Date d'importation non trouvée"
+    async def compute():
+        # Vérifier que la date d'importation existe
+        query_check = "SELECT id_date FROM date_import WHERE id_date = %s AND statut = 'termine'"
+        date_exists = await execute_query_async(query_check, (id_date_import,), fetchone=True, name="date_import_existe")
+        
+        if not date_exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Date d'importation non trouvée"
+            )
+        
+        result = await _run_statistics(
+            id_date_import,
+            skip_type,
+            limit_type,
+            skip_region,
+            limit_region,
+            sections=sections_demandees
         )
+        
+        # Seules les sections calculées figurent dans la réponse
+        return StatistiquesPartielles(**result).model_dump(exclude_unset=True)
     
-    result = StatisticsService.get_statistics(
-        id_date_import,
-        skip_type,
-        limit_type,
-        skip_region,
-        limit_region
-    )
-    
-    return result
+    key = ("statistics", id_date_import, skip_type, limit_type, skip_region, limit_region, sections_demandees)
+    return await cached_response(request, key, compute)
 
 @router.get("/dashboard")
 async def get_dashboard_stats(
+    request: Request,
+    sections: Optional[str] = Query(None, description="Sections à calculer (par défaut: toutes sauf nouveau_materiel et materiel_perdu)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Récupérer les statistiques du tableau de bord (dernière importation).
+    Par défaut, les différences avec l'importation précédente (les plus coûteuses)
+    ne sont pas calculées; `sections` permet de les demander.
+    """
+    
+    sections_demandees = _parse_sections(sections, ",".join(DASHBOARD_SECTIONS))
+    
+    async def compute():
+        # Récupérer la dernière date d'importation
+        query = "SELECT id_date FROM date_import WHERE statut = 'termine' ORDER BY id_date DESC LIMIT 1"
+        last_import = await execute_query_async(query, fetchone=True)
+        
+        if not last_import:
+            return {
+                "message": "Aucune importation trouvée",
+                "statistics": None
+            }
+        
+        result = await _run_statistics(
+            last_import['id_date'],
+            skip_type=0,
+            limit_type=20,
+            skip_region=0,
+            limit_region=20,
+            sections=sections_demandees
+        )
+        
+        return {
+            "id_date_import": last_import['id_date'],
+            "statistics": result
+        }
+    
+    return await cached_response(request, ("dashboard", sections_demandees), compute, cache_control=CACHE_CONTROL_LATEST)
+
+@router.get("/cube")
+async def get_cube(
+    request: Request,
+    id_date_import: int = Query(..., description="ID de la date d'importation"),
+    group_by: str = Query("region", description="Dimensions de regroupement séparées par des virgules (code, region, district, commune, type, etat); vide: total global"),
+    code: Optional[str] = Query(None, description="Filtre sur le code de localisation"),
+    region: Optional[str] = Query(None, description="Filtre sur la région"),
+    district: Optional[str] = Query(None, description="Filtre sur le district"),
+    commune: Optional[str] = Query(None, description="Filtre sur la commune"),
+    type: Optional[str] = Query(None, description="Filtre sur le type de matériel"),
+    etat: Optional[str] = Query(None, description="Filtre sur l'état"),
+    tri: str = Query("total_materiels", description="Mesure de tri décroissant (total_materiels, materiels_fonctionnels, materiels_en_panne)"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Effectifs et taux de fonctionnement d'une importation, regroupés sur les
+    dimensions demandées et filtrés par tranche (ex: pannes par type dans une
+    région: group_by=type&region=ANALAMANGA). Calculé sur le cube précalculé.
+    """
+    
+    try:
+        dimensions = CubeService.check_dimensions([d.strip() for d in group_by.split(",") if d.strip()])
+        CubeService.check_tri(tri)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    filtres = {"code": code, "region": region, "district": district,
+               "commune": commune, "type": type, "etat": etat}
+    
+    async def compute():
+        query_check = "SELECT id_date FROM date_import WHERE id_date = %s AND statut = 'termine'"
+        date_exists = await execute_query_async(query_check, (id_date_import,), fetchone=True, name="date_import_existe")
+        
+        if not date_exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Date d'importation non trouvée"
+            )
+        
+        # Synthèses des importations antérieures au cube
+        await run_in_db_executor(AggregateService.ensure_up_to, id_date_import)
+        
+        results = await run_in_db_executor(
+            CubeService.rollup,
+            id_date_import,
+            dimensions,
+            filtres,
+            tri=tri,
+            skip=skip,
+            limit=limit
+        )
+        
+        return {
+            "id_date_import": id_date_import,
+            "group_by": dimensions,
+            "filtres": {d: v for d, v in filtres.items() if v is not None},
+            "skip": skip,
+            "limit": limit,
+            "data": results
+        }
+    
+    key = ("statistics/cube", id_date_import, tuple(dimensions), tuple(filtres.items()), tri, skip, limit)
+    return await cached_response(request, key, compute)
+
+@router.get("/trend")
+async def get_trend(
+    request: Request,
+    id_debut: Optional[int] = Query(None, description="Première importation de la plage (incluse); par défaut la plus ancienne"),
+    id_fin: Optional[int] = Query(None, description="Dernière importation de la plage (incluse); par défaut la plus récente"),
+    points: int = Query(TREND_POINTS, ge=1, le=500, description="Nombre maximal de points de la série"),
+    code: Optional[str] = Query(None, description="Filtre sur le code de localisation"),
+    region: Optional[str] = Query(None, description="Filtre sur la région"),
+    district: Optional[str] = Query(None, description="Filtre sur le district"),
+    commune: Optional[str] = Query(None, description="Filtre sur la commune"),
+    type: Optional[str] = Query(None, description="Filtre sur le type de matériel"),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Récupérer les statistiques du tableau de bord (dernière importation)
+    Évolution des matériels fonctionnels et non fonctionnels sur une plage
+    d'importations, filtrée par tranche (région, district, type...). Au-delà de
+    `points` importations, chaque point représente un groupe d'importations
+    consécutives par sa dernière importation. Lu dans les synthèses par importation.
     """
-    from config.database import execute_query
     
-    # Récupérer la dernière date d'importation
-    query = "SELECT id_date FROM date_import ORDER BY id_date DESC LIMIT 1"
-    last_import = execute_query(query, fetchone=True)
+    if id_debut is not None and id_fin is not None and id_debut > id_fin:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="id_debut doit être inférieur ou égal à id_fin"
+        )
+    filtres = {"code": code, "region": region, "district": district,
+               "commune": commune, "type": type}
+    
+    async def compute():
+        # Synthèses des importations antérieures au cube
+        await run_in_db_executor(AggregateService.ensure_up_to, id_fin)
+        
+        results = await run_in_db_executor(
+            CubeService.trend,
+            filtres,
+            id_debut=id_debut,
+            id_fin=id_fin,
+            points=points
+        )
+        
+        return {
+            "id_debut": id_debut,
+            "id_fin": id_fin,
+            "points": points,
+            "filtres": {d: v for d, v in filtres.items() if v is not None},
+            "data": results
+        }
+    
+    key = ("statistics/trend", id_debut, id_fin, points, tuple(filtres.items()))
+    # Sans borne de fin, la série suit les nouvelles importations
+    cache_control = CACHE_CONTROL_LATEST if id_fin is None else CACHE_CONTROL_IMPORT
+    return await cached_response(request, key, compute, cache_control=cache_control)
+
+@router.get("/reliability")
+async def get_reliability(
+    request: Request,
+    group_by: str = Query("type", description="Regroupement: type, region ou district"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    MTTR (durée moyenne d'une panne jusqu'à la réparation) et MTBF (durée
+    moyenne de fonctionnement entre deux pannes), en jours, par type, région ou
+    district. Calculé sur l'historique des états des matériels.
+    """
     
-    if not last_import:
+    async def compute():
+        try:
+            results = await run_in_db_executor(LifecycleService.reliability, group_by, skip=skip, limit=limit)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
         return {
-            "message": "Aucune importation trouvée",
-            "statistics": None
+            "group_by": group_by,
+            "skip": skip,
+            "limit": limit,
+            "data": results
         }
     
-    result = StatisticsService.get_statistics(
-        last_import['id_date'],
-        skip_type=0,
-        limit_type=20,
-        skip_region=0,
-        limit_region=20
-    )
-    
-    return {
-        "id_date_import": last_import['id_date'],
-        "statistics": result
-    }
\ No newline at end of file
+    key = ("statistics/reliability", group_by, skip, limit)
+    # L'historique suit les nouvelles importations
+    return await cached_response(request, key, compute, cache_control=CACHE_CONTROL_LATEST)
@@ -1,19 +1,38 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status, Query
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status, Query, Response
 from routes.auth import get_current_user
-from services.excel_service import ExcelService
-from models.schemas import UploadResponse, UploadHistoryItem
+from services.excel_service import ExcelService, IMPORT_EN_COURS
+from services.import_job_service import ImportJobService, STATUT_EN_ATTENTE, STATUT_DEJA_IMPORTE
+from services.import_delete_service import ImportDeleteService, STATUT_SUPPRESSION
+from config.database import execute_query_async, run_in_db_executor
+from models.schemas import UploadResponse, UploadHistoryItem, ImportJobCreated, ImportJobStatus, ImportDeletion
+import hashlib
 import os
 import uuid
-from typing import List
+from datetime import datetime
+from typing import List, Optional
+from utils.helpers import decode_cursor
 
 router = APIRouter(prefix="/upload", tags=["Upload"])
 
-@router.post("/excel", response_model=UploadResponse)
+# Taille des blocs lus depuis la requête et écrits sur disque
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+@router.post("/excel", response_model=ImportJobCreated, status_code=status.HTTP_202_ACCEPTED)
 async def upload_excel(
+    response: Response,
     file: UploadFile = File(...),
+    force: bool = Query(False, description="Importer même si un fichier identique a déjà été importé"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Upload un fichier Excel et l'importer dans la base de données"""
+    """
+    Upload un fichier Excel et planifie son import en arrière-plan.
+    L'avancement se suit sur /upload/jobs/{id_job}.
+
+    Un fichier identique (même SHA-256) déjà importé ou en cours d'import n'est
+    pas réimporté: la réponse (200) renvoie l'importation ou le job existant.
+    force=true réimporte un fichier déjà importé, mais jamais deux fois à la
+    fois: un import du même fichier en file ou en cours est renvoyé.
+    """
     
     # Vérifier l'extension du fichier
     if not file.filename.endswith(('.xlsx', '.xls')):
@@ -31,27 +50,55 @@ async def upload_excel(
     os.makedirs("./uploads", exist_ok=True)
     
     try:
-        # Sauvegarder le fichier temporairement
+        # Sauvegarder le fichier jusqu'à la fin de l'import, bloc par bloc
+        # (le fichier n'est jamais entièrement en mémoire), en calculant son empreinte
+        sha256 = hashlib.sha256()
         with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                buffer.write(chunk)
+        file_hash = sha256.hexdigest()
         
-        # Traiter le fichier Excel
-        result = ExcelService.process_excel_file(
-            file_path, 
+        def deja_importe(doublon: dict) -> dict:
+            os.remove(file_path)
+            response.status_code = status.HTTP_200_OK
+            return {
+                "message": "Fichier déjà importé" if doublon.get("id_date_import") else "Fichier déjà en cours d'import",
+                "filename": file.filename,
+                "id_job": doublon.get("id_job"),
+                "statut": STATUT_DEJA_IMPORTE,
+                "id_date_import": doublon.get("id_date_import"),
+                "file_hash": file_hash
+            }
+        
+        # Fichier déjà importé (ou en cours d'import): pas de nouvel import
+        if not force:
+            doublon = await run_in_db_executor(ImportJobService.find_duplicate, file_hash)
+            if doublon:
+                return deja_importe(doublon)
+        
+        # Placer l'import dans la file des workers
+        id_job = await run_in_db_executor(
+            ImportJobService.submit,
+            file_path,
+            file.filename,
             current_user['user_id'],
-            file.filename
+            file_hash
         )
-        
-        # Supprimer le fichier temporaire
-        os.remove(file_path)
+        if id_job is None:
+            # Upload simultané du même fichier: son job a été créé en premier
+            doublon = await run_in_db_executor(ImportJobService.find_duplicate, file_hash, False)
+            return deja_importe(doublon or {})
         
         return {
-            "message": "Fichier importé avec succès",
+            "message": "Fichier reçu, import planifié",
             "filename": file.filename,
-            "lignes_inserees": result['lignes_inserees'],
-            "date_import": result['date_import'],
-            "id_date_import": result['id_date_import']
+            "id_job": id_job,
+            "statut": STATUT_EN_ATTENTE,
+            "file_hash": file_hash
         }
         
     except Exception as e:
@@ -60,30 +107,85 @@ async def upload_excel(
             os.remove(file_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erreur lors du traitement du fichier: {str(e)}"
+            detail=f"Erreur lors de l'enregistrement du fichier: {str(e)}"
         )
 
+@router.get("/jobs/{id_job}", response_model=ImportJobStatus)
+async def get_import_job(
+    id_job: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Récupérer l'état d'avancement d'un import"""
+    job = await run_in_db_executor(ImportJobService.get_job, id_job)
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import non trouvé"
+        )
+    
+    return job
+
+@router.delete("/imports/{id_date_import}", response_model=ImportDeletion, status_code=status.HTTP_202_ACCEPTED)
+async def delete_import(
+    id_date_import: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Supprimer une importation (snapshots, incidents, synthèses).
+    L'importation est masquée immédiatement puis supprimée en arrière-plan par lots.
+    """
+    statut_avant = await run_in_db_executor(ImportDeleteService.request_delete, id_date_import)
+    
+    if statut_avant is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Date d'importation non trouvée"
+        )
+    if statut_avant == IMPORT_EN_COURS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Importation en cours: elle ne peut pas être supprimée"
+        )
+    
+    return {
+        "message": "Suppression de l'importation planifiée",
+        "id_date_import": id_date_import,
+        "statut": STATUT_SUPPRESSION
+    }
+
 @router.get("/history")
 async def get_upload_history(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur de la page suivante (remplace skip)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Récupérer l'historique des uploads"""
-    result = ExcelService.get_upload_history(skip, limit)
+    after = None
+    if cursor is not None:
+        try:
+            values = decode_cursor(cursor)
+            after = {"date": datetime.fromisoformat(values['date']), "id": int(values['id'])}
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Curseur de pagination invalide"
+            )
+    
+    result = await run_in_db_executor(ExcelService.get_upload_history, skip, limit, after)
     return result
 
 @router.get("/dates")
 async def get_import_dates(current_user: dict = Depends(get_current_user)):
     """Récupérer toutes les dates d'importation disponibles"""
-    from config.database import execute_query
-    
     query = """
         SELECT id_date, date_complet
         FROM date_import
+        WHERE statut = 'termine'
         ORDER BY date_complet DESC
     """
-    results = execute_query(query, fetch=True)
+    results = await execute_query_async(query, fetch=True, name="dates_import")
     
     return {
         "total": len(results),
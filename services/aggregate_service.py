@@ -0,0 +1,96 @@
+from typing import Optional
+
+from config.database import Database, execute_query
+from services.snapshot_delta_service import SnapshotDeltaService
+
+ETAT_FONCTIONNEL = 'Fonctionnel'
+ETAT_EN_PANNE = 'Non fonctionnel'
+
+# Tables de synthèse par importation et requêtes qui les remplissent
+# ({source}: snapshots complets de l'importation, voir SnapshotDeltaService.source)
+AGGREGATE_QUERIES = {
+    "stat_import_resume": """
+        INSERT INTO stat_import_resume
+        (id_date_import, total_materiels, materiels_fonctionnels, materiels_en_panne, materiels_distincts)
+        SELECT
+            %(id)s,
+            COUNT(mi.id_snapshot),
+            COUNT(CASE WHEN mi.etat = %(ok)s THEN 1 END),
+            COUNT(CASE WHEN mi.etat = %(ko)s THEN 1 END),
+            COUNT(DISTINCT mi.id_physique)
+        FROM {source} mi
+    """,
+    # Cube: effectifs par localisation, type et état (agrégé à la demande par CubeService)
+    "stat_cube": """
+        INSERT INTO stat_cube
+        (id_date_import, code, region, district, commune, type, etat, nombre)
+        SELECT
+            %(id)s, l.code, l.region, l.district, l.commune, mp.type, mi.etat,
+            COUNT(mi.id_snapshot)
+        FROM {source} mi
+        JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
+        JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
+        GROUP BY l.code, l.region, l.district, l.commune, mp.type, mi.etat
+    """
+}
+
+# Importation sans synthèse, ou antérieure au cube (synthèse sans cube pour des snapshots)
+SYNTHESE_MANQUANTE = """(
+    s.id_date_import IS NULL
+    OR (s.total_materiels > 0
+        AND NOT EXISTS (SELECT 1 FROM stat_cube c WHERE c.id_date_import = di.id_date))
+)"""
+
+
+class AggregateService:
+    """Statistiques précalculées par importation (une importation ne change plus une fois écrite)"""
+
+    @staticmethod
+    def build(cursor, id_date_import: int):
+        """(Re)calcule les tables de synthèse d'une importation dans la transaction courante"""
+        params = {"id": id_date_import, "ok": ETAT_FONCTIONNEL, "ko": ETAT_EN_PANNE}
+        source = SnapshotDeltaService.source(cursor, id_date_import)
+        for table, query in AGGREGATE_QUERIES.items():
+            cursor.execute(f"DELETE FROM {table} WHERE id_date_import = %s", (id_date_import,))
+            cursor.execute(query.format(source=source), params)
+
+    @staticmethod
+    def ensure_up_to(id_date_import: Optional[int] = None) -> list:
+        """
+        Calcule les synthèses manquantes des importations jusqu'à `id_date_import`
+        inclus (toutes si None)
+        """
+        query = f"""
+            SELECT di.id_date
+            FROM date_import di
+            LEFT JOIN stat_import_resume s ON s.id_date_import = di.id_date
+            WHERE (%(id)s IS NULL OR di.id_date <= %(id)s) AND {SYNTHESE_MANQUANTE}
+            AND di.statut = 'termine'
+            ORDER BY di.id_date
+        """
+        missing = execute_query(query, {"id": id_date_import}, fetch=True, name="stats_imports_manquants")
+        for row in missing:
+            with Database.get_cursor() as cursor:
+                AggregateService.build(cursor, row['id_date'])
+        return [row['id_date'] for row in missing]
+
+    @staticmethod
+    def backfill(force: bool = False):
+        """Calcule les synthèses de toutes les importations existantes"""
+        if force:
+            query = "SELECT id_date FROM date_import WHERE statut = 'termine' ORDER BY id_date"
+        else:
+            query = f"""
+                SELECT di.id_date
+                FROM date_import di
+                LEFT JOIN stat_import_resume s ON s.id_date_import = di.id_date
+                WHERE {SYNTHESE_MANQUANTE}
+                AND di.statut = 'termine'
+                ORDER BY di.id_date
+            """
+        imports = execute_query(query, fetch=True)
+        for row in imports:
+            # Une transaction par importation pour ne pas verrouiller longtemps
+            with Database.get_cursor() as cursor:
+                AggregateService.build(cursor, row['id_date'])
+        return [row['id_date'] for row in imports]
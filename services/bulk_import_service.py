@@ -0,0 +1,285 @@
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from services.snapshot_flat_service import SnapshotFlatService
+
+
+def collation_key(value) -> Optional[str]:
+    """
+    Clé de comparaison proche de utf8mb4_unicode_ci (casse, accents, espaces finaux).
+    Approximation: sert à regrouper les lignes, MySQL reste juge de l'égalité.
+    """
+    if value is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    sans_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return sans_accents.casefold().rstrip(' ')
+
+
+# Relecture après upsert: une lecture verrouillante voit les lignes validées par
+# les imports concurrents (une lecture simple reste sur l'instantané de la transaction)
+LOCKING_READ = "LOCK IN SHARE MODE"
+
+
+def _chunks(items: list, size: int):
+    """Découpe une liste en morceaux de taille fixe"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BulkImportService:
+    """
+    Import ensembliste des lignes Excel: les localisations et matériels physiques
+    distincts sont résolus en mémoire puis par lots (SELECT ... IN / upsert multi-lignes
+    sur leurs clés uniques), les snapshots et incidents sont écrits avec executemany, puis recopiés à plat.
+    """
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def import_rows(cursor, rows: List[dict], id_date_import: int, progress=None, dimensions=None) -> int:
+        """
+        Insère les lignes nettoyées d'un import et retourne le nombre de snapshots créés.
+        `progress(lignes_traitees)` est appelé après chaque lot de snapshots.
+        `dimensions` (DimensionSession) évite de relire les référentiels déjà connus.
+        """
+
+        # Même filtre que le traitement ligne par ligne: nom obligatoire,
+        # et un type NULL faisait échouer l'insertion (colonne NOT NULL)
+        rows = [r for r in rows if r.get('nom_materiel') and r.get('type_materiel')]
+        if not rows:
+            return 0
+
+        # 1. Localisations
+        loc_ids = BulkImportService._resolve_localisations(cursor, rows, dimensions)
+
+        # 2. Matériels physiques (référentiel persistant)
+        phys_ids = BulkImportService._resolve_materiels_physiques(cursor, rows, loc_ids, dimensions)
+
+        # 3. Snapshots puis 4. incidents
+        done = 0
+        for batch_rows, batch_phys in zip(
+            _chunks(rows, BulkImportService.BATCH_SIZE),
+            _chunks(phys_ids, BulkImportService.BATCH_SIZE)
+        ):
+            BulkImportService._insert_snapshots(cursor, batch_rows, batch_phys, id_date_import)
+            done += len(batch_rows)
+            if progress:
+                progress(done)
+
+        return len(rows)
+
+    @staticmethod
+    def plan_localisations(rows: List[dict]) -> Tuple[List[tuple], List[tuple]]:
+        """
+        Calcule les localisations distinctes à résoudre.
+
+        Retourne (clés par ligne, clés distinctes comparables). Une localisation avec
+        une valeur NULL ne correspond jamais en SQL (`= NULL`): comme dans le traitement
+        ligne par ligne, chaque occurrence crée sa propre localisation.
+        """
+        row_keys = []
+        distinct = {}
+        for index, r in enumerate(rows):
+            values = (r.get('code'), r.get('region'), r.get('district'), r.get('commune'))
+            if any(v is None for v in values):
+                row_keys.append(('__null__', index))
+                continue
+            key = tuple(collation_key(v) for v in values)
+            row_keys.append(key)
+            distinct.setdefault(key, values)
+        return row_keys, list(distinct.items())
+
+    @staticmethod
+    def _resolve_localisations(cursor, rows: List[dict], dimensions=None) -> List[int]:
+        """Retourne l'identifiant de localisation de chaque ligne"""
+        row_keys, distinct = BulkImportService.plan_localisations(rows)
+        resolved = BulkImportService._from_cache(distinct, dimensions.localisation if dimensions else None)
+        distinct = [(key, values) for key, values in distinct if key not in resolved]
+        cached = set(resolved)
+
+        def lookup(pending, locking=False):
+            for chunk in _chunks(pending, BulkImportService.BATCH_SIZE):
+                placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(chunk))
+                params = [v for _, values in chunk for v in values]
+                cursor.execute(f"""
+                    SELECT code_localisation, code, region, district, commune
+                    FROM localisation
+                    WHERE (code, region, district, commune) IN ({placeholders})
+                    ORDER BY code_localisation
+                    {LOCKING_READ if locking else ''}
+                """, params)
+                for r in cursor.fetchall():
+                    key = tuple(collation_key(r[c]) for c in ('code', 'region', 'district', 'commune'))
+                    resolved.setdefault(key, r['code_localisation'])
+
+        lookup(distinct)
+
+        missing = [(key, values) for key, values in distinct if key not in resolved]
+        if missing:
+            # Upsert sur la clé unique: une localisation créée entre-temps par un
+            # import concurrent n'est pas dupliquée
+            for chunk in _chunks(missing, BulkImportService.BATCH_SIZE):
+                cursor.executemany("""
+                    INSERT INTO localisation (code, region, district, commune)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE code_localisation = code_localisation
+                """, [values for _, values in chunk])
+            lookup(missing, locking=True)
+            BulkImportService._lookup_one_by_one(cursor, missing, resolved, """
+                SELECT code_localisation AS id FROM localisation
+                WHERE code = %s AND region = %s AND district = %s AND commune = %s
+                ORDER BY code_localisation LIMIT 1
+            """)
+            BulkImportService._check_resolved(missing, resolved, "localisation")
+
+        if dimensions:
+            dimensions.stage_localisations({k: v for k, v in resolved.items() if k not in cached})
+
+        loc_ids = []
+        for r, key in zip(rows, row_keys):
+            if key[0] == '__null__':
+                cursor.execute("""
+                    INSERT INTO localisation (code, region, district, commune)
+                    VALUES (%s, %s, %s, %s)
+                """, (r.get('code'), r.get('region'), r.get('district'), r.get('commune')))
+                loc_ids.append(cursor.lastrowid)
+            else:
+                loc_ids.append(resolved[key])
+        return loc_ids
+
+    @staticmethod
+    def _resolve_materiels_physiques(cursor, rows: List[dict], loc_ids: List[int], dimensions=None) -> List[int]:
+        """Retourne l'identifiant du matériel physique de chaque ligne"""
+        row_keys = []
+        distinct = {}
+        for r, loc_id in zip(rows, loc_ids):
+            values = (loc_id, r['nom_materiel'], r['type_materiel'])
+            key = (loc_id, collation_key(values[1]), collation_key(values[2]))
+            row_keys.append(key)
+            distinct.setdefault(key, values)
+        distinct = list(distinct.items())
+        resolved = BulkImportService._from_cache(distinct, dimensions.materiel if dimensions else None)
+        distinct = [(key, values) for key, values in distinct if key not in resolved]
+        cached = set(resolved)
+
+        def lookup(pending, locking=False):
+            for chunk in _chunks(pending, BulkImportService.BATCH_SIZE):
+                placeholders = ', '.join(['(%s, %s, %s)'] * len(chunk))
+                params = [v for _, values in chunk for v in values]
+                cursor.execute(f"""
+                    SELECT id_physique, code_localisation_ref, nom_materiel, type
+                    FROM materiel_physique
+                    WHERE (code_localisation_ref, nom_materiel, type) IN ({placeholders})
+                    ORDER BY id_physique
+                    {LOCKING_READ if locking else ''}
+                """, params)
+                for r in cursor.fetchall():
+                    key = (r['code_localisation_ref'], collation_key(r['nom_materiel']), collation_key(r['type']))
+                    resolved.setdefault(key, r['id_physique'])
+
+        lookup(distinct)
+
+        missing = [(key, values) for key, values in distinct if key not in resolved]
+        if missing:
+            for chunk in _chunks(missing, BulkImportService.BATCH_SIZE):
+                cursor.executemany("""
+                    INSERT INTO materiel_physique (code_localisation_ref, nom_materiel, type)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE id_physique = id_physique
+                """, [values for _, values in chunk])
+            lookup(missing, locking=True)
+            BulkImportService._lookup_one_by_one(cursor, missing, resolved, """
+                SELECT id_physique AS id FROM materiel_physique
+                WHERE code_localisation_ref = %s AND nom_materiel = %s AND type = %s
+                ORDER BY id_physique LIMIT 1
+            """)
+            BulkImportService._check_resolved(missing, resolved, "matériel physique")
+
+        if dimensions:
+            dimensions.stage_materiels({k: v for k, v in resolved.items() if k not in cached})
+
+        return [resolved[key] for key in row_keys]
+
+    @staticmethod
+    def _from_cache(distinct: List[tuple], get) -> Dict[tuple, int]:
+        """Identifiants déjà connus du cache de référentiels"""
+        resolved: Dict[tuple, int] = {}
+        if get is None:
+            return resolved
+        for key, _ in distinct:
+            value = get(key)
+            if value is not None:
+                resolved[key] = value
+        return resolved
+
+    @staticmethod
+    def _lookup_one_by_one(cursor, missing: List[tuple], resolved: Dict[tuple, int], query: str):
+        """
+        Relit une à une les clés encore non résolues après l'upsert.
+
+        collation_key n'imite qu'approximativement utf8mb4_unicode_ci (les expansions
+        comme 'Æ' = 'AE' ou 'ß' = 'ss' lui échappent): la ligne existe bien mais sa clé
+        Python diffère de celle demandée. La comparaison est alors laissée à MySQL et
+        l'identifiant trouvé est rangé sous la clé demandée.
+        """
+        for key, values in missing:
+            if key in resolved:
+                continue
+            cursor.execute(f"{query} {LOCKING_READ}", values)
+            row = cursor.fetchone()
+            if row:
+                resolved[key] = row['id']
+
+    @staticmethod
+    def _check_resolved(missing: List[tuple], resolved: Dict[tuple, int], label: str):
+        """Vérifie que chaque clé insérée (ou déjà présente) a bien été relue"""
+        introuvables = [values for key, values in missing if key not in resolved]
+        if introuvables:
+            raise RuntimeError(
+                f"{len(introuvables)} {label}(s) introuvable(s) après insertion, "
+                f"ex: {introuvables[0]}"
+            )
+
+    @staticmethod
+    def _insert_snapshots(cursor, rows: List[dict], phys_ids: List[int], id_date_import: int):
+        """Insère un lot de snapshots, les incidents associés et leurs lignes à plat"""
+        cursor.executemany("""
+            INSERT INTO materiel_informatique (id_physique, etat, id_date_import)
+            VALUES (%s, %s, %s)
+        """, [(id_physique, r.get('etat'), id_date_import) for r, id_physique in zip(rows, phys_ids)])
+
+        # Un INSERT multi-lignes attribue des id croissants dans l'ordre des lignes:
+        # les snapshots de ce lot sont ceux de l'import à partir du premier id généré
+        first_id = cursor.lastrowid
+        BulkImportService._insert_incidents(cursor, rows, id_date_import, first_id)
+        SnapshotFlatService.insert_batch(cursor, id_date_import, first_id)
+
+    @staticmethod
+    def _insert_incidents(cursor, rows: List[dict], id_date_import: int, first_id: int):
+        """Insère les incidents du lot, rattachés à leur snapshot"""
+        incidents = [(i, r) for i, r in enumerate(rows) if r.get('motif') and str(r['motif']).strip() != '']
+        if not incidents:
+            return
+
+        cursor.execute("""
+            SELECT id_snapshot
+            FROM materiel_informatique
+            WHERE id_date_import = %s AND id_snapshot >= %s
+            ORDER BY id_snapshot
+        """, (id_date_import, first_id))
+        snapshot_ids = [r['id_snapshot'] for r in cursor.fetchall()]
+        if len(snapshot_ids) != len(rows):
+            raise RuntimeError(
+                f"Snapshots inattendus pour l'import {id_date_import}: "
+                f"{len(snapshot_ids)} trouvés, {len(rows)} insérés"
+            )
+
+        cursor.executemany("""
+            INSERT INTO incident
+            (motif, compatibilite_consommable, achat_consommable, id_materiel, id_date_import)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [
+            (r['motif'], r.get('compatibilite_consomm'), r.get('achat_consommable'), snapshot_ids[i], id_date_import)
+            for i, r in incidents
+        ])
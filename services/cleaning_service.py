@@ -0,0 +1,102 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.excel_reader import COLONNES_EXCEL
+from utils.helpers import ETAT_MAPPING
+
+# Colonnes texte: espaces retirés, valeurs vides en NULL
+COLONNES_TEXTE = [
+    'code', 'region', 'district', 'commune', 'nom_materiel', 'etat_materiel', 'type_materiel',
+    'motif', 'achat_consommable', 'compatibilite_consomm'
+]
+
+# Colonnes dont la valeur est héritée de la ligne précédente quand la cellule est vide
+COLONNES_HERITAGE = ['code', 'region', 'district', 'commune']
+
+
+class CleaningService:
+    """
+    Nettoyage vectorisé d'un lot de lignes Excel (opérations pandas par colonne):
+    espaces, valeurs vides en NULL, héritage de la localisation, normalisation
+    des états et des motifs.
+
+    Les colonnes ont peu de valeurs distinctes (régions, types, états...): chaque
+    colonne est factorisée, le nettoyage porte sur les valeurs distinctes puis
+    est redistribué sur les lignes.
+    """
+
+    @staticmethod
+    def clean_batch(records: List[dict], heritage: Optional[dict] = None) -> List[dict]:
+        """
+        Retourne les lignes nettoyées d'un lot, prêtes pour BulkImportService.
+
+        `heritage` contient les dernières valeurs de localisation du lot précédent;
+        il est mis à jour pour le lot suivant.
+        """
+        if not records:
+            return []
+        if heritage is None:
+            heritage = {}
+
+        df = pd.DataFrame.from_records(records, columns=COLONNES_EXCEL)
+
+        transformations = {
+            'code': (CleaningService._codes_entiers, None),
+            'etat_materiel': (None, CleaningService._normaliser_etats),
+            'motif': (None, CleaningService._reduire_espaces)
+        }
+        colonnes = {}
+        for col in COLONNES_TEXTE:
+            avant, apres = transformations.get(col, (None, None))
+            colonnes[col] = CleaningService._clean_distinct(df[col], avant, apres)
+
+        # Héritage des valeurs de localisation (y compris depuis le lot précédent)
+        for col in COLONNES_HERITAGE:
+            serie = pd.Series(colonnes[col], dtype=object).ffill()
+            if heritage.get(col) is not None:
+                serie = serie.fillna(heritage[col])
+            derniere = serie.iloc[-1]
+            if not pd.isna(derniere):
+                heritage[col] = derniere
+            colonnes[col] = serie.to_numpy(dtype=object, na_value=None)
+
+        colonnes['etat'] = colonnes.pop('etat_materiel')
+        noms = list(colonnes)
+        return [dict(zip(noms, ligne)) for ligne in zip(*colonnes.values())]
+
+    @staticmethod
+    def _clean_distinct(serie: pd.Series, avant=None, apres=None) -> np.ndarray:
+        """
+        Nettoie les valeurs distinctes d'une colonne (espaces, vides en NULL) puis
+        les redistribue sur les lignes. `avant` s'applique aux valeurs brutes,
+        `apres` aux valeurs nettoyées.
+        """
+        indices, distinctes = pd.factorize(serie)
+        valeurs = pd.Series(distinctes, dtype=object)
+        if avant is not None:
+            valeurs = avant(valeurs)
+        valeurs = valeurs.astype('string').str.strip()
+        valeurs = valeurs.mask(valeurs.eq(''))
+        if apres is not None:
+            valeurs = apres(valeurs)
+        # Indice -1 (valeur manquante) -> dernier élément: None
+        propres = np.append(valeurs.to_numpy(dtype=object, na_value=None), None)
+        return propres[indices]
+
+    @staticmethod
+    def _codes_entiers(valeurs: pd.Series) -> pd.Series:
+        """Codes numériques lus comme flottants (645045.0) -> 645045"""
+        return valeurs.map(lambda v: int(v) if isinstance(v, float) and v.is_integer() else v)
+
+    @staticmethod
+    def _normaliser_etats(valeurs: pd.Series) -> pd.Series:
+        """Variantes d'état ('ok', 'HS', 'en panne'...) ramenées aux valeurs de référence"""
+        cles = valeurs.str.lower().str.replace(r'\s+', ' ', regex=True)
+        return cles.map(ETAT_MAPPING).fillna(valeurs)
+
+    @staticmethod
+    def _reduire_espaces(valeurs: pd.Series) -> pd.Series:
+        """Motifs saisis sur plusieurs lignes: espaces et retours à la ligne réduits"""
+        return valeurs.str.replace(r'\s+', ' ', regex=True)
@@ -0,0 +1,186 @@
+from typing import Dict, List, Optional, Sequence
+
+from config.database import execute_query
+from services.aggregate_service import ETAT_FONCTIONNEL, ETAT_EN_PANNE
+
+# Dimensions du cube stat_cube (niveaux de localisation, type, état)
+CUBE_DIMENSIONS = ("code", "region", "district", "commune", "type", "etat")
+
+# Mesures calculées sur chaque groupe, utilisables pour le tri
+CUBE_MESURES = ("total_materiels", "materiels_fonctionnels", "materiels_en_panne")
+
+# Dimensions filtrables d'une tendance (l'état est ventilé dans les mesures)
+TREND_FILTRES = ("code", "region", "district", "commune", "type")
+
+# Points renvoyés par défaut par une tendance
+TREND_POINTS = 60
+
+
+class CubeService:
+    """
+    Agrégats à la demande sur le cube précalculé d'une importation: une ligne par
+    (code, region, district, commune, type, etat) avec le nombre de snapshots.
+
+    Toute agrégation (région, district x type, taux par commune...) et toute
+    tranche (filtre sur une dimension) se calculent sur le cube, quelques
+    milliers de lignes au plus par importation, sans lire les snapshots.
+    """
+
+    @staticmethod
+    def check_dimensions(group_by: Sequence[str]) -> List[str]:
+        """Dimensions de regroupement validées (ValueError si inconnue), sans doublon"""
+        inconnues = [d for d in group_by if d not in CUBE_DIMENSIONS]
+        if inconnues:
+            raise ValueError(
+                f"Dimensions inconnues: {', '.join(inconnues)} "
+                f"(disponibles: {', '.join(CUBE_DIMENSIONS)})"
+            )
+        return list(dict.fromkeys(group_by))
+
+    @staticmethod
+    def check_tri(tri: str) -> str:
+        """Mesure de tri validée (ValueError si inconnue)"""
+        if tri not in CUBE_MESURES:
+            raise ValueError(f"Tri inconnu: {tri} (disponibles: {', '.join(CUBE_MESURES)})")
+        return tri
+
+    @staticmethod
+    def rollup(id_date_import: int, group_by: Sequence[str], filtres: Optional[Dict[str, str]] = None,
+               tri: str = "total_materiels", skip: int = 0, limit: int = 100,
+               pannes_seulement: bool = False) -> List[dict]:
+        """
+        Agrège le cube de l'importation sur `group_by` (aucune dimension: total
+        global), après filtrage par égalité sur `filtres`. Chaque ligne porte les
+        dimensions, les effectifs et les taux de fonctionnement et de panne.
+        Tri décroissant sur la mesure `tri`.
+        """
+        group_by = CubeService.check_dimensions(group_by)
+        filtres = {d: v for d, v in (filtres or {}).items() if v is not None}
+        CubeService.check_dimensions(list(filtres))
+        CubeService.check_tri(tri)
+
+        conditions = ["id_date_import = %(id)s"] + [f"{d} = %(f_{d})s" for d in filtres]
+        params = {"id": id_date_import, "ok": ETAT_FONCTIONNEL, "ko": ETAT_EN_PANNE,
+                  "limit": limit, "skip": skip}
+        params.update({f"f_{d}": v for d, v in filtres.items()})
+
+        colonnes = "".join(f"{d}, " for d in group_by)
+        group = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+        having = "HAVING materiels_en_panne > 0" if pannes_seulement else ""
+        ordre = ", ".join([f"{tri} DESC"] + group_by)
+
+        query = f"""
+            SELECT
+                {colonnes}
+                SUM(nombre) as total_materiels,
+                SUM(CASE WHEN etat = %(ok)s THEN nombre ELSE 0 END) as materiels_fonctionnels,
+                SUM(CASE WHEN etat = %(ko)s THEN nombre ELSE 0 END) as materiels_en_panne
+            FROM stat_cube
+            WHERE {' AND '.join(conditions)}
+            {group}
+            {having}
+            ORDER BY {ordre}
+            LIMIT %(limit)s OFFSET %(skip)s
+        """
+        results = execute_query(query, params, fetch=True, name="stats_cube")
+
+        lignes = []
+        for r in results:
+            total = int(r['total_materiels'] or 0)
+            fonctionnels = int(r['materiels_fonctionnels'] or 0)
+            en_panne = int(r['materiels_en_panne'] or 0)
+            ligne = {d: r[d] for d in group_by}
+            ligne.update({
+                "total_materiels": total,
+                "materiels_fonctionnels": fonctionnels,
+                "materiels_en_panne": en_panne,
+                "taux_fonctionnement": round(fonctionnels * 100.0 / total, 2) if total > 0 else 0,
+                "taux_en_panne": round(en_panne * 100.0 / total, 2) if total > 0 else 0
+            })
+            lignes.append(ligne)
+        return lignes
+
+    @staticmethod
+    def trend(filtres: Optional[Dict[str, str]] = None, id_debut: Optional[int] = None,
+              id_fin: Optional[int] = None, points: int = TREND_POINTS) -> List[dict]:
+        """
+        Effectifs fonctionnels / non fonctionnels de chaque importation terminée
+        entre `id_debut` et `id_fin` (bornes incluses, ouvertes si None), sur la
+        tranche `filtres` du cube (stat_import_resume sans filtre).
+
+        Au-delà de `points` importations, la série est répartie en `points`
+        groupes consécutifs (NTILE) et chaque groupe est représenté par sa
+        dernière importation: les valeurs restent des effectifs réels et la
+        dernière importation de la plage figure toujours dans la série.
+        """
+        filtres = {d: v for d, v in (filtres or {}).items() if v is not None}
+        inconnues = [d for d in filtres if d not in TREND_FILTRES]
+        if inconnues:
+            raise ValueError(
+                f"Filtres inconnus: {', '.join(inconnues)} "
+                f"(disponibles: {', '.join(TREND_FILTRES)})"
+            )
+
+        params = {"debut": id_debut, "fin": id_fin, "points": points,
+                  "ok": ETAT_FONCTIONNEL, "ko": ETAT_EN_PANNE}
+        params.update({f"f_{d}": v for d, v in filtres.items()})
+
+        if filtres:
+            # Filtres dans la jointure: une importation sans matériel dans la tranche vaut 0
+            tranche = "".join(f" AND c.{d} = %(f_{d})s" for d in filtres)
+            serie = f"""
+                SELECT
+                    di.id_date, di.date_complet,
+                    COALESCE(SUM(c.nombre), 0) AS total,
+                    COALESCE(SUM(CASE WHEN c.etat = %(ok)s THEN c.nombre END), 0) AS fonctionnels,
+                    COALESCE(SUM(CASE WHEN c.etat = %(ko)s THEN c.nombre END), 0) AS non_fonctionnels
+                FROM date_import di
+                LEFT JOIN stat_cube c ON c.id_date_import = di.id_date{tranche}
+                WHERE {{bornes}}
+                GROUP BY di.id_date, di.date_complet
+            """
+        else:
+            serie = """
+                SELECT
+                    di.id_date, di.date_complet,
+                    COALESCE(s.total_materiels, 0) AS total,
+                    COALESCE(s.materiels_fonctionnels, 0) AS fonctionnels,
+                    COALESCE(s.materiels_en_panne, 0) AS non_fonctionnels
+                FROM date_import di
+                LEFT JOIN stat_import_resume s ON s.id_date_import = di.id_date
+                WHERE {bornes}
+            """
+        bornes = """di.statut = 'termine'
+                AND (%(debut)s IS NULL OR di.id_date >= %(debut)s)
+                AND (%(fin)s IS NULL OR di.id_date <= %(fin)s)"""
+
+        query = f"""
+            WITH serie AS ({serie.format(bornes=bornes)}),
+            groupes AS (
+                SELECT serie.*, NTILE(%(points)s) OVER (ORDER BY id_date) AS groupe
+                FROM serie
+            ),
+            rangs AS (
+                SELECT groupes.*,
+                    ROW_NUMBER() OVER (PARTITION BY groupe ORDER BY id_date DESC) AS rang,
+                    COUNT(*) OVER (PARTITION BY groupe) AS imports_regroupes
+                FROM groupes
+            )
+            SELECT id_date, date_complet, total, fonctionnels, non_fonctionnels, imports_regroupes
+            FROM rangs
+            WHERE rang = 1
+            ORDER BY id_date
+        """
+        results = execute_query(query, params, fetch=True, name="stats_tendance")
+
+        return [
+            {
+                "id_date_import": r['id_date'],
+                "date_importation": r['date_complet'],
+                "total_materiels": int(r['total']),
+                "fonctionnels": int(r['fonctionnels']),
+                "non_fonctionnels": int(r['non_fonctionnels']),
+                "imports_regroupes": int(r['imports_regroupes'])
+            }
+            for r in results
+        ]
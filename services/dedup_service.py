@@ -0,0 +1,161 @@
+from config.database import Database, execute_query
+from services.dimension_cache import dimension_cache
+from services.lifecycle_service import LifecycleService
+
+# Clés uniques des référentiels: (table, nom, colonnes)
+UNIQUE_KEYS = [
+    ("localisation", "uk_localisation", "code, region, district, commune"),
+    ("materiel_physique", "uk_materiel_physique", "code_localisation_ref, nom_materiel, type"),
+]
+
+# Index composites remplacés par les clés uniques
+OBSOLETE_INDEXES = [
+    ("localisation", "idx_localisation_complete"),
+    ("materiel_physique", "idx_physique_complet"),
+]
+
+
+class DedupService:
+    """
+    Fusion des doublons des référentiels (localisation, materiel_physique) créés
+    avant leurs clés uniques, puis création de ces clés.
+    """
+
+    @staticmethod
+    def merge_duplicates() -> dict:
+        """
+        Fusionne les doublons dans une transaction: pour chaque groupe, la ligne de
+        plus petit identifiant est conservée et les références y sont reportées.
+        Retourne le nombre de lignes fusionnées par table.
+        """
+        with Database.get_cursor() as cursor:
+            # Codes lus comme flottants par l'ancien import ('645045.0'): même
+            # localisation que '645045'
+            cursor.execute("""
+                UPDATE localisation
+                SET code = SUBSTRING(code, 1, CHAR_LENGTH(code) - 2)
+                WHERE code REGEXP '^[0-9]+\\\\.0$'
+            """)
+            codes_corriges = cursor.rowcount
+            cursor.execute("""
+                UPDATE snapshot_flat
+                SET code = SUBSTRING(code, 1, CHAR_LENGTH(code) - 2)
+                WHERE code REGEXP '^[0-9]+\\\\.0$'
+            """)
+
+            localisations = DedupService._merge(
+                cursor,
+                table="localisation",
+                id_col="code_localisation",
+                key_cols=["code", "region", "district", "commune"],
+                refs=[("materiel_physique", "code_localisation_ref")]
+            )
+
+            # Les localisations fusionnées peuvent rendre des matériels identiques
+            materiels = DedupService._merge(
+                cursor,
+                table="materiel_physique",
+                id_col="id_physique",
+                key_cols=["code_localisation_ref", "nom_materiel", "type"],
+                refs=[("materiel_informatique", "id_physique"), ("snapshot_flat", "id_physique")],
+                # Disparitions des chaînes en delta, clé (id_physique, id_date_import)
+                unique_refs=[("snapshot_disparu", "id_physique")]
+            )
+            if materiels:
+                # Historiques des matériels fusionnés à réunir
+                LifecycleService.invalidate(cursor)
+
+            # Identifiants supprimés: les caches des référentiels des workers de
+            # l'API sont rechargés à leur prochain import
+            cursor.execute("""
+                INSERT INTO referentiel_generation (id, generation) VALUES (1, 1)
+                ON DUPLICATE KEY UPDATE generation = generation + 1
+            """)
+
+        # Cache de ce processus vidé immédiatement
+        dimension_cache.invalidate()
+
+        return {
+            "codes_corriges": codes_corriges,
+            "localisations_fusionnees": localisations,
+            "materiels_fusionnes": materiels
+        }
+
+    @staticmethod
+    def _merge(cursor, table: str, id_col: str, key_cols: list, refs: list, unique_refs: list = ()) -> int:
+        """
+        Reporte les références des doublons sur la ligne conservée puis les supprime.
+        Dans `unique_refs`, la colonne fait partie d'une clé unique: une référence
+        déjà présente pour la ligne conservée n'est pas dupliquée.
+        """
+        cols = ", ".join(key_cols)
+        not_null = " AND ".join(f"{c} IS NOT NULL" for c in key_cols)
+        join = " AND ".join(f"t.{c} = g.{c}" for c in key_cols)
+
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_doublon")
+        # Les clés avec une valeur NULL ne sont pas des doublons (comme pour la clé unique)
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE tmp_doublon (
+                ancien INT PRIMARY KEY,
+                garde INT NOT NULL
+            )
+            SELECT t.{id_col} AS ancien, g.garde
+            FROM {table} t
+            JOIN (
+                SELECT MIN({id_col}) AS garde, {cols}
+                FROM {table}
+                WHERE {not_null}
+                GROUP BY {cols}
+                HAVING COUNT(*) > 1
+            ) g ON {join}
+            WHERE t.{id_col} <> g.garde
+        """)
+
+        for ref_table, ref_col in refs:
+            cursor.execute(f"""
+                UPDATE {ref_table} r
+                JOIN tmp_doublon d ON r.{ref_col} = d.ancien
+                SET r.{ref_col} = d.garde
+            """)
+        for ref_table, ref_col in unique_refs:
+            # Lignes en collision laissées sur l'ancien identifiant, puis retirées
+            cursor.execute(f"""
+                UPDATE IGNORE {ref_table} r
+                JOIN tmp_doublon d ON r.{ref_col} = d.ancien
+                SET r.{ref_col} = d.garde
+            """)
+            cursor.execute(f"""
+                DELETE r FROM {ref_table} r
+                JOIN tmp_doublon d ON r.{ref_col} = d.ancien
+            """)
+        cursor.execute(f"""
+            DELETE t FROM {table} t
+            JOIN tmp_doublon d ON t.{id_col} = d.ancien
+        """)
+        fusionnes = cursor.rowcount
+        cursor.execute("DROP TEMPORARY TABLE tmp_doublon")
+        return fusionnes
+
+    @staticmethod
+    def ensure_unique_keys() -> list:
+        """Crée les clés uniques manquantes (et retire les index qu'elles remplacent)"""
+        query = """
+            SELECT DISTINCT table_name AS table_name, index_name AS index_name
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+            AND table_name IN ('localisation', 'materiel_physique')
+        """
+        existing = {
+            (r['table_name'], r['index_name'])
+            for r in execute_query(query, fetch=True)
+        }
+
+        created = []
+        for table, name, cols in UNIQUE_KEYS:
+            if (table, name) not in existing:
+                execute_query(f"ALTER TABLE {table} ADD UNIQUE KEY {name} ({cols})")
+                created.append(name)
+        for table, name in OBSOLETE_INDEXES:
+            if (table, name) in existing:
+                execute_query(f"ALTER TABLE {table} DROP INDEX {name}")
+        return created
@@ -0,0 +1,76 @@
+from config.database import execute_query
+from services.snapshot_delta_service import SnapshotDeltaService
+from utils.cache import data_version, diff_cache
+
+
+class DiffService:
+    """
+    Différences entre deux importations: matériels ajoutés, perdus et dont l'état a changé.
+
+    Les requêtes sont des anti-jointures sur snapshot_flat, index couvrant
+    (id_date_import, id_physique, etat): aucune lecture des lignes de la table.
+    Une importation stockée en delta pas encore reconstruite est lue le long de
+    sa chaîne (SnapshotDeltaService.state_source), sans écriture.
+    Le résultat d'une paire est mis en cache.
+    """
+
+    @staticmethod
+    def diff(date_ancienne: int, date_nouvelle: int) -> dict:
+        """
+        Retourne les id_snapshot ajoutés (dans la nouvelle importation), perdus
+        (dans l'ancienne) et modifiés (dans la nouvelle), triés par id décroissant,
+        ainsi que le nombre de matériels physiques distincts de chaque catégorie.
+        """
+        key = (data_version(), date_ancienne, date_nouvelle)
+        cached = diff_cache.get(key)
+        if cached is not None:
+            return cached
+
+        ancienne = SnapshotDeltaService.state_source(date_ancienne)
+        nouvelle = SnapshotDeltaService.state_source(date_nouvelle)
+
+        query_ajoutes = """
+            SELECT n.id_snapshot, n.id_physique
+            FROM {nouvelle} n
+            LEFT JOIN {ancienne} o
+                ON o.id_physique = n.id_physique
+            WHERE o.id_physique IS NULL
+            ORDER BY n.id_snapshot DESC
+        """
+        ajoutes = execute_query(
+            query_ajoutes.format(ancienne=ancienne, nouvelle=nouvelle), fetch=True, name="diff_ajoutes"
+        )
+
+        # Même anti-jointure dans l'autre sens
+        perdus = execute_query(
+            query_ajoutes.format(ancienne=nouvelle, nouvelle=ancienne), fetch=True, name="diff_perdus"
+        )
+
+        query_modifies = f"""
+            SELECT DISTINCT n.id_snapshot, n.id_physique, o.etat as etat_precedent
+            FROM {nouvelle} n
+            JOIN {ancienne} o
+                ON o.id_physique = n.id_physique
+            WHERE NOT (n.etat <=> o.etat)
+            ORDER BY n.id_snapshot DESC
+        """
+        modifies = execute_query(query_modifies, fetch=True, name="diff_modifies")
+
+        result = {
+            "ajoutes": [r['id_snapshot'] for r in ajoutes],
+            "perdus": [r['id_snapshot'] for r in perdus],
+            "modifies": list(dict.fromkeys(r['id_snapshot'] for r in modifies)),
+            "etats_precedents": {r['id_snapshot']: r['etat_precedent'] for r in modifies},
+            "compteurs": {
+                "ajoutes": len({r['id_physique'] for r in ajoutes}),
+                "perdus": len({r['id_physique'] for r in perdus}),
+                "modifies": len({r['id_physique'] for r in modifies})
+            }
+        }
+        diff_cache.set(key, result)
+        return result
+
+    @staticmethod
+    def counts(date_ancienne: int, date_nouvelle: int) -> dict:
+        """Nombre de matériels ajoutés, perdus et modifiés entre deux importations"""
+        return DiffService.diff(date_ancienne, date_nouvelle)["compteurs"]
@@ -0,0 +1,169 @@
+import os
+import threading
+from itertools import islice
+from typing import Dict, Optional
+
+from config.database import execute_query
+from services.bulk_import_service import collation_key
+from utils.cache import LRUCache
+from utils.metrics import IMPORT_DIMENSION_LOOKUPS
+
+# Nombre maximal d'entrées par référentiel (localisations, matériels physiques)
+DIMENSION_CACHE_SIZE = int(os.getenv("DIMENSION_CACHE_SIZE", "200000"))
+
+
+class DimensionCache:
+    """
+    Cache en mémoire des référentiels, partagé par les imports du processus:
+    (code, region, district, commune) -> code_localisation et
+    (code_localisation, nom_materiel, type) -> id_physique.
+
+    Les clés sont celles de BulkImportService (comparaison selon la collation).
+    Le cache est chargé en une requête par table au premier import, puis
+    complété par les imports: les identifiants résolus pendant un import ne
+    sont publiés qu'après validation de sa transaction (un rollback ne laisse
+    pas d'identifiant inexistant dans le cache).
+
+    Une fusion des référentiels (manage.py dedup-references, autre processus)
+    incrémente referentiel_generation.generation: chaque import relit ce
+    compteur et recharge le cache s'il a changé depuis le chargement.
+    """
+
+    def __init__(self, max_entries: int = DIMENSION_CACHE_SIZE):
+        self.localisations = LRUCache(max_entries)
+        self.materiels = LRUCache(max_entries)
+        self._loaded = False
+        self._generation = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def generation() -> int:
+        """Génération courante des référentiels (incrémentée par chaque fusion)"""
+        row = execute_query(
+            "SELECT generation FROM referentiel_generation WHERE id = 1",
+            fetchone=True, name="dimension_generation"
+        )
+        return row['generation'] if row else 0
+
+    def preload(self):
+        """
+        Charge les référentiels si le cache est vide ou si une fusion a eu lieu
+        depuis son chargement (une requête par table)
+        """
+        generation = DimensionCache.generation()
+        if self._loaded and generation == self._generation:
+            return
+        with self._lock:
+            if self._loaded and generation == self._generation:
+                return
+            # Identifiants fusionnés (supprimés) ailleurs: on repart de zéro
+            self.localisations.clear()
+            self.materiels.clear()
+
+            rows = execute_query("""
+                SELECT code_localisation, code, region, district, commune
+                FROM localisation
+                WHERE code IS NOT NULL AND region IS NOT NULL
+                AND district IS NOT NULL AND commune IS NOT NULL
+                ORDER BY code_localisation DESC
+            """, fetch=True, name="dimension_preload_localisation")
+            # Ordre décroissant: à clé égale, la plus petite valeur est écrite en dernier
+            for r in rows:
+                key = tuple(collation_key(r[c]) for c in ('code', 'region', 'district', 'commune'))
+                self.localisations.set(key, r['code_localisation'])
+
+            rows = execute_query("""
+                SELECT id_physique, code_localisation_ref, nom_materiel, type
+                FROM materiel_physique
+                ORDER BY id_physique DESC
+            """, fetch=True, name="dimension_preload_materiel")
+            for r in rows:
+                key = (r['code_localisation_ref'], collation_key(r['nom_materiel']), collation_key(r['type']))
+                self.materiels.set(key, r['id_physique'])
+
+            self._generation = generation
+            self._loaded = True
+
+    def invalidate(self):
+        """Vide le cache (référentiels modifiés hors import: fusion, suppression)"""
+        with self._lock:
+            self.localisations.clear()
+            self.materiels.clear()
+            self._loaded = False
+
+    def session(self) -> "DimensionSession":
+        """Session propre à un import"""
+        return DimensionSession(self)
+
+    def stats(self) -> dict:
+        return {
+            "localisations": self.localisations.stats(),
+            "materiels": self.materiels.stats()
+        }
+
+
+class DimensionSession:
+    """
+    Accès au cache pendant un import: compte les succès de ce seul import et
+    garde les identifiants résolus en attente jusqu'à publish()
+    """
+
+    def __init__(self, cache: DimensionCache):
+        self._cache = cache
+        self._staged_localisations: Dict[tuple, int] = {}
+        self._staged_materiels: Dict[tuple, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def localisation(self, key: tuple) -> Optional[int]:
+        return self._get(self._staged_localisations, self._cache.localisations, key)
+
+    def materiel(self, key: tuple) -> Optional[int]:
+        return self._get(self._staged_materiels, self._cache.materiels, key)
+
+    def stage_localisations(self, resolved: Dict[tuple, int]):
+        self._staged_localisations.update(resolved)
+
+    def stage_materiels(self, resolved: Dict[tuple, int]):
+        self._staged_materiels.update(resolved)
+
+    def mark(self) -> tuple:
+        """Position des identifiants en attente (avant un lot)"""
+        return len(self._staged_localisations), len(self._staged_materiels)
+
+    def rollback_to(self, mark: tuple):
+        """Oublie les identifiants résolus depuis `mark` (lot annulé par un savepoint)"""
+        self._staged_localisations = dict(islice(self._staged_localisations.items(), mark[0]))
+        self._staged_materiels = dict(islice(self._staged_materiels.items(), mark[1]))
+
+    def publish(self):
+        """Publie dans le cache partagé les identifiants de l'import validé"""
+        for key, value in self._staged_localisations.items():
+            self._cache.localisations.set(key, value)
+        for key, value in self._staged_materiels.items():
+            self._cache.materiels.set(key, value)
+        self._staged_localisations.clear()
+        self._staged_materiels.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def _get(self, staged: dict, shared: LRUCache, key: tuple) -> Optional[int]:
+        value = staged.get(key)
+        if value is None:
+            value = shared.get(key)
+        if value is None:
+            self.misses += 1
+            IMPORT_DIMENSION_LOOKUPS.inc(result="miss")
+        else:
+            self.hits += 1
+            IMPORT_DIMENSION_LOOKUPS.inc(result="hit")
+        return value
+
+
+dimension_cache = DimensionCache()
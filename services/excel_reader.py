@@ -0,0 +1,88 @@
+from typing import Iterator, List, Optional
+
+from openpyxl import load_workbook
+
+# Colonnes lues dans le fichier Excel
+COLONNES_EXCEL = [
+    'code',
+    'region',
+    'district',
+    'commune',
+    'nom_materiel',
+    'etat_materiel',
+    'type_materiel',
+    'motif',
+    'achat_consommable',
+    'compatibilite_consomm'
+]
+
+
+class ExcelRowReader:
+    """
+    Lecture en flux d'une feuille Excel (openpyxl en mode read_only).
+
+    Les lignes sont produites brutes, par lots de taille fixe: la mémoire
+    utilisée dépend de la taille d'un lot, pas de celle du fichier. Le
+    nettoyage est fait par CleaningService.
+
+    Usage:
+        with ExcelRowReader(file_path) as reader:
+            for batch in reader.batches(5000):
+                ...
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._workbook = None
+        self._rows = None
+        self._index = {}
+        self.lignes_estimees: Optional[int] = None
+
+    def __enter__(self):
+        self._workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        sheet = self._workbook.active
+        self._rows = sheet.iter_rows(values_only=True)
+
+        header = next(self._rows, None) or ()
+        self._index = {
+            str(name).strip(): i
+            for i, name in enumerate(header)
+            if name is not None
+        }
+
+        # Dimension déclarée par le fichier (peut être absente ou inexacte)
+        if sheet.max_row:
+            self.lignes_estimees = max(sheet.max_row - 1, 0)
+        return self
+
+    def __exit__(self, *args):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+    def batches(self, batch_size: int, skip: int = 0) -> Iterator[List[dict]]:
+        """
+        Produit les lignes (dict par colonne attendue) par lots de `batch_size`.
+        Les `skip` premières lignes non vides sont ignorées (reprise d'un import).
+        """
+        batch = []
+
+        for values in self._rows:
+            if values is None or all(v is None for v in values):
+                continue
+            if skip:
+                skip -= 1
+                continue
+
+            record = {}
+            for col in COLONNES_EXCEL:
+                i = self._index.get(col)
+                record[col] = values[i] if i is not None and i < len(values) else None
+
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
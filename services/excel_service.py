@@ -1,202 +1,246 @@
-import pandas as pd
+import os
 from config.database import execute_query, execute_many, Database
+from services.bulk_import_service import BulkImportService
+from services.excel_reader import ExcelRowReader
+from services.cleaning_service import CleaningService
+from services.dimension_cache import dimension_cache
+from services.aggregate_service import AggregateService
+from services.partition_service import PartitionService
+from services.lifecycle_service import LifecycleService
+from services.snapshot_delta_service import SnapshotDeltaService, SNAPSHOT_STORAGE, STOCKAGE_DELTA
 from datetime import date
+from utils.helpers import encode_cursor
 from typing import Optional
 import mysql.connector
 
+# Statuts d'une date d'importation: seules les importations terminées sont lues
+IMPORT_EN_COURS = "en_cours"
+IMPORT_TERMINE = "termine"
+
+# Erreur MySQL "Lock wait timeout exceeded": seule l'instruction est annulée,
+# le lot peut être rejoué depuis son savepoint
+ER_LOCK_WAIT_TIMEOUT = 1205
+
 class ExcelService:
+    # Lignes Excel lues et écrites en base par lot (mémoire bornée)
+    READ_BATCH_SIZE = int(os.getenv("IMPORT_READ_BATCH_SIZE", "5000"))
+    
+    # Lignes entre deux validations intermédiaires (points de reprise)
+    CHECKPOINT_ROWS = int(os.getenv("IMPORT_CHECKPOINT_ROWS", "50000"))
+    
+    # Nouvelles tentatives d'un lot après un dépassement d'attente de verrou
+    BATCH_RETRIES = int(os.getenv("IMPORT_BATCH_RETRIES", "2"))
+    
     @staticmethod
-    def process_excel_file(file_path: str, user_id: int, filename: str):
-        """Traite un fichier Excel et insère les données dans la BD"""
-        
-        # Lire le fichier Excel
-        df = pd.read_excel(file_path, engine='openpyxl')
-        
-        # Colonnes attendues
-        colonnes_attendues = {
-            'code': 'code',
-            'region': 'region',
-            'district': 'district',
-            'commune': 'commune',
-            'nom_materiel': 'nom_materiel',
-            'etat_materiel': 'etat_materiel',
-            'type_materiel': 'type_materiel',
-            'motif': 'motif',
-            'achat_consommable': 'achat_consommable',
-            'compatibilite_consomm': 'compatibilite_consomm'
-        }
-        
-        # Renommer les colonnes pour uniformiser
-        df.columns = df.columns.str.strip()
-        
-        # Remplacer NaN par None (NULL en SQL)
-        df = df.where(pd.notna(df), None)
-        
-        # Hériter des valeurs pour code, region, district, commune
-        colonnes_heritage = ['code', 'region', 'district', 'commune']
-        for col in colonnes_heritage:
-            if col in df.columns:
-                df[col] = df[col].fillna(method='ffill')
-        
-        # Créer une date d'importation
-        query_date = "INSERT INTO date_import (date_complet) VALUES (CURRENT_DATE)"
-        id_date_import = execute_query(query_date)
-        
-        # Enregistrer l'upload dans l'historique
-        query_history = """
-            INSERT INTO upload_history (filename, user_id) 
-            VALUES (%s, %s)
+    def process_excel_file(file_path: str, user_id: int, filename: str, progress=None,
+                           checkpoint=None, reprise: Optional[dict] = None,
+                           file_hash: Optional[str] = None):
         """
-        execute_query(query_history, (filename, user_id))
-        
-        lignes_inserees = 0
-        
-        # Traiter chaque ligne
-        with Database.get_cursor() as cursor:
-            for _, row in df.iterrows():
-                try:
-                    # Extraire les données
-                    code = row.get('code')
-                    region = row.get('region')
-                    district = row.get('district')
-                    commune = row.get('commune')
-                    nom_materiel = row.get('nom_materiel')
-                    etat = row.get('etat_materiel')
-                    type_materiel = row.get('type_materiel')
-                    motif = row.get('motif')
-                    achat_consommable = row.get('achat_consommable')
-                    compatibilite_consomm = row.get('compatibilite_consomm')
-                    
-                    # Normaliser les valeurs vides
-                    code = None if pd.isna(code) or str(code).strip() == '' else str(code).strip()
-                    region = None if pd.isna(region) or str(region).strip() == '' else str(region).strip()
-                    district = None if pd.isna(district) or str(district).strip() == '' else str(district).strip()
-                    commune = None if pd.isna(commune) or str(commune).strip() == '' else str(commune).strip()
-                    nom_materiel = None if pd.isna(nom_materiel) or str(nom_materiel).strip() == '' else str(nom_materiel).strip()
-                    etat = None if pd.isna(etat) or str(etat).strip() == '' else str(etat).strip()
-                    type_materiel = None if pd.isna(type_materiel) or str(type_materiel).strip() == '' else str(type_materiel).strip()
-                    
-                    # Skip si nom_materiel est vide
-                    if not nom_materiel:
-                        continue
-                    
-                    # 1. Gérer la localisation
-                    code_localisation_id = ExcelService._get_or_create_localisation(
-                        cursor, code, region, district, commune
+        Traite un fichier Excel et insère les données dans la BD.
+        
+        Le fichier est lu en flux, par lots de READ_BATCH_SIZE lignes, sur une seule
+        connexion. La date d'importation reste "en_cours" (invisible des lectures)
+        jusqu'à la validation finale, qui enregistre aussi l'historique d'upload.
+        Toutes les CHECKPOINT_ROWS lignes, le travail est validé;
+        `checkpoint(cursor, etat)` enregistre juste avant l'état de reprise sur le
+        curseur de l'import, validé avec les lignes. `reprise` (un tel état)
+        reprend un import interrompu après le dernier lot validé.
+        
+        `progress(lignes_traitees, lignes_total)` permet de suivre l'avancement
+        (lignes_total est estimé d'après les dimensions de la feuille).
+        `file_hash` (SHA-256 du fichier) est enregistré dans l'historique.
+        """
+        reprise = reprise or {}
+        
+        # Ouvrir le fichier avant de créer l'importation: un fichier illisible
+        # ne laisse pas de date d'importation vide
+        with ExcelRowReader(file_path) as reader:
+            lignes_total = reader.lignes_estimees or 0
+            
+            id_date_import = reprise.get('id_date_import')
+            lignes_lues = reprise.get('lignes_validees', 0)
+            lignes_inserees = reprise.get('lignes_inserees', 0)
+            heritage = dict(reprise.get('heritage') or {})
+            
+            # Référentiels déjà connus: résolus en mémoire sans requête
+            dimension_cache.preload()
+            dimensions = dimension_cache.session()
+            
+            # Tables partitionnées: la partition de l'import est créée avant la
+            # transaction (un ALTER TABLE valide implicitement la transaction en
+            # cours), la date d'importation aussi, enregistrée comme point de reprise
+            if PartitionService.is_partitioned():
+                if id_date_import is None:
+                    with Database.get_cursor() as cursor:
+                        cursor.execute(
+                            "INSERT INTO date_import (date_complet, statut) VALUES (CURRENT_DATE, %s)",
+                            (IMPORT_EN_COURS,)
+                        )
+                        id_date_import = cursor.lastrowid
+                        if checkpoint:
+                            checkpoint(cursor, {
+                                "id_date_import": id_date_import,
+                                "lignes_validees": 0,
+                                "lignes_inserees": 0,
+                                "heritage": heritage
+                            })
+                PartitionService.ensure_partition(id_date_import)
+            
+            with Database.get_transaction() as (connection, cursor):
+                if id_date_import is None:
+                    cursor.execute(
+                        "INSERT INTO date_import (date_complet, statut) VALUES (CURRENT_DATE, %s)",
+                        (IMPORT_EN_COURS,)
                     )
-                    
-                    # 2. Gérer le matériel physique (référentiel persistant)
-                    id_physique = ExcelService._get_or_create_materiel_physique(
-                        cursor, code_localisation_id, nom_materiel, type_materiel
+                    id_date_import = cursor.lastrowid
+                
+                def enregistrer_reprise():
+                    # Même transaction que les lignes: la reprise ne rejoue jamais un lot validé
+                    if checkpoint:
+                        checkpoint(cursor, {
+                            "id_date_import": id_date_import,
+                            "lignes_validees": lignes_lues,
+                            "lignes_inserees": lignes_inserees,
+                            "heritage": heritage
+                        })
+                
+                def valider():
+                    enregistrer_reprise()
+                    connection.commit()
+                    dimensions.publish()
+                
+                if progress:
+                    progress(lignes_lues, max(lignes_total, lignes_lues))
+                
+                derniere_validation = lignes_lues
+                for batch in reader.batches(ExcelService.READ_BATCH_SIZE, skip=lignes_lues):
+                    lignes_inserees += ExcelService._import_batch(
+                        cursor, batch, heritage, id_date_import, dimensions
                     )
+                    lignes_lues += len(batch)
                     
-                    # 3. Créer un snapshot dans materiel_informatique
-                    query_snapshot = """
-                        INSERT INTO materiel_informatique 
-                        (id_physique, etat, id_date_import) 
-                        VALUES (%s, %s, %s)
-                    """
-                    cursor.execute(query_snapshot, (id_physique, etat, id_date_import))
-                    id_snapshot = cursor.lastrowid
-                    
-                    # 4. Gérer les incidents (si motif existe)
-                    if motif and str(motif).strip() != '':
-                        query_incident = """
-                            INSERT INTO incident 
-                            (motif, compatibilite_consommable, achat_consommable, id_materiel) 
-                            VALUES (%s, %s, %s, %s)
-                        """
-                        cursor.execute(query_incident, (
-                            motif, 
-                            compatibilite_consomm, 
-                            achat_consommable, 
-                            id_snapshot
-                        ))
+                    if lignes_lues - derniere_validation >= ExcelService.CHECKPOINT_ROWS:
+                        valider()
+                        derniere_validation = lignes_lues
                     
-                    lignes_inserees += 1
-                    
-                except Exception as e:
-                    print(f"Erreur lors du traitement de la ligne: {e}")
-                    continue
+                    if progress:
+                        progress(lignes_lues, max(lignes_total, lignes_lues))
+                
+                # Statistiques précalculées de cet import
+                AggregateService.build(cursor, id_date_import)
+                
+                # Enregistrer l'upload dans l'historique
+                cursor.execute("""
+                    INSERT INTO upload_history (filename, user_id, file_hash, id_date_import) 
+                    VALUES (%s, %s, %s, %s)
+                """, (filename, user_id, file_hash, id_date_import))
+                
+                # L'importation devient visible avec la validation finale
+                cursor.execute(
+                    "UPDATE date_import SET statut = %s WHERE id_date = %s",
+                    (IMPORT_TERMINE, id_date_import)
+                )
+                enregistrer_reprise()
+            
+            # Transaction validée: les nouveaux identifiants peuvent être partagés
+            dimensions.publish()
+        
+        # Cycle de vie des matériels: l'importation est déjà validée, un échec
+        # ici est rattrapé par l'import suivant
+        try:
+            LifecycleService.catch_up()
+        except Exception as e:
+            print(f"Erreur lors de la mise à jour du cycle de vie (import {id_date_import}): {e}")
+        
+        # Stockage en delta: l'importation précédente ne garde que ses changements
+        # (en cas d'échec elle reste complète, ce qui reste valide)
+        if SNAPSHOT_STORAGE == STOCKAGE_DELTA:
+            try:
+                SnapshotDeltaService.compact_previous(id_date_import)
+            except Exception as e:
+                print(f"Erreur lors du compactage de l'importation précédant {id_date_import}: {e}")
         
         return {
             "lignes_inserees": lignes_inserees,
             "id_date_import": id_date_import,
-            "date_import": date.today()
+            "date_import": date.today(),
+            "cache_dimensions": dimensions.stats()
         }
     
     @staticmethod
-    def _get_or_create_localisation(cursor, code, region, district, commune):
-        """Récupère ou crée une localisation"""
-        # Vérifier si la localisation existe
-        query_check = """
-            SELECT code_localisation 
-            FROM localisation 
-            WHERE code = %s AND region = %s AND district = %s AND commune = %s
+    def _import_batch(cursor, batch: list, heritage: dict, id_date_import: int, dimensions) -> int:
         """
-        cursor.execute(query_check, (code, region, district, commune))
-        result = cursor.fetchone()
-        
-        if result:
-            return result['code_localisation']
-        
-        # Créer la localisation
-        query_insert = """
-            INSERT INTO localisation (code, region, district, commune) 
-            VALUES (%s, %s, %s, %s)
+        Nettoie et insère un lot sous un savepoint: après un dépassement d'attente
+        de verrou, le lot est annulé seul puis rejoué.
         """
-        cursor.execute(query_insert, (code, region, district, commune))
-        return cursor.lastrowid
+        heritage_avant = dict(heritage)
+        tentative = 0
+        while True:
+            mark = dimensions.mark()
+            cursor.execute("SAVEPOINT lot_import")
+            try:
+                rows = CleaningService.clean_batch(batch, heritage)
+                inserees = BulkImportService.import_rows(cursor, rows, id_date_import, dimensions=dimensions)
+                cursor.execute("RELEASE SAVEPOINT lot_import")
+                return inserees
+            except mysql.connector.Error as e:
+                if e.errno != ER_LOCK_WAIT_TIMEOUT or tentative >= ExcelService.BATCH_RETRIES:
+                    raise
+                tentative += 1
+                print(f"Import {id_date_import}: attente de verrou dépassée, lot rejoué ({tentative})")
+                cursor.execute("ROLLBACK TO SAVEPOINT lot_import")
+                dimensions.rollback_to(mark)
+                heritage.clear()
+                heritage.update(heritage_avant)
     
     @staticmethod
-    def _get_or_create_materiel_physique(cursor, code_localisation_id, nom_materiel, type_materiel):
-        """Récupère ou crée un matériel physique"""
-        # Vérifier si le matériel physique existe déjà
-        query_check = """
-            SELECT id_physique 
-            FROM materiel_physique 
-            WHERE code_localisation_ref = %s 
-            AND nom_materiel = %s 
-            AND type = %s
+    def get_upload_history(skip: int = 0, limit: int = 10, after: Optional[dict] = None):
         """
-        cursor.execute(query_check, (code_localisation_id, nom_materiel, type_materiel))
-        result = cursor.fetchone()
-        
-        if result:
-            return result['id_physique']
-        
-        # Créer le matériel physique
-        query_insert = """
-            INSERT INTO materiel_physique 
-            (code_localisation_ref, nom_materiel, type) 
-            VALUES (%s, %s, %s)
+        Récupère l'historique des uploads.
+        `after` ({"date", "id"} du dernier upload vu) remplace skip pour la pagination par curseur.
         """
-        cursor.execute(query_insert, (code_localisation_id, nom_materiel, type_materiel))
-        return cursor.lastrowid
-    
-    @staticmethod
-    def get_upload_history(skip: int = 0, limit: int = 10):
-        """Récupère l'historique des uploads"""
         query_count = "SELECT COUNT(*) as total FROM upload_history"
-        total_result = execute_query(query_count, fetch=True)
+        total_result = execute_query(query_count, fetch=True, name="historique_count")
         total = total_result[0]['total'] if total_result else 0
         
-        query = """
-            SELECT 
-                uh.id_upload,
-                uh.filename,
-                uh.upload_date,
-                u.mail as user_mail
-            FROM upload_history uh
-            LEFT JOIN users u ON uh.user_id = u.id
-            ORDER BY uh.upload_date DESC
-            LIMIT %s OFFSET %s
-        """
-        results = execute_query(query, (limit, skip), fetch=True)
+        if after:
+            query = """
+                SELECT 
+                    uh.id_upload,
+                    uh.filename,
+                    uh.upload_date,
+                    u.mail as user_mail
+                FROM upload_history uh
+                LEFT JOIN users u ON uh.user_id = u.id
+                WHERE uh.upload_date < %s
+                OR (uh.upload_date = %s AND uh.id_upload < %s)
+                ORDER BY uh.upload_date DESC, uh.id_upload DESC
+                LIMIT %s
+            """
+            results = execute_query(query, (after['date'], after['date'], after['id'], limit), fetch=True, name="historique_page_curseur")
+        else:
+            query = """
+                SELECT 
+                    uh.id_upload,
+                    uh.filename,
+                    uh.upload_date,
+                    u.mail as user_mail
+                FROM upload_history uh
+                LEFT JOIN users u ON uh.user_id = u.id
+                ORDER BY uh.upload_date DESC, uh.id_upload DESC
+                LIMIT %s OFFSET %s
+            """
+            results = execute_query(query, (limit, skip), fetch=True, name="historique_page")
+        
+        next_cursor = None
+        if len(results) == limit:
+            last = results[-1]
+            next_cursor = encode_cursor({"date": last['upload_date'].isoformat(), "id": last['id_upload']})
         
         return {
             "total": total,
             "skip": skip,
             "limit": limit,
+            "next_cursor": next_cursor,
             "data": results
-        }
\ No newline at end of file
+        }
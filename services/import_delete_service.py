@@ -0,0 +1,129 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config.database import Database, execute_query
+from services.lifecycle_service import LifecycleService
+from services.partition_service import PartitionService
+from services.snapshot_delta_service import SnapshotDeltaService
+from utils.cache import bump_data_version
+
+# Snapshots supprimés par transaction: chaque lot ne verrouille que peu de lignes
+DELETE_CHUNK_SIZE = int(os.getenv("IMPORT_DELETE_CHUNK_SIZE", "5000"))
+
+# Importation masquée aux lectures en attendant la fin de sa suppression
+STATUT_SUPPRESSION = "suppression"
+
+
+class ImportDeleteService:
+    """Suppression d'une importation complète (snapshots, incidents, synthèses)"""
+
+    # Un seul worker: les suppressions s'enchaînent sans se disputer les verrous
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suppression")
+
+    @staticmethod
+    def request_delete(id_date_import: int) -> Optional[str]:
+        """
+        Masque une importation terminée (statut 'suppression') puis planifie sa
+        suppression en arrière-plan. Retourne le statut de l'importation avant la
+        demande (None si elle n'existe pas); seule une importation terminée ou déjà
+        en suppression est supprimée.
+        """
+        row = execute_query(
+            "SELECT statut FROM date_import WHERE id_date = %s",
+            (id_date_import,), fetchone=True, name="import_statut"
+        )
+        if not row:
+            return None
+
+        if row['statut'] == 'termine':
+            with Database.get_cursor() as cursor:
+                cursor.execute(
+                    "UPDATE date_import SET statut = %s WHERE id_date = %s AND statut = 'termine'",
+                    (STATUT_SUPPRESSION, id_date_import)
+                )
+                # L'importation disparaît des réponses en cache de tous les workers:
+                # version partagée incrémentée dans la même transaction
+                bump_data_version(cursor)
+        if row['statut'] in ('termine', STATUT_SUPPRESSION):
+            ImportDeleteService._executor.submit(ImportDeleteService._run, id_date_import)
+        return row['statut']
+
+    @staticmethod
+    def resume_pending() -> int:
+        """Reprend au démarrage les suppressions interrompues"""
+        rows = execute_query(
+            "SELECT id_date FROM date_import WHERE statut = %s ORDER BY id_date",
+            (STATUT_SUPPRESSION,), fetch=True
+        )
+        for row in rows:
+            ImportDeleteService._executor.submit(ImportDeleteService._run, row['id_date'])
+        return len(rows)
+
+    @staticmethod
+    def _run(id_date_import: int):
+        """Suppression planifiée (worker)"""
+        try:
+            supprimes = ImportDeleteService.delete_import(id_date_import)
+            print(f"Importation {id_date_import} supprimée ({supprimes} snapshots)")
+            LifecycleService.catch_up()
+        except Exception as e:
+            print(f"Erreur lors de la suppression de l'importation {id_date_import}: {e}")
+        finally:
+            bump_data_version()
+
+    @staticmethod
+    def delete_import(id_date_import: int) -> int:
+        """
+        Supprime les données d'une importation par lots de DELETE_CHUNK_SIZE
+        snapshots, chacun dans une transaction courte (ou en retirant sa
+        partition si les tables sont partitionnées), puis la date d'importation
+        (les synthèses stat_import_resume et stat_cube suivent par ON DELETE CASCADE).
+        Retourne le nombre de snapshots supprimés.
+        """
+        # Importations stockées en delta par rapport à celle-ci: redeviennent complètes
+        with Database.get_cursor() as cursor:
+            SnapshotDeltaService.detach(cursor, id_date_import)
+
+        supprimes = 0
+        if PartitionService.is_partitioned():
+            result = execute_query(
+                "SELECT COUNT(*) AS total FROM materiel_informatique WHERE id_date_import = %s",
+                (id_date_import,), fetchone=True, name="import_snapshots_total"
+            )
+            supprimes = result['total'] if result else 0
+            PartitionService.drop_partition(id_date_import)
+        # Lignes hors partition propre (tables non partitionnées)
+        while True:
+            with Database.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT id_snapshot
+                    FROM materiel_informatique
+                    WHERE id_date_import = %s
+                    ORDER BY id_snapshot
+                    LIMIT %s
+                """, (id_date_import, DELETE_CHUNK_SIZE))
+                ids = [r['id_snapshot'] for r in cursor.fetchall()]
+                if not ids:
+                    break
+
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f"DELETE FROM incident WHERE id_materiel IN ({placeholders})", ids)
+                cursor.execute(
+                    f"DELETE FROM snapshot_flat WHERE id_date_import = %s AND id_snapshot IN ({placeholders})",
+                    [id_date_import] + ids
+                )
+                cursor.execute(f"DELETE FROM materiel_informatique WHERE id_snapshot IN ({placeholders})", ids)
+            supprimes += len(ids)
+
+        with Database.get_cursor() as cursor:
+            # Cycle de vie à reconstruire sans cette importation
+            cursor.execute("SELECT cycle_vie FROM date_import WHERE id_date = %s", (id_date_import,))
+            row = cursor.fetchone()
+            if row and row['cycle_vie']:
+                LifecycleService.invalidate(cursor)
+            # L'historique des uploads est conservé, sans lien vers l'importation
+            cursor.execute("UPDATE upload_history SET id_date_import = NULL WHERE id_date_import = %s", (id_date_import,))
+            cursor.execute("DELETE FROM date_import WHERE id_date = %s", (id_date_import,))
+
+        return supprimes
@@ -0,0 +1,359 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import mysql.connector
+
+from config.database import Database, execute_query
+from services.excel_service import ExcelService
+from services.import_delete_service import ImportDeleteService
+from utils.cache import bump_data_version
+from utils.metrics import IMPORT_BYTES, IMPORT_DURATION, IMPORT_JOBS, IMPORT_ROWS, IMPORT_ROWS_PER_SECOND
+
+# Nombre d'imports traités en parallèle
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+
+# Battement d'un import en cours; au-delà du délai, son worker est considéré mort
+IMPORT_HEARTBEAT_SECONDS = int(os.getenv("IMPORT_HEARTBEAT_SECONDS", "30"))
+IMPORT_HEARTBEAT_TIMEOUT = int(os.getenv("IMPORT_HEARTBEAT_TIMEOUT", "120"))
+
+STATUT_EN_ATTENTE = "en_attente"
+STATUT_EN_COURS = "en_cours"
+STATUT_TERMINE = "termine"
+STATUT_ECHEC = "echec"
+# Réponse d'upload: fichier identique déjà importé ou en cours d'import (pas de job créé)
+STATUT_DEJA_IMPORTE = "deja_importe"
+
+# Clé unique uk_hash_actif: import du même fichier déjà en file ou en cours
+ER_DUP_ENTRY = 1062
+
+
+class ImportJobService:
+    """File d'imports Excel exécutés en arrière-plan, persistée dans la table import_job"""
+
+    _executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+    _arret_surveillance = threading.Event()
+
+    @staticmethod
+    def worker_id() -> str:
+        """Identifiant du processus qui exécute un import (hôte:pid)"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def submit(file_path: str, filename: str, user_id: int, file_hash: Optional[str] = None) -> Optional[str]:
+        """
+        Enregistre un import et le place dans la file des workers. Retourne None
+        si un import du même fichier est déjà en file ou en cours (clé unique
+        sur l'empreinte des imports actifs: deux uploads simultanés ne créent
+        qu'un job).
+        """
+        id_job = str(uuid.uuid4())
+        query = """
+            INSERT INTO import_job (id_job, filename, file_path, file_hash, user_id, statut)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """
+        try:
+            execute_query(query, (id_job, filename, file_path, file_hash, user_id, STATUT_EN_ATTENTE))
+        except mysql.connector.IntegrityError as e:
+            if e.errno == ER_DUP_ENTRY:
+                return None
+            raise
+        ImportJobService._executor.submit(ImportJobService._run, id_job)
+        return id_job
+
+    @staticmethod
+    def find_duplicate(file_hash: str, termines: bool = True) -> Optional[dict]:
+        """
+        Cherche un fichier identique déjà importé ({"id_date_import": ...}, sauf
+        si `termines` est faux) ou en file / en cours d'import ({"id_job": ...})
+        """
+        query = """
+            SELECT uh.id_date_import
+            FROM upload_history uh
+            JOIN date_import di ON di.id_date = uh.id_date_import AND di.statut = 'termine'
+            WHERE uh.file_hash = %s
+            ORDER BY uh.id_upload DESC
+            LIMIT 1
+        """
+        existing = execute_query(query, (file_hash,), fetchone=True, name="upload_hash") if termines else None
+        if existing:
+            return {"id_date_import": existing['id_date_import']}
+
+        query = """
+            SELECT id_job
+            FROM import_job
+            WHERE file_hash = %s AND statut IN (%s, %s)
+            ORDER BY created_at DESC
+            LIMIT 1
+        """
+        pending = execute_query(query, (file_hash, STATUT_EN_ATTENTE, STATUT_EN_COURS), fetchone=True, name="import_job_hash")
+        if pending:
+            return {"id_job": pending['id_job']}
+        return None
+
+    @staticmethod
+    def get_job(id_job: str) -> Optional[dict]:
+        """Récupère l'état d'un import avec son débit"""
+        query = """
+            SELECT id_job, filename, statut, lignes_total, lignes_traitees,
+                   id_date_import, taux_cache_dimensions, erreur,
+                   created_at, started_at, finished_at
+            FROM import_job
+            WHERE id_job = %s
+        """
+        job = execute_query(query, (id_job,), fetchone=True, name="import_job_statut")
+        if not job:
+            return None
+
+        job['lignes_par_seconde'] = 0.0
+        if job['started_at']:
+            end = job['finished_at'] or datetime.now()
+            elapsed = (end - job['started_at']).total_seconds()
+            if elapsed > 0:
+                job['lignes_par_seconde'] = round(job['lignes_traitees'] / elapsed, 2)
+        return job
+
+    @staticmethod
+    def resume_pending():
+        """
+        Relance au démarrage les imports restés en file ou interrompus. Chaque
+        worker gunicorn l'appelle: sont remis en file les imports en cours sans
+        battement depuis IMPORT_HEARTBEAT_TIMEOUT, et ceux d'un processus de cet
+        hôte qui n'existe plus (redémarrage rapide après un arrêt brutal). Un
+        import n'est exécuté que par le worker qui l'a réclamé (_run).
+        """
+        # Un import interrompu reprend après son dernier point de reprise
+        ImportJobService.reclaim_stale()
+        ImportJobService._reclaim_dead_local()
+
+        query = "SELECT id_job FROM import_job WHERE statut = %s ORDER BY created_at"
+        jobs = execute_query(query, (STATUT_EN_ATTENTE,), fetch=True)
+        for job in jobs:
+            ImportJobService._executor.submit(ImportJobService._run, job['id_job'])
+        return len(jobs)
+
+    @staticmethod
+    def reclaim_stale() -> list:
+        """Remet en file les imports en cours sans battement depuis IMPORT_HEARTBEAT_TIMEOUT"""
+        rows = execute_query("""
+            SELECT id_job, worker_id
+            FROM import_job
+            WHERE statut = %s
+            AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - INTERVAL %s SECOND)
+        """, (STATUT_EN_COURS, IMPORT_HEARTBEAT_TIMEOUT), fetch=True, name="import_job_perimes")
+        return [r['id_job'] for r in rows if ImportJobService._requeue(r['id_job'], r['worker_id'])]
+
+    @staticmethod
+    def _reclaim_dead_local() -> list:
+        """Remet en file les imports en cours d'un processus de cet hôte qui n'existe plus"""
+        hote = socket.gethostname()
+        rows = execute_query(
+            "SELECT id_job, worker_id FROM import_job WHERE statut = %s AND worker_id LIKE %s",
+            (STATUT_EN_COURS, f"{hote}:%"), fetch=True, name="import_job_locaux"
+        )
+        return [
+            r['id_job'] for r in rows
+            if not ImportJobService._worker_alive(r['worker_id'])
+            and ImportJobService._requeue(r['id_job'], r['worker_id'])
+        ]
+
+    @staticmethod
+    def _worker_alive(worker_id: str) -> bool:
+        """Processus local encore en vie (au démarrage, ce processus n'exécute encore aucun import)"""
+        if worker_id == ImportJobService.worker_id():
+            return False
+        try:
+            os.kill(int(worker_id.rsplit(":", 1)[1]), 0)
+        except (ValueError, IndexError, ProcessLookupError):
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def _requeue(id_job: str, worker_id: Optional[str]) -> bool:
+        """Remet un import en file s'il est toujours en cours pour ce worker"""
+        with Database.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE import_job
+                SET statut = %s, worker_id = NULL
+                WHERE id_job = %s AND statut = %s AND worker_id <=> %s
+            """, (STATUT_EN_ATTENTE, id_job, STATUT_EN_COURS, worker_id))
+            return cursor.rowcount == 1
+
+    @staticmethod
+    def start_reaper():
+        """
+        Reprend périodiquement (IMPORT_HEARTBEAT_SECONDS) les imports dont le
+        worker ne bat plus, sans attendre un redémarrage
+        """
+        threading.Thread(target=ImportJobService._reap, name="imports-perimes", daemon=True).start()
+
+    @staticmethod
+    def _reap():
+        while not ImportJobService._arret_surveillance.wait(IMPORT_HEARTBEAT_SECONDS):
+            try:
+                for id_job in ImportJobService.reclaim_stale():
+                    ImportJobService._executor.submit(ImportJobService._run, id_job)
+            except Exception as e:
+                print(f"Erreur lors de la reprise des imports interrompus: {e}")
+
+    @staticmethod
+    def shutdown():
+        """Arrête les workers sans attendre les imports en file"""
+        ImportJobService._arret_surveillance.set()
+        ImportJobService._executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _run(id_job: str):
+        """Exécute (ou reprend) un import dans un worker"""
+        query = """
+            SELECT id_job, filename, file_path, file_hash, user_id, statut,
+                   id_date_import, lignes_validees, lignes_inserees, heritage
+            FROM import_job
+            WHERE id_job = %s
+        """
+        job = execute_query(query, (id_job,), fetchone=True)
+        if not job or job['statut'] != STATUT_EN_ATTENTE:
+            return
+
+        # Réclamation atomique: un seul worker passe l'import en cours
+        with Database.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE import_job
+                SET statut = %s, started_at = COALESCE(started_at, NOW()),
+                    worker_id = %s, heartbeat_at = NOW()
+                WHERE id_job = %s AND statut = %s
+            """, (STATUT_EN_COURS, ImportJobService.worker_id(), id_job, STATUT_EN_ATTENTE))
+            if cursor.rowcount == 0:
+                return
+
+        arret = threading.Event()
+        battement = threading.Thread(
+            target=ImportJobService._heartbeat, args=(id_job, arret),
+            name=f"battement-{id_job[:8]}", daemon=True
+        )
+        battement.start()
+
+        def progress(lignes_traitees, lignes_total):
+            execute_query(
+                "UPDATE import_job SET lignes_traitees = %s, lignes_total = %s WHERE id_job = %s",
+                (lignes_traitees, lignes_total, id_job)
+            )
+
+        def checkpoint(cursor, etat):
+            # Curseur de l'import: le point de reprise est validé avec les lignes
+            cursor.execute("""
+                UPDATE import_job
+                SET id_date_import = %s, lignes_validees = %s, lignes_inserees = %s, heritage = %s
+                WHERE id_job = %s
+            """, (
+                etat['id_date_import'], etat['lignes_validees'], etat['lignes_inserees'],
+                json.dumps(etat['heritage'], ensure_ascii=False), id_job
+            ))
+
+        # Import interrompu après un point de reprise: on repart de là
+        reprise = None
+        if job['id_date_import'] is not None:
+            reprise = {
+                "id_date_import": job['id_date_import'],
+                "lignes_validees": job['lignes_validees'],
+                "lignes_inserees": job['lignes_inserees'],
+                "heritage": json.loads(job['heritage']) if job['heritage'] else {}
+            }
+
+        start = time.perf_counter()
+        try:
+            if not os.path.exists(job['file_path']):
+                raise FileNotFoundError(f"Fichier introuvable: {job['filename']}")
+            taille = os.path.getsize(job['file_path'])
+
+            # Interrompu après la validation finale: l'importation est déjà complète
+            if reprise and ImportJobService._import_termine(reprise['id_date_import']):
+                execute_query("""
+                    UPDATE import_job SET statut = %s, lignes_traitees = %s, finished_at = NOW()
+                    WHERE id_job = %s
+                """, (STATUT_TERMINE, reprise['lignes_inserees'], id_job))
+                return
+
+            result = ExcelService.process_excel_file(
+                job['file_path'],
+                job['user_id'],
+                job['filename'],
+                progress=progress,
+                checkpoint=checkpoint,
+                reprise=reprise,
+                file_hash=job['file_hash']
+            )
+
+            duree = time.perf_counter() - start
+            IMPORT_DURATION.observe(duree)
+            IMPORT_ROWS.inc(result['lignes_inserees'])
+            IMPORT_BYTES.inc(taille)
+            if duree > 0:
+                IMPORT_ROWS_PER_SECOND.set(result['lignes_inserees'] / duree)
+            IMPORT_JOBS.inc(statut=STATUT_TERMINE)
+            execute_query("""
+                UPDATE import_job
+                SET statut = %s, lignes_traitees = %s, id_date_import = %s,
+                    taux_cache_dimensions = %s, finished_at = NOW()
+                WHERE id_job = %s
+            """, (
+                STATUT_TERMINE, result['lignes_inserees'], result['id_date_import'],
+                result['cache_dimensions']['hit_rate'], id_job
+            ))
+        except Exception as e:
+            print(f"Erreur lors de l'import {id_job}: {e}")
+            IMPORT_JOBS.inc(statut=STATUT_ECHEC)
+            ImportJobService._discard_partial_import(id_job)
+            execute_query(
+                "UPDATE import_job SET statut = %s, erreur = %s, finished_at = NOW() WHERE id_job = %s",
+                (STATUT_ECHEC, str(e)[:2000], id_job)
+            )
+        finally:
+            arret.set()
+            # Nouvelle importation (même partielle): les réponses en cache ne sont plus à jour
+            bump_data_version()
+            if os.path.exists(job['file_path']):
+                os.remove(job['file_path'])
+
+    @staticmethod
+    def _import_termine(id_date_import: int) -> bool:
+        row = execute_query(
+            "SELECT statut FROM date_import WHERE id_date = %s",
+            (id_date_import,), fetchone=True, name="import_statut"
+        )
+        return bool(row) and row['statut'] == STATUT_TERMINE
+
+    @staticmethod
+    def _heartbeat(id_job: str, arret: threading.Event):
+        """Signale toutes les IMPORT_HEARTBEAT_SECONDS que l'import est toujours en cours"""
+        while not arret.wait(IMPORT_HEARTBEAT_SECONDS):
+            try:
+                execute_query(
+                    "UPDATE import_job SET heartbeat_at = NOW() WHERE id_job = %s AND worker_id = %s",
+                    (id_job, ImportJobService.worker_id()), name="import_job_battement"
+                )
+            except Exception as e:
+                print(f"Erreur lors du battement de l'import {id_job}: {e}")
+
+    @staticmethod
+    def _discard_partial_import(id_job: str):
+        """Supprime les lots déjà validés d'un import en échec"""
+        job = execute_query("SELECT id_date_import FROM import_job WHERE id_job = %s", (id_job,), fetchone=True)
+        if not job or job['id_date_import'] is None:
+            return
+        try:
+            ImportDeleteService.delete_import(job['id_date_import'])
+            execute_query(
+                "UPDATE import_job SET id_date_import = NULL, lignes_validees = 0, heritage = NULL WHERE id_job = %s",
+                (id_job,)
+            )
+        except Exception as e:
+            print(f"Impossible de supprimer l'import partiel {job['id_date_import']}: {e}")
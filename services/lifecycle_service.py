@@ -0,0 +1,315 @@
+from typing import List, Optional, Sequence
+
+from config.database import Database, execute_query
+from services.aggregate_service import ETAT_FONCTIONNEL, ETAT_EN_PANNE
+from services.snapshot_delta_service import SnapshotDeltaService, STOCKAGE_DELTA
+
+# État de chaque matériel physique dans une importation: son dernier snapshot
+# (un matériel présent sur plusieurs lignes du fichier garde l'état de la dernière).
+# {source}: snapshots complets de l'importation (SnapshotDeltaService.source)
+ETATS_IMPORT = """
+    SELECT mi.id_physique, mi.etat
+    FROM {source} mi
+    JOIN (
+        SELECT MAX(id_snapshot) AS id_snapshot
+        FROM {source} s
+        GROUP BY id_physique
+    ) d ON d.id_snapshot = mi.id_snapshot
+"""
+
+# Application d'une importation, dans l'ordre: les trois premières requêtes lisent
+# l'état courant avant sa mise à jour par la dernière ({etats}: ETATS_IMPORT)
+APPLY_QUERIES = (
+    # Périodes dont l'état change: clôturées par cette importation
+    """
+        UPDATE materiel_etat_periode p
+        JOIN materiel_cycle_vie cv
+            ON cv.id_physique = p.id_physique AND cv.import_changement = p.import_debut
+        JOIN ({etats}) c ON c.id_physique = p.id_physique
+        SET p.import_cloture = %(id)s, p.date_cloture = %(date)s, p.etat_suivant = c.etat
+        WHERE NOT (c.etat <=> cv.etat_courant)
+    """,
+    # Périodes dont l'état se maintient: prolongées
+    """
+        UPDATE materiel_etat_periode p
+        JOIN materiel_cycle_vie cv
+            ON cv.id_physique = p.id_physique AND cv.import_changement = p.import_debut
+        JOIN ({etats}) c ON c.id_physique = p.id_physique
+        SET p.import_fin = %(id)s, p.date_fin = %(date)s, p.nb_imports = p.nb_imports + 1
+        WHERE c.etat <=> cv.etat_courant
+    """,
+    # Nouveaux matériels et changements d'état: nouvelle période
+    """
+        INSERT INTO materiel_etat_periode
+        (id_physique, import_debut, date_debut, import_fin, date_fin, etat, nb_imports)
+        SELECT c.id_physique, %(id)s, %(date)s, %(id)s, %(date)s, c.etat, 1
+        FROM ({etats}) c
+        LEFT JOIN materiel_cycle_vie cv ON cv.id_physique = c.id_physique
+        WHERE cv.id_physique IS NULL OR NOT (c.etat <=> cv.etat_courant)
+    """,
+    # Cycle de vie (etat_courant affecté en dernier: les affectations
+    # précédentes comparent avec l'ancien état)
+    """
+        INSERT INTO materiel_cycle_vie
+        (id_physique, premier_import, premiere_date, dernier_import, derniere_date,
+         etat_courant, import_changement, date_changement, serie_pannes, nb_imports)
+        SELECT c.id_physique, %(id)s, %(date)s, %(id)s, %(date)s,
+            c.etat, %(id)s, %(date)s, IF(c.etat <=> %(ko)s, 1, 0), 1
+        FROM ({etats}) c
+        ON DUPLICATE KEY UPDATE
+            serie_pannes = IF(VALUES(etat_courant) <=> %(ko)s,
+                              IF(etat_courant <=> VALUES(etat_courant), serie_pannes + 1, 1), 0),
+            import_changement = IF(etat_courant <=> VALUES(etat_courant),
+                                   import_changement, VALUES(import_changement)),
+            date_changement = IF(etat_courant <=> VALUES(etat_courant),
+                                 date_changement, VALUES(date_changement)),
+            dernier_import = VALUES(dernier_import),
+            derniere_date = VALUES(derniere_date),
+            nb_imports = nb_imports + 1,
+            etat_courant = VALUES(etat_courant)
+    """,
+)
+
+# Reconstruction complète: périodes d'état consécutif (îlots) de chaque matériel
+# sur les importations `{imports}`
+REBUILD_PERIODES = """
+    INSERT INTO materiel_etat_periode
+    (id_physique, import_debut, date_debut, import_fin, date_fin, etat, nb_imports,
+     import_cloture, date_cloture, etat_suivant)
+    WITH etats AS (
+        SELECT mi.id_physique, mi.id_date_import, di.date_complet, mi.etat
+        FROM materiel_informatique mi
+        JOIN (
+            SELECT MAX(id_snapshot) AS id_snapshot
+            FROM materiel_informatique
+            WHERE id_date_import IN ({imports})
+            GROUP BY id_date_import, id_physique
+        ) d ON d.id_snapshot = mi.id_snapshot
+        JOIN date_import di ON di.id_date = mi.id_date_import
+        WHERE mi.id_date_import IN ({imports})
+    ),
+    debuts AS (
+        SELECT etats.*,
+            IF(ROW_NUMBER() OVER w > 1 AND LAG(etat) OVER w <=> etat, 0, 1) AS debut
+        FROM etats
+        WINDOW w AS (PARTITION BY id_physique ORDER BY id_date_import)
+    ),
+    ilots AS (
+        SELECT debuts.*,
+            SUM(debut) OVER (PARTITION BY id_physique ORDER BY id_date_import) AS periode
+        FROM debuts
+    ),
+    periodes AS (
+        SELECT id_physique, periode,
+            MIN(id_date_import) AS import_debut, MIN(date_complet) AS date_debut,
+            MAX(id_date_import) AS import_fin, MAX(date_complet) AS date_fin,
+            MAX(etat) AS etat, COUNT(*) AS nb_imports
+        FROM ilots
+        GROUP BY id_physique, periode
+    )
+    SELECT id_physique, import_debut, date_debut, import_fin, date_fin, etat, nb_imports,
+        LEAD(import_debut) OVER s, LEAD(date_debut) OVER s, LEAD(etat) OVER s
+    FROM periodes
+    WINDOW s AS (PARTITION BY id_physique ORDER BY periode)
+"""
+
+# Reconstruction complète: cycle de vie déduit des périodes (la période ouverte
+# donne l'état courant)
+REBUILD_CYCLE_VIE = """
+    INSERT INTO materiel_cycle_vie
+    (id_physique, premier_import, premiere_date, dernier_import, derniere_date,
+     etat_courant, import_changement, date_changement, serie_pannes, nb_imports)
+    SELECT o.id_physique, g.premier_import, g.premiere_date, o.import_fin, o.date_fin,
+        o.etat, o.import_debut, o.date_debut, IF(o.etat <=> %(ko)s, o.nb_imports, 0), g.nb_imports
+    FROM materiel_etat_periode o
+    JOIN (
+        SELECT id_physique, MIN(import_debut) AS premier_import,
+            MIN(date_debut) AS premiere_date, SUM(nb_imports) AS nb_imports
+        FROM materiel_etat_periode
+        GROUP BY id_physique
+    ) g ON g.id_physique = o.id_physique
+    WHERE o.import_cloture IS NULL
+"""
+
+# Regroupements des statistiques de fiabilité
+FIABILITE_DIMENSIONS = {
+    "type": ("mp.type",),
+    "region": ("l.region",),
+    "district": ("l.region", "l.district"),
+}
+
+
+class LifecycleService:
+    """
+    Cycle de vie des matériels physiques, tenu à jour par l'import.
+
+    materiel_cycle_vie: une ligne par matériel (première et dernière importation
+    où il apparaît, état courant, dernier changement d'état, nombre d'importations
+    consécutives en panne). materiel_etat_periode: l'historique des états codé
+    par plages (une ligne par suite d'importations dans le même état).
+
+    Les importations sont appliquées dans l'ordre de leurs identifiants, une par
+    transaction, par rattrapage après chaque import (date_import.cycle_vie marque
+    les importations appliquées, cycle_vie_etat la dernière). Une importation
+    terminée après une plus récente (imports parallèles) ou la suppression d'une
+    importation appliquée provoque une reconstruction complète.
+    """
+
+    @staticmethod
+    def catch_up() -> List[int]:
+        """
+        Applique les importations terminées qui ne le sont pas encore (ou
+        reconstruit tout si nécessaire). Retourne les importations appliquées.
+        """
+        appliquees = []
+        while True:
+            with Database.get_cursor() as cursor:
+                # Verrou de la ligne d'état: un seul rattrapage à la fois
+                cursor.execute(
+                    "SELECT dernier_import, a_reconstruire FROM cycle_vie_etat WHERE id = 1 FOR UPDATE"
+                )
+                etat = cursor.fetchone()
+                cursor.execute("""
+                    SELECT id_date, date_complet
+                    FROM date_import
+                    WHERE statut = 'termine' AND NOT cycle_vie
+                    ORDER BY id_date
+                    LIMIT 1
+                """)
+                suivante = cursor.fetchone()
+
+                if etat['a_reconstruire'] or (suivante and suivante['id_date'] < etat['dernier_import']):
+                    appliquees.extend(LifecycleService._rebuild(cursor))
+                    continue
+                if not suivante:
+                    return appliquees
+
+                LifecycleService.apply(cursor, suivante['id_date'], suivante['date_complet'])
+                appliquees.append(suivante['id_date'])
+
+    @staticmethod
+    def apply(cursor, id_date_import: int, date_import):
+        """
+        Applique une importation postérieure à toutes celles déjà appliquées,
+        dans la transaction courante (verrou de cycle_vie_etat détenu)
+        """
+        params = {"id": id_date_import, "date": date_import, "ko": ETAT_EN_PANNE}
+        etats = ETATS_IMPORT.format(source=SnapshotDeltaService.source(cursor, id_date_import))
+        for query in APPLY_QUERIES:
+            cursor.execute(query.format(etats=etats), params)
+        cursor.execute("UPDATE date_import SET cycle_vie = TRUE WHERE id_date = %s", (id_date_import,))
+        cursor.execute("UPDATE cycle_vie_etat SET dernier_import = %s WHERE id = 1", (id_date_import,))
+
+    @staticmethod
+    def invalidate(cursor):
+        """Demande une reconstruction (importation appliquée supprimée, matériels fusionnés)"""
+        cursor.execute("UPDATE cycle_vie_etat SET a_reconstruire = TRUE WHERE id = 1")
+
+    @staticmethod
+    def _rebuild(cursor) -> List[int]:
+        """
+        Reconstruit les deux tables à partir des snapshots des importations
+        terminées, dans la transaction courante. Une importation terminée pendant
+        la reconstruction reste à appliquer.
+        """
+        cursor.execute(
+            "SELECT id_date, date_complet, stockage FROM date_import WHERE statut = 'termine' ORDER BY id_date"
+        )
+        rows = cursor.fetchall()
+        imports = [r['id_date'] for r in rows]
+
+        cursor.execute("DELETE FROM materiel_etat_periode")
+        cursor.execute("DELETE FROM materiel_cycle_vie")
+        if any(r['stockage'] == STOCKAGE_DELTA for r in rows):
+            # Importations en delta: rejouées une à une sur leurs snapshots reconstruits
+            cursor.execute("UPDATE date_import SET cycle_vie = FALSE")
+            for r in rows:
+                LifecycleService.apply(cursor, r['id_date'], r['date_complet'])
+        elif imports:
+            liste = ", ".join(str(int(i)) for i in imports)
+            cursor.execute(REBUILD_PERIODES.format(imports=liste))
+            cursor.execute(REBUILD_CYCLE_VIE, {"ko": ETAT_EN_PANNE})
+            cursor.execute(f"UPDATE date_import SET cycle_vie = (id_date IN ({liste}))")
+        else:
+            cursor.execute("UPDATE date_import SET cycle_vie = FALSE")
+
+        cursor.execute(
+            "UPDATE cycle_vie_etat SET dernier_import = %s, a_reconstruire = FALSE WHERE id = 1",
+            (imports[-1] if imports else 0,)
+        )
+        return imports
+
+    @staticmethod
+    def history(id_physique: int) -> Optional[dict]:
+        """Cycle de vie et périodes d'état (chronologiques) d'un matériel, None s'il est inconnu"""
+        cycle = execute_query("""
+            SELECT
+                cv.id_physique, mp.nom_materiel, mp.type,
+                l.code, l.region, l.district, l.commune,
+                cv.premier_import, cv.premiere_date, cv.dernier_import, cv.derniere_date,
+                cv.etat_courant, cv.import_changement, cv.date_changement,
+                cv.serie_pannes, cv.nb_imports
+            FROM materiel_cycle_vie cv
+            JOIN materiel_physique mp ON mp.id_physique = cv.id_physique
+            JOIN localisation l ON l.code_localisation = mp.code_localisation_ref
+            WHERE cv.id_physique = %s
+        """, (id_physique,), fetchone=True, name="cycle_vie_materiel")
+        if not cycle:
+            return None
+
+        cycle['periodes'] = execute_query("""
+            SELECT etat, import_debut, date_debut, import_fin, date_fin, nb_imports,
+                import_cloture, date_cloture, etat_suivant
+            FROM materiel_etat_periode
+            WHERE id_physique = %s
+            ORDER BY import_debut
+        """, (id_physique,), fetch=True, name="cycle_vie_periodes")
+        return cycle
+
+    @staticmethod
+    def reliability(group_by: str, skip: int = 0, limit: int = 100) -> List[dict]:
+        """
+        MTTR et MTBF (jours) par type, région ou district, sur les périodes closes:
+        MTTR, durée moyenne d'une panne jusqu'à l'importation où le matériel est de
+        nouveau fonctionnel; MTBF, durée moyenne d'un fonctionnement jusqu'à
+        l'importation où il tombe en panne. Lève ValueError pour un regroupement inconnu.
+        """
+        if group_by not in FIABILITE_DIMENSIONS:
+            raise ValueError(
+                f"Regroupement inconnu: {group_by} "
+                f"(disponibles: {', '.join(FIABILITE_DIMENSIONS)})"
+            )
+        colonnes: Sequence[str] = FIABILITE_DIMENSIONS[group_by]
+
+        query = f"""
+            SELECT
+                {', '.join(colonnes)},
+                COUNT(DISTINCT p.id_physique) AS materiels,
+                SUM(p.etat <=> %(ko)s) AS pannes,
+                SUM(p.etat <=> %(ko)s AND p.etat_suivant <=> %(ok)s) AS reparations,
+                AVG(CASE WHEN p.etat <=> %(ko)s AND p.etat_suivant <=> %(ok)s
+                    THEN DATEDIFF(p.date_cloture, p.date_debut) END) AS mttr_jours,
+                AVG(CASE WHEN p.etat <=> %(ok)s AND p.etat_suivant <=> %(ko)s
+                    THEN DATEDIFF(p.date_cloture, p.date_debut) END) AS mtbf_jours
+            FROM materiel_etat_periode p
+            JOIN materiel_physique mp ON mp.id_physique = p.id_physique
+            JOIN localisation l ON l.code_localisation = mp.code_localisation_ref
+            GROUP BY {', '.join(colonnes)}
+            ORDER BY pannes DESC, {', '.join(colonnes)}
+            LIMIT %(limit)s OFFSET %(skip)s
+        """
+        params = {"ok": ETAT_FONCTIONNEL, "ko": ETAT_EN_PANNE, "limit": limit, "skip": skip}
+        results = execute_query(query, params, fetch=True, name="stats_fiabilite")
+
+        noms = [c.split(".")[1] for c in colonnes]
+        return [
+            {
+                **{n: r[n] for n in noms},
+                "materiels": int(r['materiels']),
+                "pannes": int(r['pannes'] or 0),
+                "reparations": int(r['reparations'] or 0),
+                "mttr_jours": round(float(r['mttr_jours']), 1) if r['mttr_jours'] is not None else None,
+                "mtbf_jours": round(float(r['mtbf_jours']), 1) if r['mtbf_jours'] is not None else None
+            }
+            for r in results
+        ]
@@ -0,0 +1,148 @@
+import bisect
+from typing import List, Optional, Tuple
+
+from config.database import execute_query
+from utils.cache import total_cache, data_version
+from utils.helpers import encode_cursor
+
+# Colonnes communes aux listings de matériels (modèle de lecture snapshot_flat)
+MATERIEL_COLUMNS = """
+    sf.id_snapshot,
+    sf.id_physique,
+    sf.etat,
+    sf.nom_materiel,
+    sf.type,
+    sf.code,
+    sf.region,
+    sf.district,
+    sf.commune,
+    sf.date_import
+"""
+
+# Source des listings: snapshots à plat des seules importations terminées
+# (semi-jointure sur la clé primaire de date_import, quelques lignes)
+MATERIEL_SOURCE = """
+    FROM snapshot_flat sf
+"""
+
+MATERIEL_VISIBLE = "sf.id_date_import IN (SELECT id_date FROM date_import WHERE statut = 'termine')"
+
+
+class MaterielService:
+    """Moteur commun des listings paginés de snapshots"""
+
+    @staticmethod
+    def list_snapshots(where: str, params: tuple, skip: int, limit: int, cache_key: tuple,
+                       after_id: Optional[int] = None, source: str = MATERIEL_SOURCE, source_params: tuple = ()) -> Tuple[int, List[dict]]:
+        """
+        Retourne (total, page) pour le filtre `where`.
+
+        Le total est obtenu dans la même requête que la page (COUNT(*) OVER()),
+        puis mis en cache par filtre et importation: les pages suivantes ne
+        recalculent plus le total.
+
+        Avec `after_id` (pagination par curseur), la page commence après ce
+        id_snapshot au lieu d'utiliser OFFSET: une page profonde coûte autant
+        que la première.
+
+        `source` remplace la clause FROM (alias sf, colonnes de snapshot_flat);
+        ses paramètres `source_params` précèdent ceux du filtre.
+        """
+        key = (data_version(),) + tuple(cache_key)
+        total = total_cache.get(key)
+
+        if after_id is not None:
+            if total is None:
+                total = MaterielService._count(where, params, source, source_params)
+                total_cache.set(key, total)
+            query = f"""
+                SELECT {MATERIEL_COLUMNS}
+                {source}
+                WHERE ({where}) AND {MATERIEL_VISIBLE} AND sf.id_snapshot < %s
+                ORDER BY sf.id_snapshot DESC
+                LIMIT %s
+            """
+            return total, execute_query(
+                query, source_params + params + (after_id, limit), fetch=True, name="materiels_page_curseur"
+            )
+
+        if total is not None:
+            if skip >= total:
+                return total, []
+            query = f"""
+                SELECT {MATERIEL_COLUMNS}
+                {source}
+                WHERE ({where}) AND {MATERIEL_VISIBLE}
+                ORDER BY sf.id_snapshot DESC
+                LIMIT %s OFFSET %s
+            """
+            return total, execute_query(query, source_params + params + (limit, skip), fetch=True, name="materiels_page")
+
+        query = f"""
+            SELECT COUNT(*) OVER() as total_count, {MATERIEL_COLUMNS}
+            {source}
+            WHERE ({where}) AND {MATERIEL_VISIBLE}
+            ORDER BY sf.id_snapshot DESC
+            LIMIT %s OFFSET %s
+        """
+        results = execute_query(query, source_params + params + (limit, skip), fetch=True, name="materiels_page_total")
+
+        if results:
+            total = results[0]['total_count']
+            for r in results:
+                del r['total_count']
+        elif skip == 0:
+            total = 0
+        else:
+            # Page au-delà de la fin: le total n'est pas porté par les lignes
+            total = MaterielService._count(where, params, source, source_params)
+
+        total_cache.set(key, total)
+        return total, results
+
+    @staticmethod
+    def page_of_ids(ids: List[int], skip: int, limit: int, after_id: Optional[int] = None,
+                    id_date_import: Optional[int] = None, source: str = MATERIEL_SOURCE) -> List[dict]:
+        """
+        Retourne une page de snapshots à partir d'une liste d'id_snapshot triée
+        par ordre décroissant (listes précalculées, ex: différences d'importations).
+        `id_date_import` limite la page aux lignes de cette importation (clé
+        primaire de snapshot_flat).
+        `source` remplace la clause FROM (alias sf), comme pour list_snapshots.
+        """
+        if after_id is not None:
+            # Premier id strictement inférieur au curseur (liste décroissante)
+            start = bisect.bisect_right(ids, -after_id, key=lambda i: -i)
+        else:
+            start = skip
+        page_ids = ids[start:start + limit]
+        if not page_ids:
+            return []
+
+        placeholders = ', '.join(['%s'] * len(page_ids))
+        params = tuple(page_ids)
+        where = f"sf.id_snapshot IN ({placeholders})"
+        if id_date_import is not None:
+            where = f"sf.id_date_import = %s AND {where}"
+            params = (id_date_import,) + params
+        query = f"""
+            SELECT {MATERIEL_COLUMNS}
+            {source}
+            WHERE {where} AND {MATERIEL_VISIBLE}
+            ORDER BY sf.id_snapshot DESC
+        """
+        return execute_query(query, params, fetch=True, name="materiels_par_ids")
+
+    @staticmethod
+    def next_cursor(results: List[dict], limit: int) -> Optional[str]:
+        """Curseur de la page suivante, ou None si la page est la dernière"""
+        if len(results) < limit:
+            return None
+        return encode_cursor({"id": results[-1]['id_snapshot']})
+
+    @staticmethod
+    def _count(where: str, params: tuple, source: str = MATERIEL_SOURCE, source_params: tuple = ()) -> int:
+        """Compte les snapshots correspondant au filtre"""
+        query_count = f"SELECT COUNT(*) as total {source} WHERE ({where}) AND {MATERIEL_VISIBLE}"
+        count_result = execute_query(query_count, source_params + params, fetchone=True, name="materiels_count")
+        return count_result['total'] if count_result else 0
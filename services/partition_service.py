@@ -0,0 +1,144 @@
+from typing import List
+
+import mysql.connector
+
+from config.database import Database, execute_query
+
+# Tables partitionnées par importation (LIST sur id_date_import, une partition par import)
+PARTITIONED_TABLES = ("materiel_informatique", "incident", "snapshot_flat")
+
+# Clés primaires: MySQL exige la colonne de partitionnement dans chaque clé unique
+PRIMARY_KEYS = {
+    "materiel_informatique": "id_snapshot, id_date_import",
+    "incident": "id_incident, id_date_import",
+    "snapshot_flat": "id_date_import, id_snapshot",
+}
+
+# Partition 0: toujours présente (une table LIST a au moins une partition),
+# reçoit les incidents sans snapshot
+PARTITION_ORPHELINS = 0
+
+# Partition déjà créée (création concurrente par un autre import)
+ER_SAME_NAME_PARTITION = 1517
+ER_MULTIPLE_DEF_CONST_IN_LIST_PART = 1495
+
+
+class PartitionService:
+    """
+    Partitionnement de materiel_informatique, incident et snapshot_flat par importation.
+
+    Chaque importation a sa partition p<id_date_import>: les requêtes filtrées
+    sur une importation ne lisent que sa partition et la suppression d'une
+    importation se fait par DROP PARTITION. Les clés étrangères de ces tables
+    sont retirées (non supportées par les tables partitionnées), l'intégrité
+    est assurée par l'import.
+    """
+
+    @staticmethod
+    def partition_name(id_date_import: int) -> str:
+        return f"p{int(id_date_import)}"
+
+    @staticmethod
+    def is_partitioned(table: str = "materiel_informatique") -> bool:
+        query = """
+            SELECT COUNT(*) AS total
+            FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = %s
+            AND partition_name IS NOT NULL
+        """
+        result = execute_query(query, (table,), fetchone=True, name="partitions_etat")
+        return bool(result and result['total'])
+
+    @staticmethod
+    def existing_partitions(table: str) -> set:
+        query = """
+            SELECT partition_name AS partition_name
+            FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = %s
+            AND partition_name IS NOT NULL
+        """
+        return {r['partition_name'] for r in execute_query(query, (table,), fetch=True, name="partitions_liste")}
+
+    @staticmethod
+    def ensure_partition(id_date_import: int) -> List[str]:
+        """
+        Crée la partition d'une importation dans chaque table partitionnée
+        (une table non encore migrée est ignorée).
+        Instruction DDL (validation implicite): à appeler hors de la transaction
+        d'import. Retourne les tables où la partition a été créée.
+        """
+        name = PartitionService.partition_name(id_date_import)
+        created = []
+        for table in PARTITIONED_TABLES:
+            existing = PartitionService.existing_partitions(table)
+            if not existing or name in existing:
+                continue
+            try:
+                execute_query(
+                    f"ALTER TABLE {table} ADD PARTITION "
+                    f"(PARTITION {name} VALUES IN ({int(id_date_import)}))"
+                )
+                created.append(table)
+            except mysql.connector.Error as e:
+                if e.errno not in (ER_SAME_NAME_PARTITION, ER_MULTIPLE_DEF_CONST_IN_LIST_PART):
+                    raise
+        return created
+
+    @staticmethod
+    def drop_partition(id_date_import: int) -> List[str]:
+        """Supprime les lignes d'une importation en retirant sa partition"""
+        name = PartitionService.partition_name(id_date_import)
+        dropped = []
+        for table in PARTITIONED_TABLES:
+            if name in PartitionService.existing_partitions(table):
+                execute_query(f"ALTER TABLE {table} DROP PARTITION {name}")
+                dropped.append(table)
+        return dropped
+
+    @staticmethod
+    def partition_tables() -> List[str]:
+        """
+        Migration: partitionne les tables qui ne le sont pas encore, avec une
+        partition par importation existante. Réécrit les tables (à lancer
+        pendant une période sans import). Retourne les tables partitionnées.
+        """
+        tables = [t for t in PARTITIONED_TABLES if not PartitionService.is_partitioned(t)]
+        if not tables:
+            return []
+
+        with Database.get_cursor() as cursor:
+            # Clés étrangères portées par ou visant ces tables
+            placeholders = ", ".join(["%s"] * len(PARTITIONED_TABLES))
+            cursor.execute(f"""
+                SELECT table_name AS table_name, constraint_name AS constraint_name
+                FROM information_schema.referential_constraints
+                WHERE constraint_schema = DATABASE()
+                AND (table_name IN ({placeholders}) OR referenced_table_name IN ({placeholders}))
+            """, PARTITIONED_TABLES + PARTITIONED_TABLES)
+            for fk in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {fk['table_name']} DROP FOREIGN KEY {fk['constraint_name']}")
+
+            # Incidents antérieurs à la colonne id_date_import
+            cursor.execute("""
+                UPDATE incident i
+                JOIN materiel_informatique mi ON mi.id_snapshot = i.id_materiel
+                SET i.id_date_import = mi.id_date_import
+                WHERE i.id_date_import = 0
+            """)
+
+            cursor.execute("SELECT id_date FROM date_import")
+            imports = {r['id_date'] for r in cursor.fetchall()}
+
+            for table in tables:
+                cursor.execute(f"SELECT DISTINCT id_date_import FROM {table}")
+                ids = sorted(imports | {r['id_date_import'] for r in cursor.fetchall()} | {PARTITION_ORPHELINS})
+                partitions = ", ".join(
+                    f"PARTITION {PartitionService.partition_name(i)} VALUES IN ({int(i)})" for i in ids
+                )
+                cursor.execute(f"""
+                    ALTER TABLE {table}
+                    DROP PRIMARY KEY, ADD PRIMARY KEY ({PRIMARY_KEYS[table]})
+                    PARTITION BY LIST (id_date_import) ({partitions})
+                """)
+
+        return tables
@@ -0,0 +1,549 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from config.database import Database, execute_query
+from services.snapshot_flat_service import SnapshotFlatService
+
+# Stockage des snapshots: "complet" (une copie de chaque matériel par importation)
+# ou "delta" (changements par rapport à l'importation précédente)
+STOCKAGE_COMPLET = "complet"
+STOCKAGE_DELTA = "delta"
+SNAPSHOT_STORAGE = os.getenv("SNAPSHOT_STORAGE", STOCKAGE_COMPLET)
+
+# Longueur maximale d'une chaîne (importation complète + deltas): une
+# importation sur DELTA_KEYFRAME_INTERVAL reste complète
+DELTA_KEYFRAME_INTERVAL = int(os.getenv("DELTA_KEYFRAME_INTERVAL", "10"))
+
+# Importations en delta reconstruites et gardées dans snapshot_flat, et durée
+# minimale (secondes) avant qu'une reconstruction puisse être évincée
+DELTA_CACHE_IMPORTS = int(os.getenv("DELTA_CACHE_IMPORTS", "8"))
+DELTA_CACHE_GRACE_SECONDS = int(os.getenv("DELTA_CACHE_GRACE_SECONDS", "300"))
+
+# Matériels traités par requête lors du compactage et de la réhydratation
+DELTA_CHUNK_SIZE = 5000
+
+# Importations de la chaîne d'une importation, de l'importation complète à elle-même
+CHAIN_QUERY = """
+    WITH RECURSIVE chaine AS (
+        SELECT id_date, id_precedent, stockage
+        FROM date_import
+        WHERE id_date = %s
+        UNION ALL
+        SELECT d.id_date, d.id_precedent, d.stockage
+        FROM date_import d
+        JOIN chaine c ON d.id_date = c.id_precedent
+        WHERE c.stockage = 'delta'
+    )
+    SELECT id_date FROM chaine ORDER BY id_date
+"""
+
+# Contenu d'un snapshot: état et incident
+CONTENU = """CONCAT_WS('|', COALESCE(s.etat, CHAR(0)), COALESCE(i.motif, CHAR(0)),
+    COALESCE(i.achat_consommable, CHAR(0)), COALESCE(i.compatibilite_consommable, CHAR(0)))"""
+
+# Signature d'un matériel dans une importation: contenus de ses snapshots
+# (un matériel présent sur plusieurs lignes a plusieurs snapshots)
+SIGNATURES = f"""
+    SELECT s.id_physique,
+        GROUP_CONCAT({CONTENU} ORDER BY {CONTENU} SEPARATOR '#') AS signature
+    FROM {{source}} s
+    LEFT JOIN incident i ON i.id_materiel = s.id_version AND i.id_date_import = s.id_date_import
+    GROUP BY s.id_physique
+"""
+
+# Snapshots de matériels donnés numérotés par contenu: le n-ième snapshot d'un
+# contenu dans une importation correspond au n-ième du même contenu dans l'autre
+RANGS = f"""
+    SELECT s.id_snapshot, s.id_version, s.id_physique, {CONTENU} AS contenu,
+        ROW_NUMBER() OVER (PARTITION BY s.id_physique, {CONTENU} ORDER BY s.id_snapshot) AS rang
+    FROM {{source}} s
+    LEFT JOIN incident i ON i.id_materiel = s.id_version AND i.id_date_import = s.id_date_import
+    WHERE s.id_physique IN ({{placeholders}})
+"""
+
+# Lignes à plat (colonnes de snapshot_flat) du snapshot complet de l'importation {id}
+FLAT_ROWS = """
+    SELECT
+        mi.id_snapshot, {id} AS id_date_import, di.date_complet AS date_import,
+        mi.id_physique, mi.etat, mp.nom_materiel, mp.type,
+        l.code, l.region, l.district, l.commune,
+        i.motif, i.achat_consommable, i.compatibilite_consommable
+    FROM {source} mi
+    JOIN date_import di ON di.id_date = {id}
+    JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
+    JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
+    LEFT JOIN incident i ON mi.id_version = i.id_materiel AND i.id_date_import = mi.id_date_import
+"""
+
+# Snapshot complet d'une importation en delta recopié dans snapshot_flat
+MATERIALIZE = """
+    INSERT INTO snapshot_flat
+    (id_snapshot, id_date_import, date_import, id_physique, etat, nom_materiel, type,
+     code, region, district, commune, motif, achat_consommable, compatibilite_consommable)
+""" + FLAT_ROWS
+
+# Lignes à plat de toutes les importations terminées (recherche sans importation):
+# chaque version est rattachée aux importations dont la chaîne la contient et où
+# elle n'est ni remplacée ni disparue, sous l'id_snapshot qu'elle a dans chacune
+# (snapshot_herite). {filtre} porte sur l (localisation)
+ALL_IMPORTS_FLAT_ROWS = """
+    WITH RECURSIVE chaines AS (
+        SELECT id_date AS id_import, id_date AS membre, id_precedent, stockage
+        FROM date_import
+        WHERE statut = 'termine'
+        UNION ALL
+        SELECT c.id_import, d.id_date, d.id_precedent, d.stockage
+        FROM chaines c
+        JOIN date_import d ON d.id_date = c.id_precedent
+        WHERE c.stockage = 'delta'
+    )
+    SELECT
+        COALESCE(h.id_snapshot, v.id_snapshot) AS id_snapshot,
+        c.id_import AS id_date_import, di.date_complet AS date_import,
+        v.id_physique, v.etat, mp.nom_materiel, mp.type,
+        l.code, l.region, l.district, l.commune,
+        i.motif, i.achat_consommable, i.compatibilite_consommable
+    FROM localisation l
+    JOIN materiel_physique mp ON mp.code_localisation_ref = l.code_localisation
+    JOIN materiel_informatique v ON v.id_physique = mp.id_physique
+    JOIN chaines c ON c.membre = v.id_date_import
+    JOIN date_import di ON di.id_date = c.id_import
+    LEFT JOIN snapshot_herite h ON h.id_date_import = c.id_import AND h.id_version = v.id_snapshot
+    LEFT JOIN incident i ON i.id_materiel = v.id_snapshot AND i.id_date_import = v.id_date_import
+    WHERE {filtre}
+    AND NOT EXISTS (
+        SELECT 1 FROM materiel_informatique w
+        JOIN chaines cw ON cw.id_import = c.id_import AND cw.membre = w.id_date_import
+        WHERE w.id_physique = v.id_physique AND w.id_date_import > v.id_date_import
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM snapshot_disparu d
+        JOIN chaines cd ON cd.id_import = c.id_import AND cd.membre = d.id_date_import
+        WHERE d.id_physique = v.id_physique AND d.id_date_import > v.id_date_import
+    )
+"""
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SnapshotDeltaService:
+    """
+    Stockage des snapshots en delta (SNAPSHOT_STORAGE=delta).
+
+    L'import écrit toujours l'importation complète (synthèses, cycle de vie et
+    snapshot_flat sont calculés dessus). Quand l'importation suivante est
+    terminée, la précédente est compactée: seuls restent les snapshots des
+    matériels apparus ou dont l'état ou l'incident a changé par rapport à
+    l'importation d'avant (date_import.id_precedent), les disparitions sont
+    notées dans snapshot_disparu. Chaque snapshot retiré est noté dans
+    snapshot_herite avec la version de même contenu qui le remplace: il garde
+    son id_snapshot, et les réponses sont les mêmes qu'en stockage complet.
+    Une importation sur DELTA_KEYFRAME_INTERVAL reste complète et borne la
+    chaîne à relire.
+
+    Le snapshot complet d'une importation en delta est la dernière version de
+    chaque matériel le long de sa chaîne. Les lectures ne l'écrivent jamais:
+    elles le calculent en lecture seule (flat_source, state_source) et planifient
+    sa reconstruction dans snapshot_flat par un worker en arrière-plan
+    (DELTA_CACHE_IMPORTS importations gardées), utilisée dès qu'elle est prête.
+    """
+
+    # Reconstructions planifiées par les lectures, une à la fois
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="materialisation")
+    _planifiees = set()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def chain(cursor, id_date_import: int) -> List[int]:
+        """Importations à relire pour le snapshot complet (une seule si l'importation est complète)"""
+        cursor.execute(CHAIN_QUERY, (id_date_import,))
+        return [r['id_date'] for r in cursor.fetchall()] or [id_date_import]
+
+    @staticmethod
+    def state_sql(chaine: List[int]) -> str:
+        """
+        Table dérivée (id_snapshot, id_version, id_physique, etat, id_date_import)
+        du snapshot complet de la dernière importation de `chaine`: id_snapshot
+        est l'id du snapshot dans cette importation, id_version et id_date_import
+        désignent la ligne stockée (et ses incidents)
+        """
+        ids = ", ".join(str(int(i)) for i in chaine)
+        if len(chaine) == 1:
+            return f"""(
+                SELECT id_snapshot, id_snapshot AS id_version, id_physique, etat, id_date_import
+                FROM materiel_informatique
+                WHERE id_date_import = {ids}
+            )"""
+        return f"""(
+            SELECT COALESCE(h.id_snapshot, v.id_snapshot) AS id_snapshot, v.id_snapshot AS id_version,
+                v.id_physique, v.etat, v.id_date_import
+            FROM materiel_informatique v
+            LEFT JOIN snapshot_herite h ON h.id_date_import = {int(chaine[-1])} AND h.id_version = v.id_snapshot
+            WHERE v.id_date_import IN ({ids})
+            AND NOT EXISTS (
+                SELECT 1 FROM materiel_informatique w
+                WHERE w.id_physique = v.id_physique AND w.id_date_import IN ({ids})
+                AND w.id_date_import > v.id_date_import
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM snapshot_disparu d
+                WHERE d.id_physique = v.id_physique AND d.id_date_import IN ({ids})
+                AND d.id_date_import > v.id_date_import
+            )
+        )"""
+
+    @staticmethod
+    def source(cursor, id_date_import: int) -> str:
+        """Table dérivée des snapshots complets d'une importation, quel que soit son stockage"""
+        return SnapshotDeltaService.state_sql(SnapshotDeltaService.chain(cursor, id_date_import))
+
+    @staticmethod
+    def compact_previous(id_date_import: int) -> bool:
+        """Compacte l'importation terminée qui précède `id_date_import`"""
+        row = execute_query("""
+            SELECT MAX(id_date) AS id_date
+            FROM date_import
+            WHERE id_date < %s AND statut = 'termine'
+        """, (id_date_import,), fetchone=True, name="delta_precedente")
+        if not row or row['id_date'] is None:
+            return False
+        return SnapshotDeltaService.compact(row['id_date'])
+
+    @staticmethod
+    def compact_all() -> List[int]:
+        """Compacte les importations complètes existantes (sauf la plus récente), dans l'ordre"""
+        rows = execute_query("""
+            SELECT id_date
+            FROM date_import
+            WHERE statut = 'termine' AND stockage = %s
+            AND id_date < (SELECT MAX(id_date) FROM date_import WHERE statut = 'termine')
+            ORDER BY id_date
+        """, (STOCKAGE_COMPLET,), fetch=True)
+        return [r['id_date'] for r in rows if SnapshotDeltaService.compact(r['id_date'])]
+
+    @staticmethod
+    def compact(id_date_import: int) -> bool:
+        """
+        Passe une importation terminée et complète en delta par rapport à
+        l'importation terminée précédente, dans une transaction. Retourne False si
+        elle reste complète (première importation, ou chaîne de la précédente
+        déjà longue de DELTA_KEYFRAME_INTERVAL).
+        """
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT stockage FROM date_import WHERE id_date = %s AND statut = 'termine' FOR UPDATE",
+                (id_date_import,)
+            )
+            row = cursor.fetchone()
+            if not row or row['stockage'] != STOCKAGE_COMPLET:
+                return False
+
+            cursor.execute(
+                "SELECT MAX(id_date) AS id_date FROM date_import WHERE id_date < %s AND statut = 'termine'",
+                (id_date_import,)
+            )
+            precedente = cursor.fetchone()['id_date']
+            if precedente is None:
+                return False
+            chaine = SnapshotDeltaService.chain(cursor, precedente)
+            if len(chaine) >= DELTA_KEYFRAME_INTERVAL:
+                return False
+
+            # Signatures longues (matériel présent sur beaucoup de lignes)
+            cursor.execute("SET SESSION group_concat_max_len = 1000000")
+            cursor.execute(f"""
+                SELECT n.id_physique
+                FROM ({SIGNATURES.format(source=SnapshotDeltaService.state_sql([id_date_import]))}) n
+                JOIN ({SIGNATURES.format(source=SnapshotDeltaService.state_sql(chaine))}) o
+                    ON o.id_physique = n.id_physique AND o.signature = n.signature
+            """)
+            inchanges = [r['id_physique'] for r in cursor.fetchall()]
+
+            # Matériels de l'importation précédente absents de celle-ci
+            cursor.execute(f"""
+                INSERT INTO snapshot_disparu (id_date_import, id_physique)
+                SELECT DISTINCT %s, o.id_physique
+                FROM {SnapshotDeltaService.state_sql(chaine)} o
+                LEFT JOIN materiel_informatique n
+                    ON n.id_date_import = %s AND n.id_physique = o.id_physique
+                WHERE n.id_physique IS NULL
+            """, (id_date_import, id_date_import))
+
+            for lot in _chunks(inchanges, DELTA_CHUNK_SIZE):
+                placeholders = ", ".join(["%s"] * len(lot))
+                # Chaque snapshot retiré garde son id: version de même contenu qui le remplace
+                cursor.execute(f"""
+                    INSERT INTO snapshot_herite (id_snapshot, id_date_import, id_version)
+                    SELECT n.id_snapshot, %s, o.id_version
+                    FROM ({RANGS.format(source=SnapshotDeltaService.state_sql([id_date_import]), placeholders=placeholders)}) n
+                    JOIN ({RANGS.format(source=SnapshotDeltaService.state_sql(chaine), placeholders=placeholders)}) o
+                        ON o.id_physique = n.id_physique AND o.contenu = n.contenu AND o.rang = n.rang
+                """, [id_date_import] + lot + lot)
+                cursor.execute(f"""
+                    DELETE FROM incident
+                    WHERE id_date_import = %s AND id_materiel IN (
+                        SELECT id_snapshot FROM materiel_informatique
+                        WHERE id_date_import = %s AND id_physique IN ({placeholders})
+                    )
+                """, [id_date_import, id_date_import] + lot)
+                cursor.execute(
+                    f"DELETE FROM materiel_informatique WHERE id_date_import = %s AND id_physique IN ({placeholders})",
+                    [id_date_import] + lot
+                )
+
+            # Snapshot complet reconstruit à la demande
+            cursor.execute("DELETE FROM snapshot_flat WHERE id_date_import = %s", (id_date_import,))
+            cursor.execute("""
+                UPDATE date_import
+                SET stockage = %s, id_precedent = %s, materialise_le = NULL
+                WHERE id_date = %s
+            """, (STOCKAGE_DELTA, precedente, id_date_import))
+        return True
+
+    @staticmethod
+    def has_delta() -> bool:
+        """Au moins une importation terminée est stockée en delta"""
+        row = execute_query("""
+            SELECT EXISTS (
+                SELECT 1 FROM date_import WHERE stockage = %s AND statut = 'termine'
+            ) AS delta
+        """, (STOCKAGE_DELTA,), fetchone=True, name="delta_present")
+        return bool(row and row['delta'])
+
+    @staticmethod
+    def _flat_ready(id_date_import: int) -> bool:
+        """
+        snapshot_flat contient le snapshot complet de l'importation et le garde
+        pendant la lecture: importation complète, ou reconstruction marquée
+        depuis moins de DELTA_CACHE_GRACE_SECONDS / 2 (l'éviction attend
+        DELTA_CACHE_GRACE_SECONDS). Lecture seule: le marquage d'une
+        reconstruction plus ancienne est fait par le worker (materialize).
+        """
+        row = execute_query("""
+            SELECT stockage, TIMESTAMPDIFF(SECOND, materialise_le, NOW()) AS age
+            FROM date_import
+            WHERE id_date = %s
+        """, (id_date_import,), fetchone=True, name="delta_stockage")
+        if not row or row['stockage'] != STOCKAGE_DELTA:
+            return True
+        return row['age'] is not None and row['age'] < DELTA_CACHE_GRACE_SECONDS // 2
+
+    @staticmethod
+    def _chain(id_date_import: int) -> List[int]:
+        rows = execute_query(CHAIN_QUERY, (id_date_import,), fetch=True, name="delta_chaine")
+        return [r['id_date'] for r in rows] or [id_date_import]
+
+    @staticmethod
+    def flat_source(id_date_import: int) -> str:
+        """
+        Clause FROM (alias sf, colonnes de snapshot_flat) des listings d'une
+        importation: snapshot_flat si son snapshot complet y est, sinon calcul en
+        lecture seule le long de sa chaîne, et reconstruction (ou marquage de la
+        reconstruction existante) planifiée.
+        """
+        if SnapshotDeltaService._flat_ready(id_date_import):
+            return "FROM snapshot_flat sf"
+        SnapshotDeltaService.schedule_materialize(id_date_import)
+        source = SnapshotDeltaService.state_sql(SnapshotDeltaService._chain(id_date_import))
+        return f"FROM ({FLAT_ROWS.format(id=int(id_date_import), source=source)}) sf"
+
+    @staticmethod
+    def state_source(id_date_import: int) -> str:
+        """
+        Table dérivée (id_snapshot, id_physique, etat, id_date_import) du snapshot
+        complet d'une importation, en lecture seule (différences d'importations)
+        """
+        if SnapshotDeltaService._flat_ready(id_date_import):
+            return f"""(
+                SELECT id_snapshot, id_physique, etat, id_date_import
+                FROM snapshot_flat
+                WHERE id_date_import = {int(id_date_import)}
+            )"""
+        return SnapshotDeltaService.state_sql(SnapshotDeltaService._chain(id_date_import))
+
+    @staticmethod
+    def all_imports_source(filtre: str) -> str:
+        """
+        Clause FROM (alias sf) des lignes à plat de toutes les importations
+        terminées qui vérifient `filtre` (sur l, la localisation), quel que soit
+        leur stockage (mêmes lignes que snapshot_flat en stockage complet)
+        """
+        return f"FROM ({ALL_IMPORTS_FLAT_ROWS.format(filtre=filtre)}) sf"
+
+    @staticmethod
+    def snapshot_detail(id_snapshot: int):
+        """
+        Ligne à plat d'un snapshot absent de snapshot_flat (importation en delta
+        pas encore reconstruite), calculée le long de la chaîne de son importation
+        """
+        row = execute_query("""
+            SELECT id_date_import FROM snapshot_herite WHERE id_snapshot = %s
+            UNION ALL
+            SELECT id_date_import FROM materiel_informatique WHERE id_snapshot = %s
+        """, (id_snapshot, id_snapshot), fetchone=True, name="delta_detail_import")
+        if not row:
+            return None
+        id_date_import = row['id_date_import']
+        source = SnapshotDeltaService.state_sql(SnapshotDeltaService._chain(id_date_import))
+        query = FLAT_ROWS.format(id=int(id_date_import), source=source) + \
+            " WHERE mi.id_snapshot = %s AND di.statut = 'termine'"
+        return execute_query(query, (id_snapshot,), fetchone=True, name="delta_detail")
+
+    @staticmethod
+    def schedule_materialize(id_date_import: int):
+        """Planifie la reconstruction ou le marquage d'une importation dans snapshot_flat (une seule fois à la fois)"""
+        with SnapshotDeltaService._lock:
+            if id_date_import in SnapshotDeltaService._planifiees:
+                return
+            SnapshotDeltaService._planifiees.add(id_date_import)
+        SnapshotDeltaService._executor.submit(SnapshotDeltaService._materialize_job, id_date_import)
+
+    @staticmethod
+    def _materialize_job(id_date_import: int):
+        """Reconstruction planifiée (worker)"""
+        try:
+            SnapshotDeltaService.materialize(id_date_import)
+        except Exception as e:
+            print(f"Erreur lors de la reconstruction de l'importation {id_date_import}: {e}")
+        finally:
+            with SnapshotDeltaService._lock:
+                SnapshotDeltaService._planifiees.discard(id_date_import)
+
+    @staticmethod
+    def materialize(id_date_import: int) -> bool:
+        """
+        Reconstruit dans snapshot_flat le snapshot complet d'une importation en
+        delta, puis évince les reconstructions les plus anciennes hors délai de
+        grâce. Une reconstruction existante est seulement marquée comme lue
+        (materialise_le), ce qui la garde de l'éviction. Retourne True si une
+        reconstruction a eu lieu.
+        """
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT stockage, materialise_le FROM date_import WHERE id_date = %s AND statut = 'termine' FOR UPDATE",
+                (id_date_import,)
+            )
+            row = cursor.fetchone()
+            if not row or row['stockage'] != STOCKAGE_DELTA:
+                return False
+            if row['materialise_le'] is not None:
+                cursor.execute("UPDATE date_import SET materialise_le = NOW() WHERE id_date = %s", (id_date_import,))
+                return False
+
+            cursor.execute(MATERIALIZE.format(
+                id=int(id_date_import), source=SnapshotDeltaService.source(cursor, id_date_import)
+            ))
+            cursor.execute("UPDATE date_import SET materialise_le = NOW() WHERE id_date = %s", (id_date_import,))
+
+            cursor.execute("""
+                SELECT id_date
+                FROM date_import
+                WHERE stockage = %s AND materialise_le IS NOT NULL
+                AND materialise_le < NOW() - INTERVAL %s SECOND
+                ORDER BY materialise_le DESC
+                LIMIT 18446744073709551615 OFFSET %s
+            """, (STOCKAGE_DELTA, DELTA_CACHE_GRACE_SECONDS, max(DELTA_CACHE_IMPORTS - 1, 0)))
+            SnapshotDeltaService._evict(
+                cursor, [r['id_date'] for r in cursor.fetchall()], grace=DELTA_CACHE_GRACE_SECONDS
+            )
+        return True
+
+    @staticmethod
+    def detach(cursor, id_date_import: int):
+        """
+        Avant la suppression d'une importation: les importations en delta par
+        rapport à elle redeviennent complètes, ses lignes propres au delta et les
+        reconstructions qui la relisaient sont retirées.
+        """
+        cursor.execute(
+            "SELECT id_date FROM date_import WHERE id_precedent = %s AND stockage = %s FOR UPDATE",
+            (id_date_import, STOCKAGE_DELTA)
+        )
+        for row in cursor.fetchall():
+            SnapshotDeltaService._rehydrate(cursor, row['id_date'])
+
+        cursor.execute("SELECT stockage FROM date_import WHERE id_date = %s", (id_date_import,))
+        row = cursor.fetchone()
+        if row and row['stockage'] == STOCKAGE_DELTA:
+            cursor.execute("DELETE FROM snapshot_flat WHERE id_date_import = %s", (id_date_import,))
+        cursor.execute("DELETE FROM snapshot_disparu WHERE id_date_import = %s", (id_date_import,))
+        cursor.execute("DELETE FROM snapshot_herite WHERE id_date_import = %s", (id_date_import,))
+
+        cursor.execute("""
+            SELECT id_date FROM date_import
+            WHERE stockage = %s AND materialise_le IS NOT NULL AND id_date > %s
+        """, (STOCKAGE_DELTA, id_date_import))
+        SnapshotDeltaService._evict(cursor, [r['id_date'] for r in cursor.fetchall()])
+
+    @staticmethod
+    def _rehydrate(cursor, id_date_import: int):
+        """
+        Recopie dans l'importation les versions héritées de sa chaîne, sous leur
+        id_snapshot dans l'importation (snapshot_herite): elle redevient complète
+        """
+        cursor.execute(f"""
+            SELECT s.id_snapshot, s.id_physique, s.etat,
+                i.motif, i.compatibilite_consommable, i.achat_consommable
+            FROM {SnapshotDeltaService.source(cursor, id_date_import)} s
+            LEFT JOIN incident i ON i.id_materiel = s.id_version AND i.id_date_import = s.id_date_import
+            WHERE s.id_date_import <> %s
+            ORDER BY s.id_snapshot
+        """, (id_date_import,))
+        heritees = cursor.fetchall()
+
+        for lot in _chunks(heritees, DELTA_CHUNK_SIZE):
+            cursor.executemany("""
+                INSERT INTO materiel_informatique (id_snapshot, id_physique, etat, id_date_import)
+                VALUES (%s, %s, %s, %s)
+            """, [(r['id_snapshot'], r['id_physique'], r['etat'], id_date_import) for r in lot])
+            incidents = [
+                (r['motif'], r['compatibilite_consommable'], r['achat_consommable'], r['id_snapshot'], id_date_import)
+                for r in lot if r['motif'] is not None
+            ]
+            if incidents:
+                cursor.executemany("""
+                    INSERT INTO incident
+                    (motif, compatibilite_consommable, achat_consommable, id_materiel, id_date_import)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, incidents)
+
+        # Les importations suivantes héritaient des mêmes versions: elles
+        # héritent désormais des lignes recopiées ici
+        cursor.execute("""
+            UPDATE snapshot_herite h
+            JOIN snapshot_herite r ON r.id_date_import = %s AND r.id_version = h.id_version
+            SET h.id_version = r.id_snapshot
+            WHERE h.id_date_import > %s
+        """, (id_date_import, id_date_import))
+        cursor.execute("DELETE FROM snapshot_herite WHERE id_date_import = %s", (id_date_import,))
+        cursor.execute("DELETE FROM snapshot_disparu WHERE id_date_import = %s", (id_date_import,))
+        cursor.execute("DELETE FROM snapshot_flat WHERE id_date_import = %s", (id_date_import,))
+        SnapshotFlatService.insert_batch(cursor, id_date_import, 0)
+        cursor.execute("""
+            UPDATE date_import
+            SET stockage = %s, id_precedent = NULL, materialise_le = NULL
+            WHERE id_date = %s
+        """, (STOCKAGE_COMPLET, id_date_import))
+
+    @staticmethod
+    def _evict(cursor, imports: List[int], grace: int = None):
+        """
+        Retire de snapshot_flat les reconstructions de ces importations en delta.
+        Avec `grace`, une reconstruction marquée entre-temps (materialize) est gardée.
+        """
+        for id_date in imports:
+            if grace is None:
+                cursor.execute("UPDATE date_import SET materialise_le = NULL WHERE id_date = %s", (id_date,))
+            else:
+                cursor.execute("""
+                    UPDATE date_import SET materialise_le = NULL
+                    WHERE id_date = %s AND materialise_le < NOW() - INTERVAL %s SECOND
+                """, (id_date, grace))
+                if cursor.rowcount != 1:
+                    continue
+            cursor.execute("DELETE FROM snapshot_flat WHERE id_date_import = %s", (id_date,))
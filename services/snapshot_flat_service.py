@@ -0,0 +1,88 @@
+import os
+from typing import List
+
+from config.database import Database, execute_query
+
+# Snapshots recopiés par transaction lors du rattrapage
+FLAT_BACKFILL_CHUNK_SIZE = int(os.getenv("FLAT_BACKFILL_CHUNK_SIZE", "20000"))
+
+# Snapshot à plat: jointure matériel physique, localisation, date et incident
+FLAT_INSERT = """
+    INSERT INTO snapshot_flat
+    (id_snapshot, id_date_import, date_import, id_physique, etat, nom_materiel, type,
+     code, region, district, commune, motif, achat_consommable, compatibilite_consommable)
+    SELECT
+        mi.id_snapshot, mi.id_date_import, di.date_complet, mi.id_physique, mi.etat,
+        mp.nom_materiel, mp.type, l.code, l.region, l.district, l.commune,
+        i.motif, i.achat_consommable, i.compatibilite_consommable
+    FROM materiel_informatique mi
+    JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
+    JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
+    JOIN date_import di ON mi.id_date_import = di.id_date
+    LEFT JOIN incident i ON mi.id_snapshot = i.id_materiel AND i.id_date_import = mi.id_date_import
+"""
+
+
+class SnapshotFlatService:
+    """
+    Modèle de lecture dénormalisé des snapshots (table snapshot_flat)
+
+    Une ligne par snapshot avec les colonnes exposées par les listings et le
+    détail: les lectures n'ont plus de jointure. La table est écrite par l'import,
+    lot par lot, dans la transaction qui insère les snapshots.
+    """
+
+    @staticmethod
+    def insert_batch(cursor, id_date_import: int, first_id: int):
+        """Recopie les snapshots d'un lot (id_snapshot >= first_id) de l'importation"""
+        cursor.execute(
+            FLAT_INSERT + " WHERE mi.id_date_import = %s AND mi.id_snapshot >= %s",
+            (id_date_import, first_id)
+        )
+
+    @staticmethod
+    def backfill(force: bool = False) -> List[int]:
+        """
+        Remplit snapshot_flat pour les importations existantes qui n'y sont pas
+        (toutes avec `force`), par lots de FLAT_BACKFILL_CHUNK_SIZE snapshots.
+        Les importations stockées en delta sont reconstruites à la lecture.
+        """
+        if force:
+            query = "SELECT id_date FROM date_import WHERE statut = 'termine' AND stockage = 'complet' ORDER BY id_date"
+        else:
+            query = """
+                SELECT di.id_date
+                FROM date_import di
+                WHERE di.statut = 'termine' AND di.stockage = 'complet'
+                AND NOT EXISTS (SELECT 1 FROM snapshot_flat sf WHERE sf.id_date_import = di.id_date)
+                ORDER BY di.id_date
+            """
+        imports = [r['id_date'] for r in execute_query(query, fetch=True)]
+
+        for id_date_import in imports:
+            with Database.get_cursor() as cursor:
+                cursor.execute("DELETE FROM snapshot_flat WHERE id_date_import = %s", (id_date_import,))
+
+            dernier = 0
+            while True:
+                with Database.get_cursor() as cursor:
+                    cursor.execute("""
+                        SELECT MAX(id_snapshot) AS dernier
+                        FROM (
+                            SELECT id_snapshot
+                            FROM materiel_informatique
+                            WHERE id_date_import = %s AND id_snapshot > %s
+                            ORDER BY id_snapshot
+                            LIMIT %s
+                        ) lot
+                    """, (id_date_import, dernier, FLAT_BACKFILL_CHUNK_SIZE))
+                    fin = cursor.fetchone()['dernier']
+                    if fin is None:
+                        break
+                    cursor.execute(
+                        FLAT_INSERT + " WHERE mi.id_date_import = %s AND mi.id_snapshot > %s AND mi.id_snapshot <= %s",
+                        (id_date_import, dernier, fin)
+                    )
+                dernier = fin
+
+        return imports
@@ -1,40 +1,122 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from config.database import execute_query
-from typing import Optional
+from services.aggregate_service import AggregateService
+from services.cube_service import CubeService
+from services.diff_service import DiffService
+from typing import Iterable, Optional, Tuple
+
+# Sections calculées en parallèle, chacune sur sa connexion du pool. Exécuteur
+# distinct de celui des routes: get_statistics tourne déjà dans ce dernier et
+# ne doit pas attendre des tâches placées derrière lui.
+STATS_WORKERS = int(os.getenv("STATS_WORKERS", "6"))
+
+# Délai maximal du calcul de toutes les sections (secondes)
+STATS_DEADLINE = float(os.getenv("STATS_DEADLINE_SECONDS", "10"))
+
+_sections_executor = ThreadPoolExecutor(max_workers=STATS_WORKERS, thread_name_prefix="stats")
+
+# Sections de StatistiquesResponse (nouveau_materiel et materiel_perdu viennent du même calcul)
+SECTIONS = (
+    "nouveau_materiel",
+    "materiel_perdu",
+    "top_5_districts_pannes",
+    "pannes_par_type_materiel",
+    "materiels_par_region",
+    "etat_6_dernieres_importations",
+    "resume_global"
+)
+
+# Tableau de bord: tout sauf les différences avec l'importation précédente
+# (anti-jointures sur les snapshots), le reste est lu dans les synthèses
+DASHBOARD_SECTIONS = tuple(s for s in SECTIONS if s not in ("nouveau_materiel", "materiel_perdu"))
 
 class StatisticsService:
     
+    @staticmethod
+    def parse_sections(value: Optional[str]) -> Tuple[str, ...]:
+        """
+        Sections demandées ("resume_global,materiels_par_region"), dans l'ordre de
+        SECTIONS; toutes si `value` est None. Lève ValueError pour une section inconnue.
+        """
+        if value is None:
+            return SECTIONS
+        demandees = {s.strip() for s in value.split(",") if s.strip()}
+        return StatisticsService._check_sections(demandees)
+    
+    @staticmethod
+    def _check_sections(sections: Iterable[str]) -> Tuple[str, ...]:
+        demandees = set(sections)
+        inconnues = demandees - set(SECTIONS)
+        if inconnues:
+            raise ValueError(
+                f"Sections inconnues: {', '.join(sorted(inconnues))} "
+                f"(disponibles: {', '.join(SECTIONS)})"
+            )
+        if not demandees:
+            raise ValueError("Aucune section demandée")
+        return tuple(s for s in SECTIONS if s in demandees)
+    
     @staticmethod
     def get_statistics(id_date_import: int, skip_type: int = 0, limit_type: int = 100, 
-                       skip_region: int = 0, limit_region: int = 100):
-        """Calcule toutes les statistiques pour une date d'importation donnée"""
-        
-        # 1. Nouveau matériel et matériel perdu
-        nouveau_materiel, materiel_perdu = StatisticsService._calculate_materiel_changes(id_date_import)
-        
-        # 2. Top 5 districts avec le plus de pannes
-        top_5_districts = StatisticsService._get_top_5_districts_pannes(id_date_import)
-        
-        # 3. Pannes par type de matériel
-        pannes_par_type = StatisticsService._get_pannes_par_type(id_date_import, skip_type, limit_type)
+                       skip_region: int = 0, limit_region: int = 100,
+                       sections: Iterable[str] = SECTIONS):
+        """
+        Calcule les statistiques d'une date d'importation, limitées à `sections`
+        (les autres clés sont absentes du résultat).
+        Lève ValueError pour une section inconnue et TimeoutError si les sections
+        ne sont pas calculées dans STATS_DEADLINE.
+        """
+        sections = StatisticsService._check_sections(sections)
+        
+        # Les synthèses sont calculées à l'import; rattrapage des imports antérieurs
+        AggregateService.ensure_up_to(id_date_import)
+        
+        calculs = {
+            # 1. Nouveau matériel et matériel perdu
+            "materiel_changes": (StatisticsService._calculate_materiel_changes, (id_date_import,)),
+            # 2. Top 5 districts avec le plus de pannes
+            "top_5_districts_pannes": (StatisticsService._get_top_5_districts_pannes, (id_date_import,)),
+            # 3. Pannes par type de matériel
+            "pannes_par_type_materiel": (StatisticsService._get_pannes_par_type, (id_date_import, skip_type, limit_type)),
+            # 4. Matériels par région
+            "materiels_par_region": (StatisticsService._get_materiels_par_region, (id_date_import, skip_region, limit_region)),
+            # 5. État des 6 dernières importations
+            "etat_6_dernieres_importations": (StatisticsService._get_etat_6_dernieres_importations, (id_date_import,)),
+            # 6. Résumé global
+            "resume_global": (StatisticsService._get_resume_global, (id_date_import,))
+        }
+        demandes = {"materiel_changes" if s in ("nouveau_materiel", "materiel_perdu") else s for s in sections}
+        resultats = StatisticsService._run_sections({nom: calculs[nom] for nom in demandes})
         
-        # 4. Matériels par région
-        materiels_par_region = StatisticsService._get_materiels_par_region(id_date_import, skip_region, limit_region)
+        if "materiel_changes" in resultats:
+            nouveau_materiel, materiel_perdu = resultats.pop("materiel_changes")
+            resultats["nouveau_materiel"] = nouveau_materiel
+            resultats["materiel_perdu"] = materiel_perdu
         
-        # 5. État des 6 dernières importations
-        etat_6_dernieres = StatisticsService._get_etat_6_dernieres_importations(id_date_import)
+        return {s: resultats[s] for s in sections}
+    
+    @staticmethod
+    def _run_sections(sections: dict, deadline: Optional[float] = None) -> dict:
+        """
+        Exécute en parallèle les sections {nom: (fonction, arguments)} et retourne
+        {nom: résultat}. Au-delà du délai, les sections restantes sont abandonnées
+        (celles déjà démarrées se terminent en arrière-plan) et TimeoutError est levée.
+        """
+        deadline = STATS_DEADLINE if deadline is None else deadline
+        futures = {
+            _sections_executor.submit(func, *args): name
+            for name, (func, args) in sections.items()
+        }
+        done, pending = wait(futures, timeout=deadline)
         
-        # 6. Résumé global
-        resume_global = StatisticsService._get_resume_global(id_date_import)
+        if pending:
+            for future in pending:
+                future.cancel()
+            noms = ", ".join(sorted(futures[f] for f in pending))
+            raise TimeoutError(f"Statistiques non calculées en {deadline:g} s: {noms}")
         
-        return {
-            "nouveau_materiel": nouveau_materiel,
-            "materiel_perdu": materiel_perdu,
-            "top_5_districts_pannes": top_5_districts,
-            "pannes_par_type_materiel": pannes_par_type,
-            "materiels_par_region": materiels_par_region,
-            "etat_6_dernieres_importations": etat_6_dernieres,
-            "resume_global": resume_global
-        }
+        return {futures[f]: f.result() for f in done}
     
     @staticmethod
     def _calculate_materiel_changes(id_date_import: int):
@@ -45,83 +127,45 @@ class StatisticsService:
             SELECT id_date 
             FROM date_import 
             WHERE id_date < %s 
+            AND statut = 'termine'
             ORDER BY id_date DESC 
             LIMIT 1
         """
-        prev_date = execute_query(query_prev, (id_date_import,), fetchone=True)
+        prev_date = execute_query(query_prev, (id_date_import,), fetchone=True, name="stats_date_precedente")
         
         if not prev_date:
             # Première importation
             query_count = """
-                SELECT COUNT(DISTINCT id_physique) as total
-                FROM materiel_informatique
+                SELECT materiels_distincts as total
+                FROM stat_import_resume
                 WHERE id_date_import = %s
             """
-            result = execute_query(query_count, (id_date_import,), fetchone=True)
-            return result['total'], 0
+            result = execute_query(query_count, (id_date_import,), fetchone=True, name="stats_premier_import")
+            return (result['total'] if result else 0), 0
         
         prev_id = prev_date['id_date']
         
-        # Compter les matériels de la date actuelle
-        query_current = """
-            SELECT COUNT(DISTINCT id_physique) as total
-            FROM materiel_informatique
-            WHERE id_date_import = %s
-        """
-        current_count = execute_query(query_current, (id_date_import,), fetchone=True)
-        total_current = current_count['total'] if current_count else 0
-        
-        # Compter les matériels de la date précédente
-        query_previous = """
-            SELECT COUNT(DISTINCT id_physique) as total
-            FROM materiel_informatique
-            WHERE id_date_import = %s
-        """
-        previous_count = execute_query(query_previous, (prev_id,), fetchone=True)
-        total_previous = previous_count['total'] if previous_count else 0
-        
-        # Calculer la différence
-        difference = total_current - total_previous
+        # Différences ensemblistes réelles (et non la différence des effectifs)
+        compteurs = DiffService.counts(prev_id, id_date_import)
         
-        nouveau_materiel = max(0, difference)
-        materiel_perdu = max(0, -difference)
-        
-        return nouveau_materiel, materiel_perdu
+        return compteurs['ajoutes'], compteurs['perdus']
     
     @staticmethod
     def _get_top_5_districts_pannes(id_date_import: int):
         """Récupère le top 5 des districts avec le plus de pannes"""
         
-        query = """
-            SELECT 
-                l.code,
-                l.district,
-                COUNT(CASE WHEN mi.etat = 'Non fonctionnel' THEN 1 END) as nombre_pannes,
-                COUNT(mi.id_snapshot) as total_materielle,
-                ROUND(
-                    (COUNT(CASE WHEN mi.etat = 'Non fonctionnel' THEN 1 END) * 100.0) / 
-                    NULLIF(COUNT(mi.id_snapshot), 0), 
-                    2
-                ) as taux_pannes
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-            WHERE mi.id_date_import = %s
-            GROUP BY l.code, l.district
-            HAVING nombre_pannes > 0
-            ORDER BY nombre_pannes DESC
-            LIMIT 5
-        """
-        
-        results = execute_query(query, (id_date_import,), fetch=True)
+        results = CubeService.rollup(
+            id_date_import, ["code", "district"],
+            tri="materiels_en_panne", limit=5, pannes_seulement=True
+        )
         
         return [
             {
                 "code": r['code'],
                 "district": r['district'],
-                "nombre_pannes": r['nombre_pannes'],
-                "taux_pannes": float(r['taux_pannes']) if r['taux_pannes'] else 0,
-                "total_materielle": r['total_materielle']
+                "nombre_pannes": r['materiels_en_panne'],
+                "taux_pannes": r['taux_en_panne'],
+                "total_materielle": r['total_materiels']
             }
             for r in results
         ]
@@ -130,25 +174,15 @@ class StatisticsService:
     def _get_pannes_par_type(id_date_import: int, skip: int = 0, limit: int = 100):
         """Récupère les pannes par type de matériel avec pagination"""
         
-        query = """
-            SELECT 
-                mp.type,
-                COUNT(mi.id_snapshot) as nombre_pannes
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            WHERE mi.id_date_import = %s 
-            AND mi.etat = 'Non fonctionnel'
-            GROUP BY mp.type
-            ORDER BY nombre_pannes DESC
-            LIMIT %s OFFSET %s
-        """
-        
-        results = execute_query(query, (id_date_import, limit, skip), fetch=True)
+        results = CubeService.rollup(
+            id_date_import, ["type"],
+            tri="materiels_en_panne", skip=skip, limit=limit, pannes_seulement=True
+        )
         
         return [
             {
                 "type": r['type'],
-                "nombre_pannes": r['nombre_pannes']
+                "nombre_pannes": r['materiels_en_panne']
             }
             for r in results
         ]
@@ -157,33 +191,17 @@ class StatisticsService:
     def _get_materiels_par_region(id_date_import: int, skip: int = 0, limit: int = 100):
         """Récupère les statistiques par région avec pagination"""
         
-        query = """
-            SELECT 
-                l.code,
-                l.region,
-                COUNT(mi.id_snapshot) as total_materiels,
-                ROUND(
-                    (COUNT(CASE WHEN mi.etat = 'Fonctionnel' THEN 1 END) * 100.0) / 
-                    NULLIF(COUNT(mi.id_snapshot), 0), 
-                    2
-                ) as taux_fonctionnel
-            FROM materiel_informatique mi
-            JOIN materiel_physique mp ON mi.id_physique = mp.id_physique
-            JOIN localisation l ON mp.code_localisation_ref = l.code_localisation
-            WHERE mi.id_date_import = %s
-            GROUP BY l.code, l.region
-            ORDER BY total_materiels DESC
-            LIMIT %s OFFSET %s
-        """
-        
-        results = execute_query(query, (id_date_import, limit, skip), fetch=True)
+        results = CubeService.rollup(
+            id_date_import, ["code", "region"],
+            tri="total_materiels", skip=skip, limit=limit
+        )
         
         return [
             {
                 "code": r['code'],
                 "region": r['region'],
                 "total_materiels": r['total_materiels'],
-                "taux_fonctionnel": float(r['taux_fonctionnel']) if r['taux_fonctionnel'] else 0
+                "taux_fonctionnel": r['taux_fonctionnement']
             }
             for r in results
         ]
@@ -195,17 +213,17 @@ class StatisticsService:
         query = """
             SELECT 
                 di.date_complet as date_importation,
-                COUNT(CASE WHEN mi.etat = 'Fonctionnel' THEN 1 END) as fonctionnels,
-                COUNT(CASE WHEN mi.etat = 'Non fonctionnel' THEN 1 END) as non_fonctionnels
+                COALESCE(s.materiels_fonctionnels, 0) as fonctionnels,
+                COALESCE(s.materiels_en_panne, 0) as non_fonctionnels
             FROM date_import di
-            LEFT JOIN materiel_informatique mi ON di.id_date = mi.id_date_import
+            LEFT JOIN stat_import_resume s ON di.id_date = s.id_date_import
             WHERE di.id_date <= %s
-            GROUP BY di.id_date, di.date_complet
+            AND di.statut = 'termine'
             ORDER BY di.id_date DESC
             LIMIT 6
         """
         
-        results = execute_query(query, (id_date_import,), fetch=True)
+        results = execute_query(query, (id_date_import,), fetch=True, name="stats_6_dernieres")
         
         # Inverser pour avoir l'ordre chronologique
         results.reverse()
@@ -223,28 +241,13 @@ class StatisticsService:
     def _get_resume_global(id_date_import: int):
         """Calcule le résumé global"""
         
-        query = """
-            SELECT 
-                COUNT(mi.id_snapshot) as total_materiels,
-                COUNT(CASE WHEN mi.etat = 'Fonctionnel' THEN 1 END) as materiels_fonctionnels,
-                COUNT(CASE WHEN mi.etat = 'Non fonctionnel' THEN 1 END) as materiels_en_panne
-            FROM materiel_informatique mi
-            WHERE mi.id_date_import = %s
-        """
-        
-        result = execute_query(query, (id_date_import,), fetchone=True)
-        
-        total = result['total_materiels'] if result else 0
-        fonctionnels = result['materiels_fonctionnels'] if result else 0
-        en_panne = result['materiels_en_panne'] if result else 0
-        
-        taux_fonctionnement = round((fonctionnels * 100.0 / total), 2) if total > 0 else 0
-        taux_en_panne = round((en_panne * 100.0 / total), 2) if total > 0 else 0
+        # Cube agrégé sans dimension: une seule ligne
+        result = CubeService.rollup(id_date_import, [])[0]
         
         return {
-            "total_materiels": total,
-            "materiels_fonctionnels": fonctionnels,
-            "materiels_en_panne": en_panne,
-            "taux_fonctionnement": taux_fonctionnement,
-            "taux_en_panne": taux_en_panne
-        }
\ No newline at end of file
+            "total_materiels": result['total_materiels'],
+            "materiels_fonctionnels": result['materiels_fonctionnels'],
+            "materiels_en_panne": result['materiels_en_panne'],
+            "taux_fonctionnement": result['taux_fonctionnement'],
+            "taux_en_panne": result['taux_en_panne']
+        }
@@ -1,5 +1,42 @@
 -- Corrections et améliorations du schéma de base de données
 -- À exécuter pour corriger les erreurs dans les tables existantes
+-- (client mysql: les procédures de la section 0 utilisent DELIMITER)
+
+-- 0. Ajouts idempotents pour la mise à jour d'une base existante
+-- Une table créée ici est complète; les colonnes et index ajoutés depuis sont
+-- ajoutés par ces procédures seulement s'ils manquent (information_schema), ce
+-- qui permet de rejouer le script sur une base neuve comme sur une ancienne base.
+DROP PROCEDURE IF EXISTS ajouter_colonne;
+DROP PROCEDURE IF EXISTS ajouter_index;
+
+DELIMITER //
+CREATE PROCEDURE ajouter_colonne(IN p_table VARCHAR(64), IN p_colonne VARCHAR(64), IN p_definition TEXT)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND COLUMN_NAME = p_colonne
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE ', p_table, ' ADD COLUMN ', p_colonne, ' ', p_definition);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+
+-- p_definition: clause complète, ex. 'INDEX idx_nom (col1, col2)' ou 'UNIQUE KEY uk_nom (col)'
+CREATE PROCEDURE ajouter_index(IN p_table VARCHAR(64), IN p_index VARCHAR(64), IN p_definition TEXT)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND INDEX_NAME = p_index
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE ', p_table, ' ADD ', p_definition);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
 
 -- 1. Corriger la table materiel_physique (enlever la virgule finale)
 DROP TABLE IF EXISTS materiel_physique;
@@ -26,6 +63,8 @@ CREATE TABLE incident (
 ALTER TABLE materiel_informatique ADD INDEX idx_id_physique (id_physique);
 ALTER TABLE materiel_informatique ADD INDEX idx_id_date_import (id_date_import);
 ALTER TABLE materiel_informatique ADD INDEX idx_etat (etat);
+-- Index couvrant des différences entre importations (anti-jointures)
+ALTER TABLE materiel_informatique ADD INDEX idx_import_physique (id_date_import, id_physique, etat);
 
 ALTER TABLE materiel_physique ADD INDEX idx_code_localisation (code_localisation_ref);
 ALTER TABLE materiel_physique ADD INDEX idx_type (type);
@@ -35,10 +74,146 @@ ALTER TABLE localisation ADD INDEX idx_region (region);
 ALTER TABLE localisation ADD INDEX idx_district (district);
 ALTER TABLE localisation ADD INDEX idx_commune (commune);
 
+-- Clés uniques des référentiels (résolution par lots et upserts lors de l'import)
+-- Sur une base existante, fusionner d'abord les doublons: python manage.py dedup-references
+-- (la commande crée aussi ces clés)
+ALTER TABLE localisation ADD UNIQUE KEY uk_localisation (code, region, district, commune);
+ALTER TABLE materiel_physique ADD UNIQUE KEY uk_materiel_physique (code_localisation_ref, nom_materiel, type);
+
+-- Pagination par curseur de l'historique (upload_date, id_upload)
+ALTER TABLE upload_history ADD INDEX idx_upload_date (upload_date, id_upload);
+
+-- Empreinte SHA-256 du fichier et importation créée (détection des fichiers déjà importés)
+ALTER TABLE upload_history
+    ADD COLUMN file_hash CHAR(64),
+    ADD COLUMN id_date_import INT,
+    ADD INDEX idx_file_hash (file_hash);
+
+-- Importation de chaque incident (clé de partitionnement, voir section 9)
+CALL ajouter_colonne('incident', 'id_date_import', 'INT NOT NULL DEFAULT 0');
+UPDATE incident i
+JOIN materiel_informatique mi ON mi.id_snapshot = i.id_materiel
+SET i.id_date_import = mi.id_date_import;
+
 -- 4. Ajouter des contraintes d'intégrité supplémentaires
 ALTER TABLE users ADD CONSTRAINT unique_mail UNIQUE (mail);
 
--- 5. Script complet de création (si besoin de tout recréer)
+-- 5. File des imports Excel traités en arrière-plan
+-- Nouvelle installation: table complète
+CREATE TABLE IF NOT EXISTS import_job (
+    id_job CHAR(36) PRIMARY KEY,
+    filename VARCHAR(255),
+    file_path VARCHAR(500),
+    file_hash CHAR(64),
+    user_id INT,
+    statut VARCHAR(20) NOT NULL DEFAULT 'en_attente',
+    lignes_total INT,
+    lignes_traitees INT NOT NULL DEFAULT 0,
+    id_date_import INT,
+    lignes_validees INT NOT NULL DEFAULT 0,
+    lignes_inserees INT NOT NULL DEFAULT 0,
+    heritage TEXT,
+    taux_cache_dimensions DECIMAL(5,4),
+    erreur TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME,
+    finished_at DATETIME,
+    worker_id VARCHAR(100),
+    heartbeat_at DATETIME,
+    hash_actif CHAR(64) GENERATED ALWAYS AS (
+        CASE WHEN statut IN ('en_attente', 'en_cours') THEN file_hash END
+    ) STORED,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    INDEX idx_statut (statut, created_at),
+    INDEX idx_file_hash (file_hash, statut),
+    UNIQUE KEY uk_hash_actif (hash_actif)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Base existante (table créée par une version précédente): colonnes ajoutées depuis
+-- Empreinte du fichier importé (imports en file ou en cours du même fichier)
+CALL ajouter_colonne('import_job', 'file_hash', 'CHAR(64) AFTER file_path');
+CALL ajouter_index('import_job', 'idx_file_hash', 'INDEX idx_file_hash (file_hash, statut)');
+
+-- Points de reprise d'un import (lignes validées, héritage de localisation en JSON)
+CALL ajouter_colonne('import_job', 'lignes_validees', 'INT NOT NULL DEFAULT 0 AFTER id_date_import');
+CALL ajouter_colonne('import_job', 'lignes_inserees', 'INT NOT NULL DEFAULT 0 AFTER lignes_validees');
+CALL ajouter_colonne('import_job', 'heritage', 'TEXT AFTER lignes_inserees');
+
+-- Taux de succès du cache des référentiels par import
+CALL ajouter_colonne('import_job', 'taux_cache_dimensions', 'DECIMAL(5,4) AFTER heritage');
+
+-- Worker qui exécute un import et son dernier battement: au redémarrage d'un
+-- worker, seuls les imports dont le worker ne bat plus sont repris
+CALL ajouter_colonne('import_job', 'worker_id', 'VARCHAR(100) AFTER finished_at');
+CALL ajouter_colonne('import_job', 'heartbeat_at', 'DATETIME AFTER worker_id');
+
+-- Un seul import en file ou en cours par fichier (même SHA-256), garanti par la base
+-- même pour deux uploads simultanés. Avant d'ajouter la clé, vérifier qu'aucun
+-- fichier n'a deux imports actifs:
+--     SELECT file_hash, COUNT(*) FROM import_job
+--     WHERE statut IN ('en_attente', 'en_cours') AND file_hash IS NOT NULL
+--     GROUP BY file_hash HAVING COUNT(*) > 1;
+CALL ajouter_colonne('import_job', 'hash_actif', 'CHAR(64) GENERATED ALWAYS AS (
+    CASE WHEN statut IN (''en_attente'', ''en_cours'') THEN file_hash END
+) STORED');
+CALL ajouter_index('import_job', 'uk_hash_actif', 'UNIQUE KEY uk_hash_actif (hash_actif)');
+
+-- Une importation n'est visible qu'une fois terminée ('en_cours' pendant l'import,
+-- 'suppression' en attendant la fin de sa suppression)
+ALTER TABLE date_import ADD COLUMN statut VARCHAR(20) NOT NULL DEFAULT 'termine';
+ALTER TABLE date_import ADD INDEX idx_statut (statut, id_date);
+
+-- 6. Statistiques précalculées par importation (remplies à l'import)
+-- Rattrapage des importations existantes: python manage.py backfill-stats
+CREATE TABLE IF NOT EXISTS stat_import_resume (
+    id_date_import INT PRIMARY KEY,
+    total_materiels INT NOT NULL DEFAULT 0,
+    materiels_fonctionnels INT NOT NULL DEFAULT 0,
+    materiels_en_panne INT NOT NULL DEFAULT 0,
+    materiels_distincts INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (id_date_import) REFERENCES date_import(id_date) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Cube par importation: effectifs par (code, region, district, commune, type, etat),
+-- agrégé à la demande (/statistics/cube, districts, types, régions, résumé)
+CREATE TABLE IF NOT EXISTS stat_cube (
+    id_date_import INT NOT NULL,
+    code VARCHAR(50),
+    region VARCHAR(100),
+    district VARCHAR(100),
+    commune VARCHAR(100),
+    type VARCHAR(50),
+    etat VARCHAR(50),
+    nombre INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (id_date_import) REFERENCES date_import(id_date) ON DELETE CASCADE,
+    INDEX idx_cube_localisation (id_date_import, region, district, commune),
+    INDEX idx_cube_type (id_date_import, type, etat)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Anciennes synthèses par district, région et type, remplacées par stat_cube
+DROP TABLE IF EXISTS stat_import_district;
+DROP TABLE IF EXISTS stat_import_region;
+DROP TABLE IF EXISTS stat_import_type;
+
+-- 7. Normalisation des états déjà importés (même table de correspondance que l'import)
+-- Recalculer ensuite les statistiques: python manage.py backfill-stats --force
+UPDATE materiel_informatique
+SET etat = CASE LOWER(TRIM(etat))
+    WHEN 'fonctionnel' THEN 'Fonctionnel'
+    WHEN 'fonctionelle' THEN 'Fonctionnel'
+    WHEN 'fonctionne' THEN 'Fonctionnel'
+    WHEN 'ok' THEN 'Fonctionnel'
+    WHEN 'non fonctionnel' THEN 'Non fonctionnel'
+    WHEN 'non fonctionelle' THEN 'Non fonctionnel'
+    WHEN 'en panne' THEN 'Non fonctionnel'
+    WHEN 'panne' THEN 'Non fonctionnel'
+    WHEN 'hs' THEN 'Non fonctionnel'
+    WHEN 'hors service' THEN 'Non fonctionnel'
+    ELSE NULLIF(TRIM(etat), '')
+END
+WHERE etat IS NOT NULL;
+
+-- 8. Script complet de création (si besoin de tout recréer)
 -- Décommenter si vous partez de zéro
 
 /*
@@ -55,12 +230,20 @@ CREATE TABLE localisation (
     INDEX idx_code (code),
     INDEX idx_region (region),
     INDEX idx_district (district),
-    INDEX idx_commune (commune)
+    INDEX idx_commune (commune),
+    UNIQUE KEY uk_localisation (code, region, district, commune)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE date_import (
     id_date INT AUTO_INCREMENT PRIMARY KEY,
-    date_complet DATE DEFAULT (CURRENT_DATE)
+    date_complet DATE DEFAULT (CURRENT_DATE),
+    statut VARCHAR(20) NOT NULL DEFAULT 'termine',
+    cycle_vie BOOLEAN NOT NULL DEFAULT FALSE,
+    stockage VARCHAR(10) NOT NULL DEFAULT 'complet',
+    id_precedent INT NULL,
+    materialise_le DATETIME NULL,
+    INDEX idx_statut (statut, id_date),
+    INDEX idx_stockage (stockage, materialise_le)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE materiel_physique (
@@ -70,7 +253,8 @@ CREATE TABLE materiel_physique (
     type VARCHAR(50) NOT NULL,
     FOREIGN KEY (code_localisation_ref) REFERENCES localisation(code_localisation),
     INDEX idx_code_localisation (code_localisation_ref),
-    INDEX idx_type (type)
+    INDEX idx_type (type),
+    UNIQUE KEY uk_materiel_physique (code_localisation_ref, nom_materiel, type)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE materiel_informatique (
@@ -82,7 +266,23 @@ CREATE TABLE materiel_informatique (
     FOREIGN KEY (id_date_import) REFERENCES date_import(id_date),
     INDEX idx_id_physique (id_physique),
     INDEX idx_id_date_import (id_date_import),
-    INDEX idx_etat (etat)
+    INDEX idx_etat (etat),
+    INDEX idx_import_physique (id_date_import, id_physique, etat),
+    INDEX idx_physique_import (id_physique, id_date_import)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE snapshot_disparu (
+    id_date_import INT NOT NULL,
+    id_physique INT NOT NULL,
+    PRIMARY KEY (id_physique, id_date_import),
+    INDEX idx_disparu_import (id_date_import)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE snapshot_herite (
+    id_snapshot INT PRIMARY KEY,
+    id_date_import INT NOT NULL,
+    id_version INT NOT NULL,
+    UNIQUE KEY uk_herite_version (id_date_import, id_version)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE incident (
@@ -91,9 +291,36 @@ CREATE TABLE incident (
     compatibilite_consommable VARCHAR(100),
     achat_consommable VARCHAR(100),
     id_materiel INT,
+    id_date_import INT NOT NULL DEFAULT 0,
     FOREIGN KEY (id_materiel) REFERENCES materiel_informatique(id_snapshot) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+CREATE TABLE snapshot_flat (
+    id_snapshot INT NOT NULL,
+    id_date_import INT NOT NULL,
+    date_import DATE,
+    id_physique INT NOT NULL,
+    etat VARCHAR(50),
+    nom_materiel VARCHAR(100),
+    type VARCHAR(50),
+    code VARCHAR(50),
+    region VARCHAR(100),
+    district VARCHAR(100),
+    commune VARCHAR(100),
+    motif VARCHAR(200),
+    achat_consommable VARCHAR(100),
+    compatibilite_consommable VARCHAR(100),
+    PRIMARY KEY (id_date_import, id_snapshot),
+    INDEX idx_flat_snapshot (id_snapshot),
+    INDEX idx_flat_commune (id_date_import, commune, id_snapshot),
+    INDEX idx_flat_code (id_date_import, code, id_snapshot),
+    INDEX idx_flat_region (id_date_import, region, id_snapshot),
+    INDEX idx_flat_district (id_date_import, district, id_snapshot),
+    INDEX idx_flat_type (id_date_import, type, id_snapshot),
+    INDEX idx_flat_etat (id_date_import, etat, id_snapshot),
+    INDEX idx_flat_code_toutes (code, id_snapshot)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 CREATE TABLE users (
     id INT AUTO_INCREMENT PRIMARY KEY,
     mail VARCHAR(255) NOT NULL UNIQUE,
@@ -106,6 +333,285 @@ CREATE TABLE upload_history (
     filename VARCHAR(255),
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     user_id INT,
-    FOREIGN KEY (user_id) REFERENCES users(id)
+    file_hash CHAR(64),
+    id_date_import INT,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    INDEX idx_upload_date (upload_date, id_upload),
+    INDEX idx_file_hash (file_hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE import_job (
+    id_job CHAR(36) PRIMARY KEY,
+    filename VARCHAR(255),
+    file_path VARCHAR(500),
+    file_hash CHAR(64),
+    user_id INT,
+    statut VARCHAR(20) NOT NULL DEFAULT 'en_attente',
+    lignes_total INT,
+    lignes_traitees INT NOT NULL DEFAULT 0,
+    id_date_import INT,
+    lignes_validees INT NOT NULL DEFAULT 0,
+    lignes_inserees INT NOT NULL DEFAULT 0,
+    heritage TEXT,
+    taux_cache_dimensions DECIMAL(5,4),
+    erreur TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME,
+    finished_at DATETIME,
+    worker_id VARCHAR(100),
+    heartbeat_at DATETIME,
+    hash_actif CHAR(64) GENERATED ALWAYS AS (
+        CASE WHEN statut IN ('en_attente', 'en_cours') THEN file_hash END
+    ) STORED,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    INDEX idx_statut (statut, created_at),
+    INDEX idx_file_hash (file_hash, statut),
+    UNIQUE KEY uk_hash_actif (hash_actif)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE stat_import_resume (
+    id_date_import INT PRIMARY KEY,
+    total_materiels INT NOT NULL DEFAULT 0,
+    materiels_fonctionnels INT NOT NULL DEFAULT 0,
+    materiels_en_panne INT NOT NULL DEFAULT 0,
+    materiels_distincts INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (id_date_import) REFERENCES date_import(id_date) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE stat_cube (
+    id_date_import INT NOT NULL,
+    code VARCHAR(50),
+    region VARCHAR(100),
+    district VARCHAR(100),
+    commune VARCHAR(100),
+    type VARCHAR(50),
+    etat VARCHAR(50),
+    nombre INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (id_date_import) REFERENCES date_import(id_date) ON DELETE CASCADE,
+    INDEX idx_cube_localisation (id_date_import, region, district, commune),
+    INDEX idx_cube_type (id_date_import, type, etat)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-*/
\ No newline at end of file
+
+CREATE TABLE materiel_cycle_vie (
+    id_physique INT PRIMARY KEY,
+    premier_import INT NOT NULL,
+    premiere_date DATE,
+    dernier_import INT NOT NULL,
+    derniere_date DATE,
+    etat_courant VARCHAR(50),
+    import_changement INT NOT NULL,
+    date_changement DATE,
+    serie_pannes INT NOT NULL DEFAULT 0,
+    nb_imports INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE materiel_etat_periode (
+    id_physique INT NOT NULL,
+    import_debut INT NOT NULL,
+    date_debut DATE,
+    import_fin INT NOT NULL,
+    date_fin DATE,
+    etat VARCHAR(50),
+    nb_imports INT NOT NULL DEFAULT 1,
+    import_cloture INT,
+    date_cloture DATE,
+    etat_suivant VARCHAR(50),
+    PRIMARY KEY (id_physique, import_debut),
+    INDEX idx_periode_etat (etat, etat_suivant)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE cycle_vie_etat (
+    id TINYINT PRIMARY KEY,
+    dernier_import INT NOT NULL DEFAULT 0,
+    a_reconstruire BOOLEAN NOT NULL DEFAULT TRUE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO cycle_vie_etat (id, dernier_import, a_reconstruire) VALUES (1, 0, FALSE);
+
+CREATE TABLE donnees_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO donnees_version (id, version) VALUES (1, 0);
+
+CREATE TABLE referentiel_generation (
+    id TINYINT PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO referentiel_generation (id, generation) VALUES (1, 0);
+*/
+
+-- 9. Partitionnement par importation (optionnel, grosses bases)
+-- Une partition LIST par importation pour materiel_informatique, incident et
+-- snapshot_flat (section 10, clé primaire déjà compatible): les requêtes d'une
+-- importation ne lisent que sa partition, la suppression d'une importation
+-- retire sa partition. Les tables partitionnées n'acceptent pas de
+-- clé étrangère, et chaque clé unique doit contenir id_date_import.
+-- Migration (réécrit les tables, à lancer sans import en cours):
+--     python manage.py partition
+-- Les partitions des nouvelles importations sont créées par l'import.
+-- Équivalent SQL (noms des clés étrangères à relever dans SHOW CREATE TABLE):
+/*
+ALTER TABLE incident DROP FOREIGN KEY incident_ibfk_1;
+ALTER TABLE materiel_informatique DROP FOREIGN KEY materiel_informatique_ibfk_1;
+ALTER TABLE materiel_informatique DROP FOREIGN KEY materiel_informatique_ibfk_2;
+
+ALTER TABLE materiel_informatique
+    DROP PRIMARY KEY, ADD PRIMARY KEY (id_snapshot, id_date_import)
+    PARTITION BY LIST (id_date_import) (
+        PARTITION p0 VALUES IN (0),
+        PARTITION p1 VALUES IN (1),
+        PARTITION p2 VALUES IN (2)
+    );
+
+ALTER TABLE incident
+    DROP PRIMARY KEY, ADD PRIMARY KEY (id_incident, id_date_import)
+    PARTITION BY LIST (id_date_import) (
+        PARTITION p0 VALUES IN (0),
+        PARTITION p1 VALUES IN (1),
+        PARTITION p2 VALUES IN (2)
+    );
+
+-- Nouvelle importation n (avant d'y insérer des lignes)
+ALTER TABLE materiel_informatique ADD PARTITION (PARTITION p3 VALUES IN (3));
+ALTER TABLE incident ADD PARTITION (PARTITION p3 VALUES IN (3));
+
+-- Suppression d'une importation
+ALTER TABLE materiel_informatique DROP PARTITION p3;
+ALTER TABLE incident DROP PARTITION p3;
+*/
+
+-- 10. Modèle de lecture des snapshots (listings et détail sans jointure)
+-- Une ligne par snapshot, écrite par l'import; index composites (importation, filtre, id)
+-- pour les filtres et le tri des listings. Importations existantes:
+--     python manage.py backfill-flat
+CREATE TABLE IF NOT EXISTS snapshot_flat (
+    id_snapshot INT NOT NULL,
+    id_date_import INT NOT NULL,
+    date_import DATE,
+    id_physique INT NOT NULL,
+    etat VARCHAR(50),
+    nom_materiel VARCHAR(100),
+    type VARCHAR(50),
+    code VARCHAR(50),
+    region VARCHAR(100),
+    district VARCHAR(100),
+    commune VARCHAR(100),
+    motif VARCHAR(200),
+    achat_consommable VARCHAR(100),
+    compatibilite_consommable VARCHAR(100),
+    PRIMARY KEY (id_date_import, id_snapshot),
+    INDEX idx_flat_snapshot (id_snapshot),
+    INDEX idx_flat_commune (id_date_import, commune, id_snapshot),
+    INDEX idx_flat_code (id_date_import, code, id_snapshot),
+    INDEX idx_flat_region (id_date_import, region, id_snapshot),
+    INDEX idx_flat_district (id_date_import, district, id_snapshot),
+    INDEX idx_flat_type (id_date_import, type, id_snapshot),
+    INDEX idx_flat_etat (id_date_import, etat, id_snapshot),
+    INDEX idx_flat_code_toutes (code, id_snapshot)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 11. Cycle de vie des matériels (historique /materiels/{id_physique}/history, MTTR/MTBF)
+-- materiel_cycle_vie: une ligne par matériel physique; materiel_etat_periode: une
+-- ligne par suite d'importations dans le même état. Tenues à jour par l'import,
+-- importation par importation (date_import.cycle_vie), avec reconstruction complète
+-- quand une importation appliquée est supprimée ou que les importations se terminent
+-- dans le désordre. Les importations existantes sont reprises au premier import
+-- (a_reconstruire), ou par: python manage.py rebuild-lifecycle
+ALTER TABLE date_import ADD COLUMN cycle_vie BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS materiel_cycle_vie (
+    id_physique INT PRIMARY KEY,
+    premier_import INT NOT NULL,
+    premiere_date DATE,
+    dernier_import INT NOT NULL,
+    derniere_date DATE,
+    etat_courant VARCHAR(50),
+    import_changement INT NOT NULL,
+    date_changement DATE,
+    serie_pannes INT NOT NULL DEFAULT 0,
+    nb_imports INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS materiel_etat_periode (
+    id_physique INT NOT NULL,
+    import_debut INT NOT NULL,
+    date_debut DATE,
+    import_fin INT NOT NULL,
+    date_fin DATE,
+    etat VARCHAR(50),
+    nb_imports INT NOT NULL DEFAULT 1,
+    import_cloture INT,
+    date_cloture DATE,
+    etat_suivant VARCHAR(50),
+    PRIMARY KEY (id_physique, import_debut),
+    INDEX idx_periode_etat (etat, etat_suivant)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS cycle_vie_etat (
+    id TINYINT PRIMARY KEY,
+    dernier_import INT NOT NULL DEFAULT 0,
+    a_reconstruire BOOLEAN NOT NULL DEFAULT TRUE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO cycle_vie_etat (id, dernier_import, a_reconstruire) VALUES (1, 0, TRUE);
+
+-- 12. Stockage des snapshots en delta (optionnel, SNAPSHOT_STORAGE=delta)
+-- Une importation en delta ne garde que les matériels dont l'état ou l'incident a
+-- changé depuis l'importation précédente (id_precedent); les matériels absents
+-- sont notés dans snapshot_disparu. Une importation sur DELTA_KEYFRAME_INTERVAL
+-- reste complète. L'état complet d'une importation en delta est recalculé en
+-- remontant la chaîne et matérialisé à la demande dans snapshot_flat
+-- (materialise_le, DELTA_CACHE_IMPORTS importations au plus).
+-- Compactage des importations existantes: python manage.py compact-snapshots
+ALTER TABLE date_import
+    ADD COLUMN stockage VARCHAR(10) NOT NULL DEFAULT 'complet',
+    ADD COLUMN id_precedent INT NULL,
+    ADD COLUMN materialise_le DATETIME NULL,
+    ADD INDEX idx_stockage (stockage, materialise_le);
+
+CREATE TABLE IF NOT EXISTS snapshot_disparu (
+    id_date_import INT NOT NULL,
+    id_physique INT NOT NULL,
+    PRIMARY KEY (id_physique, id_date_import),
+    INDEX idx_disparu_import (id_date_import)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Snapshots retirés par le compactage: chacun garde son id_snapshot dans son
+-- importation, porté par la version de même contenu qui le remplace (id_version).
+-- Les listings, le détail et les différences rendent les mêmes ids qu'en stockage complet
+CREATE TABLE IF NOT EXISTS snapshot_herite (
+    id_snapshot INT PRIMARY KEY,
+    id_date_import INT NOT NULL,
+    id_version INT NOT NULL,
+    UNIQUE KEY uk_herite_version (id_date_import, id_version)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Dernière version d'un matériel dans la chaîne d'une importation
+ALTER TABLE materiel_informatique ADD INDEX idx_physique_import (id_physique, id_date_import);
+
+-- 13. Version des données partagée par les workers (caches des réponses)
+-- Incrémentée à chaque import terminé ou suppression d'importation; chaque worker
+-- la relit (DATA_VERSION_CHECK_SECONDS) et vide ses caches quand elle change
+CREATE TABLE IF NOT EXISTS donnees_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO donnees_version (id, version) VALUES (1, 0);
+
+-- 14. Génération des référentiels (cache des localisations et matériels des imports)
+-- Incrémentée par python manage.py dedup-references; chaque worker de l'API recharge
+-- son cache des référentiels au prochain import quand elle a changé
+CREATE TABLE IF NOT EXISTS referentiel_generation (
+    id TINYINT PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO referentiel_generation (id, generation) VALUES (1, 0);
+
+-- Fin de la mise à jour
+DROP PROCEDURE IF EXISTS ajouter_colonne;
+DROP PROCEDURE IF EXISTS ajouter_index;
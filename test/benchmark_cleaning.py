@@ -0,0 +1,99 @@
+"""
+Benchmark du nettoyage des lignes importées: boucle ligne par ligne (ancien
+traitement de process_excel_file) contre nettoyage vectorisé (CleaningService).
+
+Pour exécuter: python test/benchmark_cleaning.py [nombre_de_lignes]
+"""
+
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.cleaning_service import CleaningService
+from services.excel_reader import COLONNES_EXCEL
+
+ETATS = ['Fonctionnel', 'Non fonctionnel', ' en panne', 'HS', 'ok', '', None]
+MOTIFS = [None, '', 'Lany encre', ' Tsy hay ny mampiasa azy \n', 'Simba']
+
+
+def generate_records(n: int) -> list:
+    """Lignes brutes telles que lues dans un fichier Excel"""
+    random.seed(42)
+    records = []
+    for i in range(n):
+        debut_commune = i % 20 == 0
+        records.append({
+            'code': 630000.0 + i // 20 if debut_commune else None,
+            'region': 'ATSIMO ANDREFANA' if debut_commune else None,
+            'district': f'DISTRICT {i // 200}' if debut_commune else None,
+            'commune': f' Commune {i // 20} ' if debut_commune else None,
+            'nom_materiel': f'Imprimante {i % 20}',
+            'etat_materiel': random.choice(ETATS),
+            'type_materiel': 'Imprimante',
+            'motif': random.choice(MOTIFS),
+            'achat_consommable': random.choice(['ENY', 'TSIA', None]),
+            'compatibilite_consomm': None
+        })
+    return records
+
+
+def clean_loop(records: list) -> list:
+    """Ancien traitement: DataFrame, ffill puis nettoyage ligne par ligne"""
+    df = pd.DataFrame.from_records(records, columns=COLONNES_EXCEL)
+    df = df.where(pd.notna(df), None)
+    for col in ['code', 'region', 'district', 'commune']:
+        df[col] = df[col].ffill()
+
+    colonnes_texte = ['code', 'region', 'district', 'commune', 'nom_materiel', 'etat_materiel', 'type_materiel']
+    rows = []
+    for record in df.to_dict('records'):
+        row = {
+            col: None if record.get(col) is None or pd.isna(record.get(col)) else record.get(col)
+            for col in COLONNES_EXCEL
+        }
+        for col in colonnes_texte:
+            value = row[col]
+            if value is not None:
+                value = str(value).strip()
+                value = value if value != '' else None
+            row[col] = value
+        row['etat'] = row.pop('etat_materiel')
+        rows.append(row)
+    return rows
+
+
+def clean_vectorized(records: list) -> list:
+    return CleaningService.clean_batch(records, {})
+
+
+def measure(func, records: list, repeat: int = 5) -> float:
+    """Meilleur temps sur `repeat` exécutions (secondes)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(records)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    records = generate_records(n)
+
+    print(f"Nettoyage de {n} lignes (meilleur de 5 exécutions)")
+    resultats = {}
+    for nom, func in [("boucle ligne par ligne", clean_loop), ("vectorisé", clean_vectorized)]:
+        duree = measure(func, records)
+        resultats[nom] = duree
+        print(f"  {nom:<24} {duree:8.3f} s   {duree / n * 1e6:8.2f} µs/ligne")
+
+    gain = resultats["boucle ligne par ligne"] / resultats["vectorisé"]
+    print(f"  Rapport: x{gain:.1f}")
+
+
+if __name__ == "__main__":
+    main()
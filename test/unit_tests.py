@@ -118,33 +118,218 @@ class TestStatisticsService:
         assert nouveau == 100
         assert perdu == 0
     
+    @patch('services.statistics_service.DiffService.counts')
     @patch('services.statistics_service.execute_query')
-    def test_calculate_materiel_changes_growth(self, mock_query):
+    def test_calculate_materiel_changes_growth(self, mock_query, mock_counts):
         """Test calcul avec croissance"""
         mock_query.side_effect = [
-            {'id_date': 1},  # Date précédente existe
-            {'total': 120},  # Total actuel
-            {'total': 100}   # Total précédent
+            {'id_date': 1}  # Date précédente existe
         ]
+        mock_counts.return_value = {'ajoutes': 20, 'perdus': 0, 'modifies': 3}
         
         nouveau, perdu = StatisticsService._calculate_materiel_changes(2)
         
         assert nouveau == 20
         assert perdu == 0
+        mock_counts.assert_called_once_with(1, 2)
     
+    @patch('services.statistics_service.DiffService.counts')
     @patch('services.statistics_service.execute_query')
-    def test_calculate_materiel_changes_loss(self, mock_query):
-        """Test calcul avec perte"""
+    def test_calculate_materiel_changes_swap(self, mock_query, mock_counts):
+        """Un remplacement à effectif constant compte un ajout et une perte"""
         mock_query.side_effect = [
-            {'id_date': 1},  # Date précédente existe
-            {'total': 80},   # Total actuel
-            {'total': 100}   # Total précédent
+            {'id_date': 1}  # Date précédente existe
         ]
+        mock_counts.return_value = {'ajoutes': 5, 'perdus': 5, 'modifies': 0}
         
         nouveau, perdu = StatisticsService._calculate_materiel_changes(2)
         
-        assert nouveau == 0
-        assert perdu == 20
+        assert nouveau == 5
+        assert perdu == 5
+
+    def test_sections_run_concurrently(self):
+        """Les sections s'exécutent en même temps (barrière franchie à deux)"""
+        import threading
+        barriere = threading.Barrier(2, timeout=2)
+
+        def section(valeur):
+            barriere.wait()
+            return valeur
+
+        result = StatisticsService._run_sections({
+            "a": (section, (1,)),
+            "b": (section, (2,))
+        })
+
+        assert result == {"a": 1, "b": 2}
+
+    def test_sections_deadline(self):
+        """Une section trop lente fait échouer le calcul dans le délai"""
+        import time
+
+        with pytest.raises(TimeoutError, match="lente"):
+            StatisticsService._run_sections({
+                "rapide": (lambda: 1, ()),
+                "lente": (time.sleep, (0.5,))
+            }, deadline=0.05)
+
+    @patch('services.statistics_service.StatisticsService._calculate_materiel_changes')
+    @patch('services.statistics_service.StatisticsService._get_resume_global', return_value={'total_materiels': 4})
+    @patch('services.statistics_service.AggregateService.ensure_up_to')
+    def test_only_requested_sections(self, mock_ensure, mock_resume, mock_changes):
+        """Seules les sections demandées sont calculées et renvoyées"""
+        result = StatisticsService.get_statistics(3, sections=StatisticsService.parse_sections("resume_global"))
+
+        assert result == {'resume_global': {'total_materiels': 4}}
+        mock_changes.assert_not_called()
+
+        with pytest.raises(ValueError, match="inconnues: inconnue"):
+            StatisticsService.parse_sections("resume_global, inconnue")
+
+class TestAggregateService:
+    """Tests pour les synthèses précalculées par importation"""
+
+    def test_build_replaces_each_table(self):
+        """Chaque table de synthèse est vidée pour l'importation puis remplie"""
+        from unittest.mock import MagicMock
+        from services.aggregate_service import AggregateService, AGGREGATE_QUERIES
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [{'id_date': 3}]
+
+        AggregateService.build(cursor, 3)
+
+        calls = [c for c in cursor.execute.call_args_list if 'WITH RECURSIVE' not in c.args[0]]
+        assert len(calls) == 2 * len(AGGREGATE_QUERIES)
+        for i, table in enumerate(AGGREGATE_QUERIES):
+            delete, insert = calls[2 * i], calls[2 * i + 1]
+            assert delete.args == (f"DELETE FROM {table} WHERE id_date_import = %s", (3,))
+            assert f"INSERT INTO {table}" in insert.args[0]
+            assert 'WHERE id_date_import = 3' in insert.args[0]
+            assert insert.args[1]['id'] == 3
+
+    @patch('services.aggregate_service.AggregateService.build')
+    @patch('services.aggregate_service.Database.get_cursor')
+    @patch('services.aggregate_service.execute_query')
+    def test_ensure_up_to_builds_missing_only(self, mock_query, mock_cursor, mock_build):
+        """Seules les importations terminées sans synthèse (ou sans cube) sont calculées"""
+        from services.aggregate_service import AggregateService
+        mock_query.return_value = [{'id_date': 2}, {'id_date': 5}]
+
+        assert AggregateService.ensure_up_to(5) == [2, 5]
+        query, params = mock_query.call_args.args
+        assert 's.id_date_import IS NULL' in query and 'NOT EXISTS (SELECT 1 FROM stat_cube' in query
+        assert "di.statut = 'termine'" in query
+        assert params == {"id": 5}
+        assert [c.args[1] for c in mock_build.call_args_list] == [2, 5]
+
+    @patch('services.aggregate_service.AggregateService.build')
+    @patch('services.aggregate_service.Database.get_cursor')
+    @patch('services.aggregate_service.execute_query')
+    def test_backfill_force_selects_all(self, mock_query, mock_cursor, mock_build):
+        """Sans --force seules les synthèses manquantes sont recalculées, avec --force toutes"""
+        from services.aggregate_service import AggregateService
+        mock_query.return_value = [{'id_date': 1}]
+
+        AggregateService.backfill()
+        assert 'IS NULL' in mock_query.call_args.args[0]
+        AggregateService.backfill(force=True)
+        assert 'IS NULL' not in mock_query.call_args.args[0]
+        assert mock_build.call_count == 2
+
+
+class TestCubeService:
+    """Tests pour les agrégats sur le cube"""
+
+    @patch('services.cube_service.execute_query')
+    def test_rollup_slice_and_rates(self, mock_query):
+        """Regroupement par type dans une région, taux calculés sur les effectifs"""
+        from services.cube_service import CubeService
+        mock_query.return_value = [
+            {'type': 'PC', 'total_materiels': 8, 'materiels_fonctionnels': 6, 'materiels_en_panne': 2},
+        ]
+
+        rows = CubeService.rollup(3, ["type"], {"region": "ANALAMANGA", "commune": None},
+                                  tri="materiels_en_panne", pannes_seulement=True)
+
+        query, params = mock_query.call_args.args[:2]
+        assert 'FROM stat_cube' in query and 'JOIN' not in query
+        assert 'region = %(f_region)s' in query and 'commune' not in query
+        assert 'GROUP BY type' in query and 'HAVING materiels_en_panne > 0' in query
+        assert params['f_region'] == 'ANALAMANGA'
+        assert rows == [{'type': 'PC', 'total_materiels': 8, 'materiels_fonctionnels': 6,
+                         'materiels_en_panne': 2, 'taux_fonctionnement': 75.0, 'taux_en_panne': 25.0}]
+
+    def test_rollup_rejects_unknown_dimension(self):
+        """Une dimension hors du cube est refusée avant toute requête"""
+        from services.cube_service import CubeService
+
+        with pytest.raises(ValueError, match="Dimensions inconnues: nom_materiel"):
+            CubeService.rollup(3, ["region", "nom_materiel"])
+
+    @patch('services.cube_service.execute_query')
+    def test_trend_slice_downsampled(self, mock_query):
+        """Tendance d'une tranche: cube filtré dans la jointure, un point par groupe NTILE"""
+        from services.cube_service import CubeService
+        mock_query.return_value = [
+            {'id_date': 4, 'date_complet': '2024-04-01', 'total': 10, 'fonctionnels': 7,
+             'non_fonctionnels': 3, 'imports_regroupes': 2},
+        ]
+
+        points = CubeService.trend({"region": "ANALAMANGA", "type": None}, id_fin=4, points=2)
+
+        query, params = mock_query.call_args.args[:2]
+        assert 'LEFT JOIN stat_cube c ON c.id_date_import = di.id_date AND c.region = %(f_region)s' in query
+        assert 'NTILE(%(points)s)' in query and 'rang = 1' in query
+        assert 'materiel_informatique' not in query and 'c.type' not in query
+        assert params['points'] == 2 and params['fin'] == 4 and params['debut'] is None
+        assert points == [{'id_date_import': 4, 'date_importation': '2024-04-01', 'total_materiels': 10,
+                           'fonctionnels': 7, 'non_fonctionnels': 3, 'imports_regroupes': 2}]
+
+        with pytest.raises(ValueError, match="Filtres inconnus: etat"):
+            CubeService.trend({"etat": "Fonctionnel"})
+
+class TestDiffService:
+    """Tests pour les différences entre importations"""
+
+    @patch('services.diff_service.SnapshotDeltaService.state_source', side_effect=lambda i: f"etat_{i}")
+    @patch('services.diff_service.execute_query')
+    def test_diff_sets_and_cache(self, mock_query, mock_state):
+        """Ajoutés, perdus et modifiés viennent des anti-jointures, puis du cache"""
+        from services.diff_service import DiffService
+        from utils.cache import bump_data_version
+        bump_data_version()
+        mock_query.side_effect = [
+            [{'id_snapshot': 30, 'id_physique': 3}, {'id_snapshot': 29, 'id_physique': 4}],
+            [{'id_snapshot': 12, 'id_physique': 1}],
+            [{'id_snapshot': 28, 'id_physique': 2, 'etat_precedent': 'fonctionnel'}],
+        ]
+
+        diff = DiffService.diff(1, 2)
+
+        assert diff['ajoutes'] == [30, 29]
+        assert diff['perdus'] == [12]
+        assert diff['modifies'] == [28]
+        assert diff['etats_precedents'] == {28: 'fonctionnel'}
+        assert diff['compteurs'] == {'ajoutes': 2, 'perdus': 1, 'modifies': 1}
+        ajoutes_query = mock_query.call_args_list[0].args[0]
+        perdus_query = mock_query.call_args_list[1].args[0]
+        assert 'FROM etat_2 n' in ajoutes_query and 'LEFT JOIN etat_1 o' in ajoutes_query
+        assert 'FROM etat_1 n' in perdus_query and 'LEFT JOIN etat_2 o' in perdus_query
+
+        assert DiffService.counts(1, 2)['ajoutes'] == 2
+        assert mock_query.call_count == 3
+        assert [c.args for c in mock_state.call_args_list] == [(1,), (2,)]
+
+    @patch('services.materiel_service.execute_query')
+    def test_page_of_ids_cursor(self, mock_query):
+        """La page d'une liste précalculée reprend après le curseur"""
+        from services.materiel_service import MaterielService
+        mock_query.return_value = [{'id_snapshot': 15}, {'id_snapshot': 10}]
+
+        MaterielService.page_of_ids([20, 18, 15, 10], 0, 2, after_id=18)
+
+        assert mock_query.call_args.args[1] == (15, 10)
+        assert MaterielService.page_of_ids([20, 18], 0, 2, after_id=18) == []
 
 class TestExcelProcessing:
     """Tests pour le traitement de fichiers Excel"""
@@ -183,10 +368,837 @@ class TestExcelProcessing:
         assert df.iloc[1]['nom_materiel'] is None
         assert df.iloc[2]['nom_materiel'] is None
         assert df.iloc[1]['etat'] is None
+    
+    def test_streaming_reader_batches_and_inheritance(self, tmp_path):
+        """Lecture en flux par lots, lignes vides ignorées, valeurs brutes"""
+        from openpyxl import Workbook
+        from services.excel_reader import ExcelRowReader
+        
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append([' code ', 'region', 'district', 'commune', 'nom_materiel', 'etat_materiel', 'type_materiel'])
+        sheet.append([630601, 'ATSIMO ANDREFANA', 'BETIOKY', 'Ambatry', 'PC 1', 'Fonctionnel', 'PC'])
+        sheet.append([None, None, None, None, 'PC 2', 'En panne', 'PC'])
+        sheet.append([None, None, None, None, None, None, None])
+        sheet.append([None, None, None, None, 'PC 3', 'Fonctionnel', 'PC'])
+        file_path = tmp_path / "import.xlsx"
+        workbook.save(file_path)
+        
+        with ExcelRowReader(str(file_path)) as reader:
+            batches = list(reader.batches(2))
+        
+        assert [len(b) for b in batches] == [2, 1]
+        assert batches[0][0]['code'] == 630601
+        assert batches[1][0]['code'] is None
+        assert batches[1][0]['motif'] is None
+    
+    def test_vectorized_cleaning(self):
+        """Nettoyage par colonnes: espaces, vides, héritage entre lots, états, motifs, codes"""
+        from services.cleaning_service import CleaningService
+        
+        heritage = {}
+        premier = CleaningService.clean_batch([
+            {'code': 645045.0, 'region': ' ANOSY ', 'district': 'BETROKA', 'commune': 'A',
+             'nom_materiel': ' PC 1 ', 'etat_materiel': 'HS', 'type_materiel': 'PC',
+             'motif': ' Lany\n  encre ', 'achat_consommable': '', 'compatibilite_consomm': None},
+        ], heritage)
+        second = CleaningService.clean_batch([
+            {'code': None, 'region': '  ', 'district': None, 'commune': None,
+             'nom_materiel': 'PC 2', 'etat_materiel': ' ok', 'type_materiel': 'PC',
+             'motif': '   ', 'achat_consommable': None, 'compatibilite_consomm': None},
+        ], heritage)
+        
+        assert premier[0]['code'] == '645045'
+        assert premier[0]['region'] == 'ANOSY'
+        assert premier[0]['nom_materiel'] == 'PC 1'
+        assert premier[0]['etat'] == 'Non fonctionnel'
+        assert premier[0]['motif'] == 'Lany encre'
+        assert premier[0]['achat_consommable'] is None
+        assert second[0]['code'] == '645045'
+        assert second[0]['region'] == 'ANOSY'
+        assert second[0]['etat'] == 'Fonctionnel'
+        assert second[0]['motif'] is None
+
+class TestCheckpointedImport:
+    """Tests pour l'import transactionnel avec points de reprise"""
+
+    def _workbook(self, tmp_path, noms):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['code', 'region', 'district', 'commune', 'nom_materiel', 'etat_materiel', 'type_materiel'])
+        for nom in noms:
+            sheet.append(['1', 'R', 'D', 'C', nom, 'ok', 'PC'])
+        file_path = tmp_path / "import.xlsx"
+        workbook.save(file_path)
+        return str(file_path)
+
+    def _run(self, file_path, reprise=None):
+        from services.excel_service import ExcelService
+        connection, cursor = MagicMock(), MagicMock()
+        cursor.lastrowid = 42
+        checkpoints, lots = [], []
+
+        with patch('services.excel_service.Database.get_transaction') as mock_tx, \
+             patch('services.excel_service.dimension_cache.preload'), \
+             patch('services.excel_service.PartitionService.is_partitioned', return_value=False), \
+             patch('services.excel_service.AggregateService.build'), \
+             patch('services.excel_service.LifecycleService.catch_up'), \
+             patch('services.excel_service.BulkImportService.import_rows',
+                   side_effect=lambda c, rows, i, dimensions=None: lots.append(rows) or len(rows)), \
+             patch.object(ExcelService, 'READ_BATCH_SIZE', 1), \
+             patch.object(ExcelService, 'CHECKPOINT_ROWS', 2):
+            mock_tx.return_value.__enter__.return_value = (connection, cursor)
+            result = ExcelService.process_excel_file(
+                file_path, 1, "import.xlsx", reprise=reprise,
+                checkpoint=lambda c, etat: checkpoints.append((c, dict(etat), connection.commit.call_count))
+            )
+        return result, checkpoints, lots, cursor
+
+    def test_checkpoints_and_final_visibility(self, tmp_path):
+        """Validation toutes les CHECKPOINT_ROWS lignes; l'import n'est terminé qu'à la fin"""
+        file_path = self._workbook(tmp_path, ['PC 1', 'PC 2', 'PC 3'])
+
+        result, checkpoints, lots, cursor = self._run(file_path)
+
+        assert result['lignes_inserees'] == 3
+        # Points de reprise écrits sur le curseur de l'import, validés avec les lignes
+        assert [etat['lignes_validees'] for _, etat, _ in checkpoints] == [2, 3]
+        assert all(c is cursor for c, _, _ in checkpoints)
+        assert [validations for _, _, validations in checkpoints] == [0, 1]
+        assert checkpoints[0][1]['id_date_import'] == 42
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert any('SAVEPOINT lot_import' in q for q in queries)
+        assert 'UPDATE date_import SET statut' in queries[-1]
+        assert cursor.execute.call_args_list[-1].args[1] == ('termine', 42)
+
+    def test_resume_skips_validated_rows(self, tmp_path):
+        """Une reprise continue après les lignes validées, sans recréer la date"""
+        file_path = self._workbook(tmp_path, ['PC 1', 'PC 2', 'PC 3'])
+        reprise = {'id_date_import': 7, 'lignes_validees': 2, 'lignes_inserees': 2,
+                   'heritage': {'code': '1', 'region': 'R', 'district': 'D', 'commune': 'C'}}
+
+        result, _, lots, cursor = self._run(file_path, reprise)
+
+        assert [r['nom_materiel'] for lot in lots for r in lot] == ['PC 3']
+        assert result['lignes_inserees'] == 3
+        assert result['id_date_import'] == 7
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert not any('INSERT INTO date_import' in q for q in queries)
+
+class TestImportDeletion:
+    """Tests pour la suppression d'une importation"""
+
+    @patch('services.import_delete_service.bump_data_version')
+    @patch('services.import_delete_service.execute_query')
+    def test_request_delete_hides_then_schedules(self, mock_query, mock_bump):
+        """L'importation est masquée et les caches invalidés avant la suppression en arrière-plan"""
+        from services.import_delete_service import ImportDeleteService
+        mock_query.return_value = {'statut': 'termine'}
+
+        with patch.object(ImportDeleteService, '_executor') as mock_executor, \
+             patch('services.import_delete_service.Database.get_cursor') as mock_cursor:
+            statut = ImportDeleteService.request_delete(5)
+
+        assert statut == 'termine'
+        cursor = mock_cursor.return_value.__enter__.return_value
+        update = cursor.execute.call_args_list[0]
+        assert 'UPDATE date_import SET statut' in update.args[0]
+        assert update.args[1] == ('suppression', 5)
+        # Version partagée incrémentée dans la transaction du masquage
+        mock_bump.assert_called_once_with(cursor)
+        mock_executor.submit.assert_called_once_with(ImportDeleteService._run, 5)
+
+    def test_delete_route_statuses(self):
+        """202 si planifiée, 404 si inconnue, 409 pendant l'import"""
+        from fastapi.testclient import TestClient
+        from main import app
+        from routes.auth import get_current_user
+
+        app.dependency_overrides[get_current_user] = lambda: {'user_id': 1}
+        try:
+            with patch('routes.upload.ImportDeleteService.request_delete',
+                       side_effect=['termine', None, 'en_cours']):
+                client = TestClient(app)
+                planifiee = client.delete("/upload/imports/5")
+                inconnue = client.delete("/upload/imports/6")
+                en_cours = client.delete("/upload/imports/7")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert planifiee.status_code == 202
+        assert planifiee.json()['statut'] == 'suppression'
+        assert inconnue.status_code == 404
+        assert en_cours.status_code == 409
+
+class TestPartitionService:
+    """Tests pour le partitionnement par importation"""
+
+    @patch('services.partition_service.execute_query')
+    def test_ensure_partition_creates_missing_only(self, mock_query):
+        """La partition p<id> est ajoutée aux tables qui ne l'ont pas encore"""
+        from services.partition_service import PartitionService
+
+        def fake_execute_query(query, params=None, fetch=False, fetchone=False, name=None):
+            if fetch:
+                return [{'partition_name': 'p0'}, {'partition_name': 'p9'}] if params == ('incident',) else [{'partition_name': 'p0'}]
+            return None
+        mock_query.side_effect = fake_execute_query
+
+        created = PartitionService.ensure_partition(9)
+
+        assert created == ['materiel_informatique', 'snapshot_flat']
+        ddl = [c.args[0] for c in mock_query.call_args_list if c.args[0].startswith('ALTER')]
+        assert ddl[0] == 'ALTER TABLE materiel_informatique ADD PARTITION (PARTITION p9 VALUES IN (9))'
+
+    @patch('services.import_delete_service.SnapshotDeltaService')
+    @patch('services.import_delete_service.Database.get_cursor')
+    @patch('services.import_delete_service.execute_query', return_value={'total': 120})
+    @patch('services.import_delete_service.PartitionService')
+    def test_delete_drops_partition(self, mock_partitions, mock_query, mock_cursor, mock_delta):
+        """Tables partitionnées: l'importation est supprimée par DROP PARTITION"""
+        from services.import_delete_service import ImportDeleteService
+        mock_partitions.is_partitioned.return_value = True
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = []
+
+        supprimes = ImportDeleteService.delete_import(4)
+
+        assert supprimes == 120
+        mock_partitions.drop_partition.assert_called_once_with(4)
+        mock_delta.detach.assert_called_once_with(cursor, 4)
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert not any('DELETE FROM materiel_informatique' in q for q in queries)
+        assert 'DELETE FROM date_import' in queries[-1]
+
+class TestLifecycleService:
+    """Tests pour le cycle de vie des matériels"""
+
+    @patch('services.lifecycle_service.Database.get_cursor')
+    def test_catch_up_applies_next_import(self, mock_cursor):
+        """Importation suivante appliquée par plages, puis marquée"""
+        from services.lifecycle_service import LifecycleService
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [
+            {'dernier_import': 5, 'a_reconstruire': False}, {'id_date': 6, 'date_complet': '2024-06-01'},
+            {'dernier_import': 6, 'a_reconstruire': False}, None,
+        ]
+        # Importation complète: chaîne réduite à elle-même
+        cursor.fetchall.return_value = [{'id_date': 6}]
+
+        appliquees = LifecycleService.catch_up()
+
+        assert appliquees == [6]
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert 'FOR UPDATE' in queries[0]
+        assert 'WITH RECURSIVE chaine' in queries[2]
+        assert 'UPDATE materiel_etat_periode' in queries[3] and 'INSERT INTO materiel_cycle_vie' in queries[6]
+        assert all('WHERE id_date_import = 6' in q for q in queries[3:7])
+        assert cursor.execute.call_args_list[3].args[1] == {'id': 6, 'date': '2024-06-01', 'ko': 'Non fonctionnel'}
+        assert not any('DELETE FROM materiel_cycle_vie' in q for q in queries)
+        assert 'UPDATE cycle_vie_etat SET dernier_import' in queries[8]
+
+    @patch('services.lifecycle_service.Database.get_cursor')
+    def test_catch_up_rebuilds_out_of_order(self, mock_cursor):
+        """Une importation terminée après une plus récente provoque une reconstruction"""
+        from services.lifecycle_service import LifecycleService
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [
+            {'dernier_import': 7, 'a_reconstruire': False}, {'id_date': 6, 'date_complet': '2024-06-01'},
+            {'dernier_import': 7, 'a_reconstruire': False}, None,
+        ]
+        cursor.fetchall.return_value = [
+            {'id_date': 6, 'date_complet': '2024-06-01', 'stockage': 'complet'},
+            {'id_date': 7, 'date_complet': '2024-07-01', 'stockage': 'complet'},
+        ]
+
+        appliquees = LifecycleService.catch_up()
+
+        assert appliquees == [6, 7]
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        rebuild = next(q for q in queries if 'INSERT INTO materiel_etat_periode' in q)
+        assert 'WHERE mi.id_date_import IN (6, 7)' in rebuild and 'LEAD(etat) OVER s' in rebuild
+        assert 'UPDATE date_import SET cycle_vie = (id_date IN (6, 7))' in queries
+        fin = next(c for c in cursor.execute.call_args_list if 'a_reconstruire = FALSE' in c.args[0])
+        assert fin.args[1] == (7,)
+
+        with pytest.raises(ValueError, match="Regroupement inconnu: commune"):
+            LifecycleService.reliability("commune")
+
+class TestSnapshotDeltaService:
+    """Tests pour le stockage des snapshots en delta"""
+
+    def test_state_sql_walks_chain(self):
+        """L'état d'une importation en delta prend la dernière version de chaque matériel non disparu"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        assert SnapshotDeltaService.state_sql([7]).count('WHERE id_date_import = 7') == 1
+
+        sql = SnapshotDeltaService.state_sql([5, 6, 7])
+        assert 'v.id_date_import IN (5, 6, 7)' in sql
+        assert 'w.id_date_import > v.id_date_import' in sql
+        assert 'FROM snapshot_disparu d' in sql
+        # Id du snapshot dans l'importation 7, pas celui de la version héritée
+        assert 'COALESCE(h.id_snapshot, v.id_snapshot) AS id_snapshot' in sql
+        assert 'h.id_date_import = 7 AND h.id_version = v.id_snapshot' in sql
+
+    @patch('services.snapshot_delta_service.Database.get_cursor')
+    def test_compact_keeps_removed_ids(self, mock_cursor):
+        """Les snapshots inchangés retirés sont notés dans snapshot_herite avant leur suppression"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [{'stockage': 'complet'}, {'id_date': 6}]
+        cursor.fetchall.side_effect = [[{'id_date': 5}, {'id_date': 6}], [{'id_physique': 10}]]
+
+        assert SnapshotDeltaService.compact(7) is True
+
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        herite = next(i for i, q in enumerate(queries) if 'INSERT INTO snapshot_herite' in q)
+        suppression = next(i for i, q in enumerate(queries) if 'DELETE FROM materiel_informatique' in q)
+        assert herite < suppression
+        assert 'o.contenu = n.contenu AND o.rang = n.rang' in queries[herite]
+        assert 'h.id_date_import = 6' in queries[herite]
+        assert cursor.execute.call_args_list[herite].args[1] == [7, 10, 10]
+
+    @patch('services.snapshot_delta_service.SnapshotFlatService.insert_batch')
+    def test_rehydrate_restores_ids(self, mock_flat):
+        """Une importation redevenue complète retrouve ses id_snapshot, repris par les suivantes"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [
+            [{'id_date': 6}, {'id_date': 7}],
+            [{'id_snapshot': 41, 'id_physique': 10, 'etat': 'Fonctionnel', 'motif': 'Toner',
+              'compatibilite_consommable': None, 'achat_consommable': None}],
+        ]
+
+        SnapshotDeltaService._rehydrate(cursor, 7)
+
+        snapshots, incidents = [c.args[1] for c in cursor.executemany.call_args_list]
+        assert snapshots == [(41, 10, 'Fonctionnel', 7)]
+        assert incidents == [('Toner', None, None, 41, 7)]
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        report = next(i for i, q in enumerate(queries) if 'UPDATE snapshot_herite h' in q)
+        retrait = next(i for i, q in enumerate(queries) if 'DELETE FROM snapshot_herite' in q)
+        assert report < retrait
+
+    @patch('services.snapshot_delta_service.DELTA_KEYFRAME_INTERVAL', 3)
+    @patch('services.snapshot_delta_service.Database.get_cursor')
+    def test_compact_keeps_keyframe(self, mock_cursor):
+        """Une chaîne précédente déjà longue laisse l'importation complète"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [{'stockage': 'complet'}, {'id_date': 6}]
+        cursor.fetchall.return_value = [{'id_date': 4}, {'id_date': 5}, {'id_date': 6}]
+
+        assert SnapshotDeltaService.compact(7) is False
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert not any('DELETE FROM materiel_informatique' in q for q in queries)
+        assert not any('UPDATE date_import' in q for q in queries)
+
+    @patch('services.snapshot_delta_service.SnapshotDeltaService.schedule_materialize')
+    @patch('services.snapshot_delta_service.Database.get_cursor')
+    @patch('services.snapshot_delta_service.execute_query')
+    def test_flat_source_reads_chain_without_writing(self, mock_query, mock_cursor, mock_schedule):
+        """Une importation en delta pas encore reconstruite est lue le long de sa chaîne, reconstruction planifiée"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        mock_query.side_effect = [
+            {'stockage': 'delta', 'age': None},
+            [{'id_date': 5}, {'id_date': 6}, {'id_date': 7}],
+            {'stockage': 'complet', 'age': None},
+            {'stockage': 'delta', 'age': 10},
+            # Reconstruction proche de l'éviction: marquage laissé au worker
+            {'stockage': 'delta', 'age': 200},
+            [{'id_date': 6}, {'id_date': 8}],
+        ]
+
+        source = SnapshotDeltaService.flat_source(7)
+
+        assert 'v.id_date_import IN (5, 6, 7)' in source
+        assert '7 AS id_date_import' in source and source.endswith(') sf')
+        mock_schedule.assert_called_once_with(7)
+        assert SnapshotDeltaService.flat_source(4) == "FROM snapshot_flat sf"
+        assert SnapshotDeltaService.flat_source(7) == "FROM snapshot_flat sf"
+        assert 'v.id_date_import IN (6, 8)' in SnapshotDeltaService.flat_source(8)
+        assert mock_schedule.call_args.args == (8,)
+        mock_cursor.assert_not_called()
+        assert not any('UPDATE' in c.args[0] for c in mock_query.call_args_list)
+
+    @patch('services.snapshot_delta_service.Database.get_cursor')
+    def test_materialize_marks_existing_rebuild(self, mock_cursor):
+        """Le worker marque une reconstruction existante au lieu de la refaire"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = {'stockage': 'delta', 'materialise_le': '2026-10-17 10:00:00'}
+
+        assert SnapshotDeltaService.materialize(7) is False
+
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert 'SET materialise_le = NOW()' in queries[-1]
+        assert not any('INSERT INTO snapshot_flat' in q for q in queries)
+
+    def test_eviction_keeps_reread_import(self):
+        """Une reconstruction relue pendant l'éviction n'est pas retirée de snapshot_flat"""
+        from services.snapshot_delta_service import SnapshotDeltaService
+        cursor = MagicMock()
+        relues = {3}
+
+        def execute(query, params):
+            if 'UPDATE date_import' in query:
+                cursor.rowcount = 0 if params[0] in relues else 1
+        cursor.execute.side_effect = execute
+
+        SnapshotDeltaService._evict(cursor, [3, 4], grace=300)
+
+        deletes = [c.args[1] for c in cursor.execute.call_args_list if 'DELETE FROM snapshot_flat' in c.args[0]]
+        assert deletes == [(4,)]
+
+
+class TestAsyncDatabase:
+    """Tests pour la couche d'accès async"""
+
+    def test_execute_query_async_runs_off_event_loop(self):
+        """La requête s'exécute dans un thread de l'exécuteur BD"""
+        import asyncio
+        import threading
+        from config import database
+
+        threads = []
+
+        def fake_execute_query(query, params=None, fetch=False, fetchone=False, name=None):
+            threads.append(threading.current_thread().name)
+            return {'total': 3}
+
+        with patch('config.database.execute_query', side_effect=fake_execute_query):
+            result = asyncio.run(database.execute_query_async("SELECT 1", fetchone=True))
+
+        assert result == {'total': 3}
+        assert threads[0].startswith('db')
+
+class TestBulkImport:
+    """Tests pour l'import ensembliste"""
+
+    def test_plan_localisations_dedup(self):
+        """Les localisations égales selon la collation ne sont résolues qu'une fois"""
+        from services.bulk_import_service import BulkImportService
+        rows = [
+            {'code': '630601', 'region': 'Atsimo', 'district': 'Toliara', 'commune': 'Bétioky'},
+            {'code': '630601', 'region': 'ATSIMO', 'district': 'Toliara', 'commune': 'Betioky'},
+            {'code': '630602', 'region': 'Atsimo', 'district': 'Toliara', 'commune': None},
+        ]
+
+        row_keys, distinct = BulkImportService.plan_localisations(rows)
+
+        assert row_keys[0] == row_keys[1]
+        assert row_keys[2] == ('__null__', 2)
+        assert len(distinct) == 1
+
+    def test_import_rows_batches_and_incidents(self):
+        """Snapshots en un executemany, incidents rattachés au bon snapshot"""
+        from services.bulk_import_service import BulkImportService
+        loc = {'code': '1', 'region': 'R', 'district': 'D', 'commune': 'C'}
+        rows = [
+            dict(loc, nom_materiel='PC 1', type_materiel='PC', etat='Fonctionnel', motif=None),
+            dict(loc, nom_materiel='PC 2', type_materiel='PC', etat='Non fonctionnel', motif='Ecran'),
+            dict(loc, nom_materiel=None, type_materiel='PC', etat=None, motif=None),
+        ]
+        cursor = MagicMock()
+        cursor.lastrowid = 10
+        cursor.fetchall.side_effect = [
+            [],  # localisation inconnue
+            [dict(loc, code_localisation=5)],
+            [],  # matériels inconnus
+            [
+                {'id_physique': 7, 'code_localisation_ref': 5, 'nom_materiel': 'PC 1', 'type': 'PC'},
+                {'id_physique': 8, 'code_localisation_ref': 5, 'nom_materiel': 'PC 2', 'type': 'PC'},
+            ],
+            [{'id_snapshot': 10}, {'id_snapshot': 11}],
+        ]
+
+        inserted = BulkImportService.import_rows(cursor, rows, id_date_import=3)
+
+        assert inserted == 2
+        executemany_params = [c.args[1] for c in cursor.executemany.call_args_list]
+        assert executemany_params[2] == [(7, 'Fonctionnel', 3), (8, 'Non fonctionnel', 3)]
+        assert executemany_params[3] == [('Ecran', None, None, 11, 3)]
+        flat = cursor.execute.call_args_list[-1]
+        assert 'INSERT INTO snapshot_flat' in flat.args[0]
+        assert flat.args[1] == (3, 10)
+
+    def test_unmatched_collation_key_falls_back_to_sql_equality(self):
+        """Une ligne relue sous une autre clé Python ('Æ' = 'AE' en SQL) est retrouvée ligne à ligne"""
+        from services.bulk_import_service import BulkImportService
+        rows = [{'code': '1', 'region': 'R', 'district': 'D', 'commune': 'Cæ',
+                 'nom_materiel': 'PC', 'type_materiel': 'PC'}]
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [
+            [],  # première lecture: aucune clé ne correspond
+            [{'code_localisation': 5, 'code': '1', 'region': 'R', 'district': 'D', 'commune': 'CAE'}],
+        ]
+        cursor.fetchone.return_value = {'id': 5}
+
+        loc_ids = BulkImportService._resolve_localisations(cursor, rows)
+
+        assert loc_ids == [5]
+        fallback = cursor.execute.call_args_list[-1]
+        assert 'commune = %s' in fallback.args[0]
+        assert 'LOCK IN SHARE MODE' in fallback.args[0]
+        assert fallback.args[1] == ('1', 'R', 'D', 'Cæ')
+
+class TestDimensionCache:
+    """Tests pour le cache des référentiels d'import"""
+
+    def test_cached_keys_skip_lookup_and_publish_after_commit(self):
+        """Les clés connues ne sont pas relues; les nouvelles ne sont partagées qu'après publish()"""
+        from services.bulk_import_service import BulkImportService, collation_key
+        from services.dimension_cache import DimensionCache
+        cache = DimensionCache(max_entries=100)
+        loc_key = tuple(collation_key(v) for v in ('1', 'R', 'D', 'C'))
+        cache.localisations.set(loc_key, 5)
+
+        rows = [{'code': '1', 'region': 'R', 'district': 'D', 'commune': 'C',
+                 'nom_materiel': 'PC 1', 'type_materiel': 'PC', 'etat': 'Fonctionnel', 'motif': None}]
+        cursor = MagicMock()
+        cursor.lastrowid = 10
+        cursor.fetchall.side_effect = [
+            [],  # matériel inconnu
+            [{'id_physique': 7, 'code_localisation_ref': 5, 'nom_materiel': 'PC 1', 'type': 'PC'}],
+        ]
+        session = cache.session()
+
+        BulkImportService.import_rows(cursor, rows, id_date_import=3, dimensions=session)
+
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        assert not any('FROM localisation' in q for q in queries)
+        assert session.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+        materiel_key = (5, collation_key('PC 1'), collation_key('PC'))
+        assert cache.materiels.get(materiel_key) is None
+
+        session.publish()
+        assert cache.materiels.get(materiel_key) == 7
+
+    @patch('services.dimension_cache.execute_query')
+    def test_preload_reloads_after_merge(self, mock_query):
+        """Une fusion faite par un autre processus (génération incrémentée) recharge le cache"""
+        from services.dimension_cache import DimensionCache
+        cache = DimensionCache(max_entries=100)
+        mock_query.side_effect = [{'generation': 1}, [], [], {'generation': 1}]
+        cache.preload()
+        cache.preload()
+        assert mock_query.call_count == 4
+        cache.materiels.set(('obsolete',), 9)
+
+        mock_query.side_effect = [{'generation': 2}, [], []]
+        cache.preload()
+        assert cache.materiels.get(('obsolete',)) is None
+        assert 'FROM materiel_physique' in mock_query.call_args.args[0]
+
+class TestDedupService:
+    """Tests pour la fusion des doublons des référentiels"""
+
+    def test_merge_reports_references_before_delete(self):
+        """Les références sont reportées sur la ligne conservée avant suppression"""
+        from services.dedup_service import DedupService
+        cursor = MagicMock()
+        cursor.rowcount = 2
+
+        with patch('services.dedup_service.Database.get_cursor') as mock_cursor:
+            mock_cursor.return_value.__enter__.return_value = cursor
+            result = DedupService.merge_duplicates()
+
+        queries = [c.args[0] for c in cursor.execute.call_args_list]
+        update_loc = next(i for i, q in enumerate(queries) if 'UPDATE materiel_physique r' in q)
+        delete_loc = next(i for i, q in enumerate(queries) if 'DELETE t FROM localisation' in q)
+        update_phys = next(i for i, q in enumerate(queries) if 'UPDATE materiel_informatique r' in q)
+        assert update_loc < delete_loc < update_phys
+        assert any('UPDATE snapshot_flat r' in q for q in queries[update_phys:])
+        # Disparitions reportées sans doublon de clé (id_physique, id_date_import)
+        report = next(i for i, q in enumerate(queries) if 'UPDATE IGNORE snapshot_disparu r' in q)
+        assert 'DELETE r FROM snapshot_disparu r' in queries[report + 1]
+        assert report > update_phys
+        assert report + 1 < next(i for i, q in enumerate(queries) if 'DELETE t FROM materiel_physique' in q)
+        assert 'HAVING COUNT(*) > 1' in queries[3]
+        assert 'INSERT INTO referentiel_generation' in queries[-1]
+        assert result['localisations_fusionnees'] == 2
+
+class TestImportJobService:
+    """Tests pour la file d'imports"""
+
+    @patch('services.import_job_service.execute_query')
+    def test_get_job_throughput(self, mock_query):
+        """Le débit est calculé à partir des lignes traitées et de la durée"""
+        from datetime import datetime
+        from services.import_job_service import ImportJobService
+        mock_query.return_value = {
+            'id_job': 'abc',
+            'lignes_traitees': 500,
+            'started_at': datetime(2024, 1, 1, 10, 0, 0),
+            'finished_at': datetime(2024, 1, 1, 10, 0, 10),
+        }
+
+        job = ImportJobService.get_job('abc')
+
+        assert job['lignes_par_seconde'] == 50.0
+
+    @patch('services.import_job_service.execute_query')
+    def test_get_job_unknown(self, mock_query):
+        """Un job inconnu retourne None"""
+        from services.import_job_service import ImportJobService
+        mock_query.return_value = None
+
+        assert ImportJobService.get_job('inconnu') is None
+
+    @patch('services.import_job_service.ExcelService.process_excel_file')
+    @patch('services.import_job_service.Database.get_cursor')
+    @patch('services.import_job_service.execute_query')
+    def test_run_skips_job_claimed_elsewhere(self, mock_query, mock_cursor, mock_process):
+        """Un import déjà réclamé par un autre worker n'est pas exécuté une seconde fois"""
+        from services.import_job_service import ImportJobService
+        mock_query.return_value = {'id_job': 'abc', 'statut': 'en_attente', 'file_path': 'x.xlsx'}
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.rowcount = 0
+
+        ImportJobService._run('abc')
+
+        claim = cursor.execute.call_args.args[0]
+        assert "WHERE id_job = %s AND statut = %s" in claim
+        mock_process.assert_not_called()
+
+    @patch('services.import_job_service.ImportJobService._executor')
+    @patch('services.import_job_service.Database.get_cursor')
+    @patch('services.import_job_service.execute_query')
+    def test_resume_pending_only_reclaims_stale_jobs(self, mock_query, mock_cursor, mock_executor):
+        """Seuls les imports sans battement récent ou d'un processus local arrêté sont remis en file"""
+        import os
+        import socket
+        from services.import_job_service import ImportJobService, IMPORT_HEARTBEAT_TIMEOUT
+        hote = socket.gethostname()
+        mock_query.side_effect = [
+            [{'id_job': 'perime', 'worker_id': 'autre:12'}],
+            [{'id_job': 'mort', 'worker_id': f"{hote}:999999999"},
+             {'id_job': 'vivant', 'worker_id': f"{hote}:{os.getppid()}"}],
+            [{'id_job': 'perime'}, {'id_job': 'mort'}],
+        ]
+        cursor = mock_cursor.return_value.__enter__.return_value
+        cursor.rowcount = 1
+
+        assert ImportJobService.resume_pending() == 2
+        perimes = mock_query.call_args_list[0]
+        assert 'heartbeat_at < NOW() - INTERVAL %s SECOND' in perimes.args[0]
+        assert perimes.args[1][1] == IMPORT_HEARTBEAT_TIMEOUT
+        remis = [c.args[1][1] for c in cursor.execute.call_args_list]
+        assert remis == ['perime', 'mort']
+        assert cursor.execute.call_args_list[1].args[1][3] == f"{hote}:999999999"
+
+    @patch('services.import_job_service.ImportJobService._executor')
+    @patch('services.import_job_service.ImportJobService.reclaim_stale', return_value=['a'])
+    def test_reaper_requeues_without_restart(self, mock_reclaim, mock_executor):
+        """La surveillance périodique relance les imports dont le worker ne bat plus"""
+        from services.import_job_service import ImportJobService
+        arret = MagicMock()
+        arret.wait.side_effect = [False, True]
+
+        with patch.object(ImportJobService, '_arret_surveillance', arret):
+            ImportJobService._reap()
+
+        mock_executor.submit.assert_called_once_with(ImportJobService._run, 'a')
+
+    @patch('services.import_job_service.ImportJobService._executor')
+    @patch('services.import_job_service.execute_query')
+    def test_submit_rejects_concurrent_duplicate(self, mock_query, mock_executor):
+        """La clé unique sur l'empreinte des imports actifs empêche un second job du même fichier"""
+        import mysql.connector
+        from services.import_job_service import ImportJobService
+        mock_query.side_effect = mysql.connector.IntegrityError(msg="Duplicate entry", errno=1062)
+
+        assert ImportJobService.submit('f.xlsx', 'f.xlsx', 1, 'abc') is None
+        mock_executor.submit.assert_not_called()
+
+    def test_upload_known_hash_short_circuits(self, tmp_path, monkeypatch):
+        """Un fichier déjà importé (même SHA-256) n'est pas replanifié, sauf avec force=true"""
+        import hashlib
+        from fastapi.testclient import TestClient
+        from main import app
+        from routes.auth import get_current_user
+
+        monkeypatch.chdir(tmp_path)
+        contenu = b"classeur excel"
+        empreinte = hashlib.sha256(contenu).hexdigest()
+        app.dependency_overrides[get_current_user] = lambda: {'user_id': 1}
+        try:
+            with patch('routes.upload.ImportJobService.find_duplicate',
+                       return_value={'id_date_import': 12}) as mock_find, \
+                 patch('routes.upload.ImportJobService.submit', return_value='job-1') as mock_submit:
+                client = TestClient(app)
+                fichier = {"file": ("import.xlsx", contenu)}
+
+                deja = client.post("/upload/excel", files=fichier)
+                force = client.post("/upload/excel?force=true", files=fichier)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert deja.status_code == 200
+        assert deja.json()['statut'] == 'deja_importe'
+        assert deja.json()['id_date_import'] == 12
+        mock_find.assert_called_once_with(empreinte)
+        assert force.status_code == 202
+        assert force.json()['id_job'] == 'job-1'
+        assert mock_submit.call_args.args[3] == empreinte
+        # Seul le fichier de l'import forcé reste sur disque
+        assert len(list((tmp_path / "uploads").iterdir())) == 1
+
+class TestResponseCache:
+    """Tests pour le cache des réponses"""
+
+    def test_lru_eviction(self):
+        """L'entrée la moins récemment utilisée est évincée"""
+        from utils.cache import LRUCache
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_etag_and_invalidation(self):
+        """ETag fort, 304 sur If-None-Match, recalcul après un nouvel import"""
+        from fastapi import FastAPI, Request
+        from fastapi.testclient import TestClient
+        from utils.cache import cached_response, bump_data_version
+
+        app = FastAPI()
+        calls = []
+
+        @app.get("/stats")
+        async def stats(request: Request):
+            async def compute():
+                calls.append(1)
+                return {"total": len(calls)}
+            return await cached_response(request, ("test-stats",), compute)
+
+        client = TestClient(app)
+        first = client.get("/stats")
+        etag = first.headers['etag']
+        assert first.json() == {"total": 1}
+        assert first.headers['cache-control'].startswith('private')
+
+        second = client.get("/stats", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert len(calls) == 1
+
+        bump_data_version()
+        third = client.get("/stats", headers={"If-None-Match": etag})
+        assert third.status_code == 200
+        assert third.json() == {"total": 2}
+
+    @patch('utils.cache.DATA_VERSION_CHECK_SECONDS', 0)
+    @patch('utils.cache.execute_query')
+    def test_version_shared_between_workers(self, mock_query):
+        """Un import terminé dans un autre worker (version en base incrémentée) invalide le cache local"""
+        from utils.cache import data_version, response_cache
+        mock_query.return_value = {'version': 41}
+        assert data_version() == 41
+        response_cache.set((41, 'dashboard'), (b'{}', '"etag"'))
+
+        mock_query.return_value = {'version': 42}
+        assert data_version() == 42
+        assert response_cache.get((41, 'dashboard')) is None
+        assert 'FROM donnees_version' in mock_query.call_args.args[0]
+
+class TestMaterielListing:
+    """Tests pour le moteur de listings paginés"""
+
+    @patch('services.materiel_service.execute_query')
+    def test_total_in_same_round_trip_then_cached(self, mock_query):
+        """Le total vient de COUNT(*) OVER() puis du cache pour les pages suivantes"""
+        from services.materiel_service import MaterielService
+        mock_query.side_effect = [
+            [{'total_count': 25, 'id_snapshot': 9}, {'total_count': 25, 'id_snapshot': 8}],
+            [{'id_snapshot': 7}],
+        ]
+
+        total, rows = MaterielService.list_snapshots("sf.id_date_import = %s", (1,), 0, 2, ("test", 1))
+        assert total == 25
+        assert rows == [{'id_snapshot': 9}, {'id_snapshot': 8}]
+        assert 'COUNT(*) OVER()' in mock_query.call_args_list[0].args[0]
+
+        total, rows = MaterielService.list_snapshots("sf.id_date_import = %s", (1,), 2, 2, ("test", 1))
+        assert total == 25
+        assert 'OVER()' not in mock_query.call_args_list[1].args[0]
+
+        # Page au-delà du total connu: aucune requête
+        total, rows = MaterielService.list_snapshots("sf.id_date_import = %s", (1,), 30, 2, ("test", 1))
+        assert rows == []
+        assert mock_query.call_count == 2
+
+    @patch('services.materiel_service.execute_query')
+    def test_keyset_page(self, mock_query):
+        """Avec un curseur, la page part du dernier id_snapshot vu, sans OFFSET"""
+        from services.materiel_service import MaterielService
+        from utils.helpers import decode_cursor
+        mock_query.side_effect = [
+            {'total': 40},
+            [{'id_snapshot': 19}, {'id_snapshot': 18}],
+        ]
+
+        total, rows = MaterielService.list_snapshots(
+            "sf.id_date_import = %s", (1,), 0, 2, ("keyset", 1), after_id=20
+        )
+
+        assert total == 40
+        page_query, page_params = mock_query.call_args_list[1].args[:2]
+        assert 'OFFSET' not in page_query
+        assert page_params == (1, 20, 2)
+        assert decode_cursor(MaterielService.next_cursor(rows, 2)) == {'id': 18}
+        assert MaterielService.next_cursor(rows, 3) is None
+
+    @patch('services.materiel_service.execute_query')
+    def test_derived_source(self, mock_query):
+        """Une source dérivée remplace snapshot_flat, ses paramètres avant ceux du filtre"""
+        from services.materiel_service import MaterielService
+        mock_query.side_effect = [{'total': 3}, []]
+
+        MaterielService.list_snapshots(
+            "sf.code = %s", ("630601",), 0, 2, ("derivee", "630601"), after_id=18,
+            source="FROM (derivee) sf", source_params=("630601",)
+        )
+
+        page_query, page_params = mock_query.call_args_list[1].args[:2]
+        assert 'FROM (derivee) sf' in page_query
+        assert 'ORDER BY sf.id_snapshot DESC' in page_query
+        assert page_params == ("630601", "630601", 18, 2)
+        assert mock_query.call_args_list[0].args[1] == ("630601", "630601")
+
+    @patch('services.materiel_service.execute_query', return_value=[])
+    def test_reads_flat_model_without_joins(self, mock_query):
+        """Les listings lisent snapshot_flat, limité aux importations terminées"""
+        from services.materiel_service import MaterielService
+
+        MaterielService.list_snapshots("sf.id_date_import = %s", (1,), 0, 2, ("flat", 1))
+        MaterielService.page_of_ids([5, 4], 0, 2)
+
+        for c in mock_query.call_args_list:
+            query = c.args[0]
+            assert 'FROM snapshot_flat sf' in query
+            assert 'JOIN' not in query
+            assert "statut = 'termine'" in query
 
 class TestPagination:
     """Tests pour la pagination"""
     
+    def test_cursor_roundtrip(self):
+        """Un curseur encodé se décode à l'identique"""
+        from utils.helpers import encode_cursor, decode_cursor
+        cursor = encode_cursor({'date': '2024-12-17T14:30:00', 'id': 15})
+        assert decode_cursor(cursor) == {'date': '2024-12-17T14:30:00', 'id': 15}
+    
+    def test_invalid_cursor(self):
+        """Un curseur invalide lève ValueError"""
+        from utils.helpers import decode_cursor
+        with pytest.raises(ValueError):
+            decode_cursor('pas-un-curseur!')
+    
     def test_pagination_first_page(self):
         """Test première page"""
         meta = paginate_query(100, 0, 10)
@@ -240,6 +1252,113 @@ class TestDatabaseOperations:
         assert result['id'] == 1
         mock_db_connection.cursor.assert_called_once()
 
+class TestConnectionPool:
+    """Tests pour le pool de connexions"""
+
+    def _make_pool(self, **kwargs):
+        from config.database import ConnectionPool
+        factory = Mock(side_effect=lambda: MagicMock(in_transaction=False))
+        return ConnectionPool(factory, **kwargs), factory
+
+    def test_connection_reused(self):
+        """Une connexion rendue est réutilisée au lieu d'en ouvrir une nouvelle"""
+        pool, factory = self._make_pool(size=2)
+
+        pool.acquire().close()
+        pool.acquire().close()
+
+        assert factory.call_count == 1
+        stats = pool.stats()
+        assert stats['checkouts'] == 2
+        assert stats['idle'] == 1
+        assert stats['in_use'] == 0
+
+    def test_checkout_timeout(self):
+        """Une erreur est levée quand le pool reste plein au-delà du délai"""
+        from mysql.connector.errors import PoolError
+        pool, _ = self._make_pool(size=1)
+
+        connection = pool.acquire()
+        with pytest.raises(PoolError):
+            pool.acquire(timeout=0.01)
+
+        connection.close()
+        assert pool.stats()['timeouts'] == 1
+
+    def test_stale_connection_recycled(self):
+        """Une connexion plus ancienne que `recycle` est remplacée"""
+        pool, factory = self._make_pool(size=1, recycle=0)
+
+        pool.acquire().close()
+        pool.acquire().close()
+
+        assert factory.call_count == 2
+        assert pool.stats()['recycled'] == 1
+
+    def test_open_transaction_rolled_back_on_release(self):
+        """Une transaction laissée ouverte est annulée au retour dans le pool"""
+        pool, _ = self._make_pool(size=1)
+
+        connection = pool.acquire()
+        raw = connection._entry.connection
+        raw.in_transaction = True
+        connection.close()
+
+        raw.rollback.assert_called_once()
+
+class TestMetrics:
+    """Tests pour les métriques Prometheus"""
+
+    def test_histogram_text_format(self):
+        """Les intervalles sont cumulés et suivis de _sum et _count"""
+        from utils.metrics import Histogram
+        histogram = Histogram("test_duree_seconds", "Durée de test", ("route",), buckets=(0.1, 1.0))
+
+        histogram.observe(0.05, route="/a")
+        histogram.observe(0.5, route="/a")
+        text = histogram.render()
+
+        assert '# TYPE test_duree_seconds histogram' in text
+        assert 'test_duree_seconds_bucket{route="/a",le="0.1"} 1' in text
+        assert 'test_duree_seconds_bucket{route="/a",le="1"} 2' in text
+        assert 'test_duree_seconds_bucket{route="/a",le="+Inf"} 2' in text
+        assert 'test_duree_seconds_count{route="/a"} 2' in text
+
+    def test_execute_query_records_name_and_rows(self):
+        """execute_query mesure la durée et les lignes sous le nom donné"""
+        from config import database
+        from utils.metrics import DB_QUERY_DURATION, DB_QUERY_ROWS
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [{'id': 1}, {'id': 2}]
+        before = DB_QUERY_ROWS.value(query="test_liste")
+
+        with patch.object(database.Database, 'get_cursor') as mock_cursor:
+            mock_cursor.return_value.__enter__.return_value = cursor
+            database.execute_query("SELECT id FROM t", fetch=True, name="test_liste")
+
+        assert DB_QUERY_ROWS.value(query="test_liste") == before + 2
+        assert DB_QUERY_DURATION.count(query="test_liste") >= 1
+
+    def test_multiprocess_render_merges_workers(self, tmp_path):
+        """Compteurs additionnés sur tous les workers, jauges des seuls workers vivants"""
+        import json
+        from utils.metrics import Counter, Gauge, Registry
+        registry = Registry()
+        lignes = registry.register(Counter("test_lignes_total", "Lignes", ("statut",)))
+        en_cours = registry.register(Gauge("test_en_cours", "En cours"))
+        lignes.inc(3, statut="ok")
+        en_cours.set(2)
+        # Worker arrêté: son compteur reste, sa jauge est ignorée
+        (tmp_path / "999999999.json").write_text(json.dumps({
+            "test_lignes_total": [[["ok"], 4]], "test_en_cours": [[[], 5]]
+        }))
+
+        with patch('utils.metrics._pid_alive', side_effect=lambda pid: pid != 999999999):
+            text = registry.render(str(tmp_path))
+
+        assert 'test_lignes_total{statut="ok"} 7' in text
+        assert 'test_en_cours 2' in text
+
 # Configuration pytest
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+Cache en mémoire des réponses calculées à partir des importations
+
+Les données d'une importation ne changent plus une fois l'upload terminé: les
+réponses sont mises en cache par endpoint et paramètres, et invalidées par un
+compteur de version incrémenté à chaque nouvel import ou suppression.
+
+Le compteur est stocké en base (table donnees_version) et partagé par tous les
+workers: chaque processus le relit au plus toutes les DATA_VERSION_CHECK_SECONDS
+et vide ses caches locaux quand il a changé.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from config.database import execute_query, run_in_db_executor
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
+# Délai maximal avant qu'un worker voie la version incrémentée par un autre (0: à chaque requête)
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "1"))
+
+# Réponses liées à une importation précise / à la dernière importation
+CACHE_CONTROL_IMPORT = "private, max-age=300"
+CACHE_CONTROL_LATEST = "private, no-cache"
+
+
+class LRUCache:
+    """Dictionnaire borné avec éviction du moins récemment utilisé"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+response_cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+# Totaux des listings paginés, par filtre et importation
+total_cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+# Différences entre deux importations (listes d'identifiants), par paire
+diff_cache = LRUCache(int(os.getenv("DIFF_CACHE_SIZE", "32")))
+
+_data_version = 0
+_version_checked_at = None
+_version_lock = threading.Lock()
+
+
+def _set_version(version: int):
+    """Adopte la version lue en base, en vidant les caches locaux si elle a changé"""
+    global _data_version, _version_checked_at
+    with _version_lock:
+        if version != _data_version:
+            response_cache.clear()
+            total_cache.clear()
+            diff_cache.clear()
+            _data_version = version
+        _version_checked_at = time.monotonic()
+
+
+def _version_fresh() -> bool:
+    checked = _version_checked_at
+    return checked is not None and time.monotonic() - checked < DATA_VERSION_CHECK_SECONDS
+
+
+def data_version() -> int:
+    """Version courante des données importées (partagée par les workers)"""
+    if _version_fresh():
+        return _data_version
+    try:
+        row = execute_query(
+            "SELECT version FROM donnees_version WHERE id = 1",
+            fetchone=True, name="cache_version"
+        )
+        _set_version(row['version'] if row else 0)
+    except Exception as e:
+        print(f"Erreur lors de la lecture de la version des données: {e}")
+        _set_version(_data_version)
+    return _data_version
+
+
+INCREMENT_VERSION = """
+    INSERT INTO donnees_version (id, version) VALUES (1, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1
+"""
+
+
+def bump_data_version(cursor=None) -> int:
+    """
+    Invalide les caches de tous les workers après un import ou une suppression
+    d'importation. Avec `cursor`, l'incrément fait partie de la transaction de
+    l'appelant (validé avec la modification des données, version lue ensuite).
+    """
+    global _version_checked_at
+    if cursor is not None:
+        cursor.execute(INCREMENT_VERSION)
+    else:
+        try:
+            execute_query(INCREMENT_VERSION, name="cache_version_increment")
+        except Exception as e:
+            print(f"Erreur lors de l'incrément de la version des données: {e}")
+    # Version relue à la prochaine requête de ce worker
+    with _version_lock:
+        _version_checked_at = None
+        response_cache.clear()
+        total_cache.clear()
+        diff_cache.clear()
+    return _data_version if cursor is not None else data_version()
+
+
+def make_etag(body: bytes) -> str:
+    """ETag fort calculé sur le contenu de la réponse"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+async def cached_response(
+    request: Request,
+    key: tuple,
+    compute: Callable[[], Awaitable[Any]],
+    cache_control: str = CACHE_CONTROL_IMPORT
+) -> Response:
+    """
+    Retourne la réponse JSON en cache pour `key`, ou l'obtient avec `compute()`.
+    Gère ETag / If-None-Match (304) et l'en-tête Cache-Control.
+    """
+    version = data_version() if _version_fresh() else await run_in_db_executor(data_version)
+    full_key = (version,) + tuple(key)
+    entry = response_cache.get(full_key)
+
+    if entry is None:
+        payload = jsonable_encoder(await compute())
+        body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        entry = (body, make_etag(body))
+        response_cache.set(full_key, entry)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
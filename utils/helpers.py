@@ -41,6 +41,20 @@ def clean_string(value: str) -> Optional[str]:
     cleaned = str(value).strip()
     return cleaned if cleaned else None
 
+# Variantes saisies dans les fichiers Excel (en minuscules) -> état normalisé
+ETAT_MAPPING = {
+    'fonctionnel': 'Fonctionnel',
+    'fonctionelle': 'Fonctionnel',
+    'fonctionne': 'Fonctionnel',
+    'ok': 'Fonctionnel',
+    'non fonctionnel': 'Non fonctionnel',
+    'non fonctionelle': 'Non fonctionnel',
+    'en panne': 'Non fonctionnel',
+    'panne': 'Non fonctionnel',
+    'hs': 'Non fonctionnel',
+    'hors service': 'Non fonctionnel'
+}
+
 def normalize_etat(etat: str) -> Optional[str]:
     """Normalise les états des matériels"""
     if not etat:
@@ -48,21 +62,7 @@ def normalize_etat(etat: str) -> Optional[str]:
     
     etat_lower = etat.lower().strip()
     
-    # Mapping des variations
-    etat_mapping = {
-        'fonctionnel': 'Fonctionnel',
-        'fonctionelle': 'Fonctionnel',
-        'fonctionne': 'Fonctionnel',
-        'ok': 'Fonctionnel',
-        'non fonctionnel': 'Non fonctionnel',
-        'non fonctionelle': 'Non fonctionnel',
-        'en panne': 'Non fonctionnel',
-        'panne': 'Non fonctionnel',
-        'hs': 'Non fonctionnel',
-        'hors service': 'Non fonctionnel'
-    }
-    
-    return etat_mapping.get(etat_lower, etat)
+    return ETAT_MAPPING.get(etat_lower, etat)
 
 def ensure_directory_exists(directory_path: str):
     """Crée un répertoire s'il n'existe pas"""
@@ -106,6 +106,27 @@ def paginate_query(total: int, skip: int, limit: int) -> Dict[str, Any]:
         "has_previous": has_previous
     }
 
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Encode la position d'une page dans un curseur opaque"""
+    import base64
+    import json
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Décode un curseur opaque (ValueError s'il est invalide)"""
+    import base64
+    import binascii
+    import json
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError(f"Curseur invalide: {cursor}") from e
+    if not isinstance(values, dict):
+        raise ValueError(f"Curseur invalide: {cursor}")
+    return values
+
 def sanitize_filename(filename: str) -> str:
     """Nettoie un nom de fichier"""
     import re
@@ -0,0 +1,381 @@
+"""
+Métriques de l'API au format texte Prometheus
+
+Compteurs, jauges et histogrammes en mémoire (par processus), exposés par
+l'endpoint /metrics: latence des routes, requêtes en cours, durée et lignes
+des requêtes SQL par nom, attente du pool de connexions et débit des imports.
+
+Avec plusieurs workers (gunicorn --workers N), METRICS_MULTIPROC_DIR active le
+mode multiprocessus: chaque worker écrit ses valeurs dans <dossier>/<pid>.json
+(toutes les METRICS_FLUSH_SECONDS et avant chaque rendu), et /metrics additionne
+les fichiers de tous les workers, quel que soit celui qui répond.
+"""
+
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# Dossier partagé par les workers (vide au démarrage du serveur); non défini: un seul processus
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+# Bornes par défaut des histogrammes (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Durée d'un import complet (secondes)
+IMPORT_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base commune: nom, aide, noms d'étiquettes et verrou"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, values=None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(values))
+        return "\n".join(lines)
+
+    def _samples(self, values=None):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Valeur cumulée, uniquement croissante"""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+    def merge(self, dumps: List[Tuple[list, bool]]) -> Dict[Tuple, float]:
+        """Additionne les valeurs écrites par les workers (vivants ou non)"""
+        values: Dict[Tuple, float] = {}
+        for dump, _vivant in dumps:
+            for key, value in dump:
+                key = tuple(key)
+                values[key] = values.get(key, 0.0) + value
+        return values
+
+    def _samples(self, values=None):
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(values.items())]
+
+
+class Gauge(Counter):
+    """
+    Valeur instantanée, pouvant monter et descendre. En mode multiprocessus,
+    seuls les workers vivants comptent: somme (`multiprocess_mode="sum"`) ou
+    maximum ("max") de leurs valeurs.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode="sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def merge(self, dumps):
+        values: Dict[Tuple, float] = {}
+        for dump, vivant in dumps:
+            if not vivant:
+                continue
+            for key, value in dump:
+                key = tuple(key)
+                if key not in values:
+                    values[key] = value
+                elif self.multiprocess_mode == "max":
+                    values[key] = max(values[key], value)
+                else:
+                    values[key] += value
+        return values
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """Répartition d'observations par intervalles cumulés, avec somme et nombre"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # clé -> [compte par intervalle..., somme, nombre]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe la durée du bloc"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            data = self._values.get(self._key(labels))
+            return data[-1] if data else 0
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self._values.items()]
+
+    def merge(self, dumps):
+        values: Dict[Tuple, list] = {}
+        for dump, _vivant in dumps:
+            for key, data in dump:
+                key = tuple(key)
+                if len(data) != len(self.buckets) + 2:
+                    continue
+                if key not in values:
+                    values[key] = list(data)
+                else:
+                    values[key] = [a + b for a, b in zip(values[key], data)]
+        return values
+
+    def _samples(self, values=None):
+        if values is None:
+            with self._lock:
+                values = {k: list(v) for k, v in self._values.items()}
+        items = sorted(values.items())
+        lines = []
+        for key, data in items:
+            for bound, count in zip(self.buckets, data):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(data[-2])}")
+            lines.append(f"{self.name}_count{labels} {data[-1]}")
+        return lines
+
+
+class Registry:
+    """Ensemble des métriques exposées"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Fonction appelée avant chaque rendu (mise à jour de jauges)"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self, multiproc_dir: str = None) -> str:
+        """
+        Texte Prometheus des métriques de ce processus, ou de tous les workers
+        ayant écrit dans `multiproc_dir` (METRICS_MULTIPROC_DIR par défaut)
+        """
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Erreur lors de la collecte des métriques: {e}")
+
+        multiproc_dir = METRICS_MULTIPROC_DIR if multiproc_dir is None else multiproc_dir
+        if not multiproc_dir:
+            return "\n".join(metric.render() for metric in metrics) + "\n"
+
+        self.flush(multiproc_dir)
+        dumps = _read_dumps(multiproc_dir)
+        return "\n".join(
+            metric.render(metric.merge([(d.get(metric.name, []), vivant) for d, vivant in dumps]))
+            for metric in metrics
+        ) + "\n"
+
+    def flush(self, multiproc_dir: str = None):
+        """Écrit les valeurs de ce processus dans <dossier>/<pid>.json (remplacement atomique)"""
+        multiproc_dir = multiproc_dir or METRICS_MULTIPROC_DIR
+        if not multiproc_dir:
+            return
+        with self._lock:
+            metrics = list(self._metrics)
+        contenu = {metric.name: metric.dump() for metric in metrics}
+        chemin = os.path.join(multiproc_dir, f"{os.getpid()}.json")
+        temporaire = f"{chemin}.tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(contenu, f)
+        os.replace(temporaire, chemin)
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_dumps(multiproc_dir: str) -> list:
+    """Valeurs écrites par chaque worker, avec l'indication qu'il est toujours en vie"""
+    dumps = []
+    for chemin in glob.glob(os.path.join(multiproc_dir, "*.json")):
+        try:
+            pid = int(os.path.basename(chemin)[:-len(".json")])
+            with open(chemin, encoding="utf-8") as f:
+                dumps.append((json.load(f), _pid_alive(pid)))
+        except (ValueError, OSError) as e:
+            print(f"Métriques illisibles ({chemin}): {e}")
+    return dumps
+
+
+registry = Registry()
+
+# Requêtes HTTP
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP par route",
+    ("method", "route", "status")
+))
+HTTP_REQUESTS_IN_PROGRESS = registry.register(Gauge(
+    "http_requests_in_progress", "Requêtes HTTP en cours de traitement"
+))
+
+# Base de données
+DB_QUERY_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds", "Durée des requêtes SQL par nom (connexion comprise)",
+    ("query",)
+))
+DB_QUERY_ROWS = registry.register(Counter(
+    "db_query_rows_total", "Lignes lues ou écrites par les requêtes SQL, par nom",
+    ("query",)
+))
+DB_QUERY_ERRORS = registry.register(Counter(
+    "db_query_errors_total", "Requêtes SQL en erreur, par nom",
+    ("query",)
+))
+DB_POOL_WAIT = registry.register(Histogram(
+    "db_pool_wait_seconds", "Attente d'une connexion du pool"
+))
+DB_CONNECT_DURATION = registry.register(Histogram(
+    "db_connect_duration_seconds", "Durée d'ouverture d'une connexion MySQL"
+))
+DB_POOL_CONNECTIONS = registry.register(Gauge(
+    "db_pool_connections", "Connexions du pool par état", ("state",)
+))
+
+# Imports Excel
+IMPORT_ROWS = registry.register(Counter(
+    "import_rows_total", "Lignes importées depuis les fichiers Excel"
+))
+IMPORT_BYTES = registry.register(Counter(
+    "import_bytes_total", "Octets de fichiers Excel importés"
+))
+IMPORT_JOBS = registry.register(Counter(
+    "import_jobs_total", "Imports terminés par statut", ("statut",)
+))
+IMPORT_DURATION = registry.register(Histogram(
+    "import_duration_seconds", "Durée des imports Excel", buckets=IMPORT_BUCKETS
+))
+IMPORT_DIMENSION_LOOKUPS = registry.register(Counter(
+    "import_dimension_cache_lookups_total", "Recherches de référentiels dans le cache d'import", ("result",)
+))
+IMPORT_ROWS_PER_SECOND = registry.register(Gauge(
+    "import_rows_per_second", "Débit du dernier import terminé (lignes par seconde)",
+    multiprocess_mode="max"
+))
+
+_flush_thread = None
+
+
+def render_metrics() -> str:
+    """Texte Prometheus de toutes les métriques"""
+    return registry.render()
+
+
+def start_metrics_flush():
+    """Mode multiprocessus: écrit périodiquement les métriques de ce worker"""
+    global _flush_thread
+    if not METRICS_MULTIPROC_DIR or _flush_thread is not None:
+        return
+
+    def boucle():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                registry.flush()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des métriques: {e}")
+
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    _flush_thread = threading.Thread(target=boucle, name="metriques", daemon=True)
+    _flush_thread.start()